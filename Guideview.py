@@ -1,29 +1,194 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, colorchooser
-import re
-import uu
+import argparse
+import functools
 import io
-from PIL import Image, ImageTk
-import pygame
+import itertools
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from guideparser import uudecode, TEXT, STYLE, LINK, BINARY, IMAGE_EXTENSIONS, AUDIO_EXTENSIONS
+from guidecache import LRUCache, GuideDatabase, remove_file
+from guidesearch import SearchIndex, WORD_RE, count_words
+from guideprofile import Profiler
 
 # Guideview by Zeittresor
 # Requirements: Make sure you have installed PIL using "pip install Pillow" as long with PyGame using "pip install pygame".
 
+# PIL and pygame take longer to import than the rest of the viewer takes to start, so they are
+# imported by load_imaging() and load_pygame() once a guide actually contains images or audio
+Image = None
+ImageTk = None
+pygame = None
+
+# Memory budget for parsed nodes kept for back/forward navigation and repeat visits
+NODE_CACHE_BYTES = 64 * 1024 * 1024
+# Memory budget for guide files kept open for links between guides and repeat visits
+OPEN_GUIDES_BYTES = 256 * 1024 * 1024
+# Worker threads decoding embedded images and audio, and how often the UI collects their results
+DECODE_WORKERS = 4
+DECODE_POLL_MS = 30
+
+# Long nodes are inserted in chunks of about this many characters; the next chunk is added
+# once the visible part of the text reaches RENDER_AHEAD of what has been inserted so far
+RENDER_CHUNK_CHARS = 20000
+RENDER_AHEAD = 0.8
+# Once more than this many characters of a node are in the text widget, the chunks scrolled
+# out of view above are dropped for a line that shows the node from its start again
+RENDER_KEEP_CHARS = 25 * RENDER_CHUNK_CHARS
+# Nodes read and tokenized for the search index per job in the worker pool, and the number of
+# such jobs queued at a time
+SEARCH_INDEX_BATCH = 50
+SEARCH_INDEX_JOBS = 2
+# Nodes reachable from the current page that are parsed ahead of a click, and the share of
+# the node cache they may take up
+PREFETCH_NODES = 8
+PREFETCH_CACHE_SHARE = 0.25
+# Embedded images are shown at most this large, and no wider than the text widget
+THUMBNAIL_SIZE = (1600, 1600)
+# Images are shown scaled to the width of the text widget minus IMAGE_MARGIN, rounded down to a
+# multiple of IMAGE_WIDTH_STEP so that small resizes reuse the scaled images already cached
+IMAGE_MARGIN = 24
+IMAGE_WIDTH_STEP = 32
+# Memory budget for scaled images, per node, embedded block and width
+IMAGE_CACHE_BYTES = 64 * 1024 * 1024
+# Images are scaled to a new width once the window has not been resized for this long
+RESIZE_DEBOUNCE_MS = 250
+# How often the statistics window of --profile is refreshed
+STATS_REFRESH_MS = 1000
+# How often the file of the current guide is checked for changes while watching it
+WATCH_POLL_MS = 1000
+# Guides without an index in the disk cache are scanned in a worker thread in batches of up to
+# this many bytes; the first batches are smaller so that MAIN can be shown right away
+SCAN_BATCH_BYTES = 4 * 1024 * 1024
+SCAN_FIRST_BATCH_BYTES = 256 * 1024
+# How often the nodes scanned so far are taken over by the Tk thread
+LOAD_POLL_MS = 50
+
+class ParsedNode:
+    """Token list of a node together with the payloads decoded while rendering it."""
+
+    def __init__(self, source, name, tokens):
+        self.source = source  # OpenGuide the node belongs to
+        self.name = name
+        self.key = (source.key, name)  # Key in the node cache, unique across guide files
+        self.tokens = tokens
+        self.payloads = {}  # Token index -> decoded audio file or bytes, or None if decoding failed
+        self.pending = set()  # (token index, image width or None) being decoded in the background
+
+    def size(self):
+        """Estimates the memory held by this node in bytes."""
+        size = 0
+        for token in self.tokens:
+            size += sum(len(part) for part in token[1:] if isinstance(part, str))
+        for payload in self.payloads.values():
+            if payload is not None:
+                size += len(payload)
+        return size
+
+    def label(self):
+        """Returns "file.guide/NODE", as used in the profiling statistics."""
+        return f"{os.path.basename(self.source.file_path)}/{self.name}"
+
+    def move_to(self, source):
+        """Moves the node to the reloaded OpenGuide of its file, in which it is unchanged.
+
+        Returns the old and new paths of the audio files it streams from the on-disk cache.
+        """
+        moved = {}
+        self.source = source
+        self.key = (source.key, self.name)
+        for index, payload in list(self.payloads.items()):
+            if isinstance(payload, str):
+                path = source.disk_cache.media_path(self.name, index, os.path.splitext(payload)[1])
+                if os.path.exists(path):
+                    self.payloads[index] = moved[payload] = path
+                else:
+                    del self.payloads[index]  # Decoded again when needed
+        return moved
+
+def load_imaging():
+    """Imports PIL on first use."""
+    global Image, ImageTk
+    if ImageTk is None:
+        from PIL import Image, ImageTk
+
+def load_pygame():
+    """Imports pygame on first use."""
+    global pygame
+    if pygame is None:
+        import pygame
+
+def fit_image(image, box):
+    """Returns an opened image scaled down to fit into box, decoding no more pixels than needed.
+
+    JPEGs are decoded at 1/2 to 1/8 of their size in draft mode, other formats are shrunk with
+    reduce() before the final resampling.
+    """
+    scale = min(box[0] / image.width, box[1] / image.height)
+    if scale >= 1:
+        image.load()
+        return image
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    image.draft(None, size)
+    return image.resize(size, Image.BICUBIC, reducing_gap=2.0)
+
 class AmigaGuideViewer:
-    def __init__(self, root):
+    def __init__(self, root, node_cache_bytes=NODE_CACHE_BYTES, open_guides_bytes=OPEN_GUIDES_BYTES, profiler=None, watch=False):
         self.root = root
         self.root.title("AmigaGuide Viewer")
+        self.profiler = profiler  # Profiler when started with --profile, otherwise None
+        self.stats_window = None
+        self.guides = GuideDatabase(open_guides_bytes)  # Guide files opened in this session
+        self.current_guide = None  # OpenGuide of the file being shown
+        self.guide = None  # GuideIndex of the current guide
+        self.disk_cache = None  # GuideDiskCache of the current guide
+        self.link_graph = None  # LinkGraph of the current guide
         self.nodes = {}
+        self.node_cache = LRUCache(node_cache_bytes)  # ParsedNode.key -> ParsedNode
         self.current_node = None
-        self.history = []
+        self.current_parsed = None  # ParsedNode shown in the text widget
+        self.history = []  # (guide file path, node name) of the visited nodes
         self.history_index = -1
         self.language = 'en'  # Default language is English
         self.center_text = False  # Whether to center the text
-        self.images = []  # Keep references to images to prevent garbage collection
+        self.images = {}  # Token index -> image shown on the page, keeps it from being garbage collected
+        self.image_cache = LRUCache(IMAGE_CACHE_BYTES)  # (ParsedNode.key, token index, width) -> PhotoImage
+        self.resize_id = None
+        self.link_targets = []  # Targets of the links on the current page, by link number
+        self.render_index = 0  # Next token of the current node to be inserted
+        self.render_offset = 0  # Characters of that token inserted already, when a long text run was split
+        self.render_stack = []  # Style tags active at render_index
+        self.render_chunks = []  # (mark at its start, characters) of the chunks in the text widget
+        self.render_chunk_id = 0  # Numbers the marks of the chunks
+        self.render_scheduled = False
+        self.search_index = None  # SearchIndex of the opened guide, filled in the background
+        self.search_pending = None  # Iterator over the nodes still to be indexed
+        self.search_jobs = {}  # Future tokenizing nodes in the worker pool -> names of its nodes
+        self.search_window = None
         self.audio_playing = False
+        self.audio_source = None  # File or bytes of the track being played
+        self.mixer_ready = False
+        self.watch_file = watch  # Whether the guide is reloaded when its file changes
+        self.watch_var = tk.BooleanVar(value=watch)
+        self.watch_id = None
+        self.loading = None  # OpenGuide being scanned in the background
+        self.load_cancel = None  # Event telling the scan to stop
+        self.load_queue = queue.Queue()  # Batches of nodes from the scan or the disk cache
+        self.load_future = None
+        self.load_poll_id = None
+        self.load_started = 0.0
+        self.wanted_node = None  # (node name, add to history, or else the first node) shown once it is scanned
 
-        # Initialize pygame mixer for audio playback
-        pygame.mixer.init()
+        # Embedded binaries are decoded off the Tk thread; results are handed back through a queue
+        self.decoder = ThreadPoolExecutor(max_workers=DECODE_WORKERS)
+        self.done_queue = queue.Queue()
+        self.background_jobs = 0
+        self.poll_id = None
+        self.prefetch_futures = []  # Queued prefetch jobs, cancelled when the page changes
+        self.prefetch_bytes = 0
 
         # Create the menu
         self.create_menu()
@@ -35,9 +200,19 @@ class AmigaGuideViewer:
         # Text widget with scrollbar
         self.text = tk.Text(main_frame, wrap=tk.WORD, font=("Arial", 12))
         self.text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar = tk.Scrollbar(main_frame, command=self.text.yview)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.text.config(yscrollcommand=scrollbar.set)
+        self.scrollbar = tk.Scrollbar(main_frame, command=self.text.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.text.config(yscrollcommand=self.on_text_scroll)
+        self.text.bind('<Configure>', self.on_text_configure)
+        self.image_width = self.display_image_width()
+
+        # Links are tagged text instead of embedded buttons, one binding serves all of them
+        self.text.tag_configure('link', foreground="blue", underline=True, background="#e8e8e8", relief=tk.RAISED, borderwidth=1)
+        self.text.tag_configure('dangling', foreground="gray", overstrike=True)
+        self.text.tag_bind('link', '<Button-1>', self.on_link_click)
+        self.text.tag_bind('link', '<Enter>', lambda e: self.text.config(cursor="hand2"))
+        self.text.tag_bind('link', '<Leave>', lambda e: self.text.config(cursor=""))
+        self.text.tag_bind('dropped', '<Button-1>', self.render_from_start)
 
         # Navigation bar
         nav_frame = tk.Frame(root)
@@ -49,7 +224,23 @@ class AmigaGuideViewer:
         self.forward_button = tk.Button(nav_frame, text=self.get_label('Forward'), command=self.go_forward)
         self.forward_button.pack(side=tk.LEFT)
 
+        # Contents and browse buttons, following @toc/@prev/@next or the order of the nodes
+        self.next_button = tk.Button(nav_frame, text=self.get_label('Next'), command=lambda: self.go_related('next'))
+        self.next_button.pack(side=tk.RIGHT)
+        self.prev_button = tk.Button(nav_frame, text=self.get_label('Previous'), command=lambda: self.go_related('prev'))
+        self.prev_button.pack(side=tk.RIGHT)
+        self.contents_button = tk.Button(nav_frame, text=self.get_label('Contents'), command=lambda: self.go_related('toc'))
+        self.contents_button.pack(side=tk.RIGHT)
+
+        # Progress of loading a guide in the background, packed only while it lasts
+        self.progress_label = tk.Label(nav_frame)
+        self.cancel_button = tk.Button(nav_frame, text=self.get_label('Cancel'), command=self.cancel_loading)
+
+        self.root.bind('<Control-f>', lambda e: self.open_search())
+
         self.update_nav_buttons()
+        if self.watch_file:
+            self.start_watching()
 
     def create_menu(self):
         """Creates the menu bar and menus."""
@@ -58,6 +249,9 @@ class AmigaGuideViewer:
         # File menu
         self.file_menu = tk.Menu(menubar, tearoff=0)
         self.file_menu.add_command(label=self.get_label('Open File'), command=self.open_file)
+        self.file_menu.add_command(label=self.get_label('Find in Guide'), command=self.open_search, accelerator="Ctrl+F")
+        if self.profiler:
+            self.file_menu.add_command(label=self.get_label('Statistics'), command=self.open_stats_window)
         menubar.add_cascade(label=self.get_label('File'), menu=self.file_menu)
 
         # Options menu
@@ -70,6 +264,7 @@ class AmigaGuideViewer:
         self.language_menu.add_command(label='Français', command=lambda: self.change_language('fr'))
         self.options_menu.add_cascade(label=self.get_label('Language'), menu=self.language_menu)
         self.options_menu.add_checkbutton(label=self.get_label('Center Text'), command=self.toggle_center_text)
+        self.options_menu.add_checkbutton(label=self.get_label('Watch File'), variable=self.watch_var, command=self.toggle_watch)
         menubar.add_cascade(label=self.get_label('Options'), menu=self.options_menu)
 
         self.root.config(menu=menubar)
@@ -94,6 +289,18 @@ class AmigaGuideViewer:
                 'Node not found.': "Node not found.",
                 'Open AmigaGuide File': 'Open AmigaGuide File',
                 'Choose Background Color': 'Choose Background Color',
+                'Find in Guide': 'Find in Guide',
+                'Search': 'Search',
+                'Results': 'Results',
+                'Indexing': 'Indexing',
+                'Contents': 'Contents',
+                'Previous': 'Previous',
+                'Next': 'Next',
+                'Statistics': 'Statistics',
+                'Watch File': 'Watch File',
+                'Loading': 'Loading',
+                'Cancel': 'Cancel',
+                'Show the start of the node': 'Show the start of the node',
             },
             'de': {
                 'File': 'Datei',
@@ -112,6 +319,18 @@ class AmigaGuideViewer:
                 'Node not found.': "Knoten nicht gefunden.",
                 'Open AmigaGuide File': 'AmigaGuide-Datei öffnen',
                 'Choose Background Color': 'Hintergrundfarbe wählen',
+                'Find in Guide': 'Im Guide suchen',
+                'Search': 'Suchen',
+                'Results': 'Treffer',
+                'Indexing': 'Indizierung',
+                'Contents': 'Inhalt',
+                'Previous': 'Vorherige',
+                'Next': 'Nächste',
+                'Statistics': 'Statistik',
+                'Watch File': 'Datei überwachen',
+                'Loading': 'Lade',
+                'Cancel': 'Abbrechen',
+                'Show the start of the node': 'Anfang des Knotens anzeigen',
             },
             'fr': {
                 'File': 'Fichier',
@@ -130,6 +349,18 @@ class AmigaGuideViewer:
                 'Node not found.': "Nœud non trouvé.",
                 'Open AmigaGuide File': 'Ouvrir le fichier AmigaGuide',
                 'Choose Background Color': 'Choisir la couleur de fond',
+                'Find in Guide': 'Rechercher dans le guide',
+                'Search': 'Rechercher',
+                'Results': 'Résultats',
+                'Indexing': 'Indexation',
+                'Contents': 'Sommaire',
+                'Previous': 'Page précédente',
+                'Next': 'Page suivante',
+                'Statistics': 'Statistiques',
+                'Watch File': 'Surveiller le fichier',
+                'Loading': 'Chargement',
+                'Cancel': 'Annuler',
+                'Show the start of the node': 'Afficher le début du nœud',
             }
         }
         return labels[self.language].get(text, text)
@@ -138,17 +369,24 @@ class AmigaGuideViewer:
         """Opens a file dialog and loads the selected AmigaGuide file."""
         file_path = filedialog.askopenfilename(
             title=self.get_label("Open AmigaGuide File"),
-            filetypes=[("AmigaGuide Files", "*.guide"), ("All Files", "*.*")]
+            filetypes=[("AmigaGuide Files", "*.guide *.guide.gz *.guide.xz"), ("Guide Packs", "*.guidepack"),
+                       ("Zip Archives", "*.zip"), ("All Files", "*.*")]
         )
         if file_path:
-            self.load_amiga_guide(file_path)
-            if "MAIN" in self.nodes:
-                self.show_node("MAIN", add_to_history=True)
-            elif self.nodes:
-                first_node = list(self.nodes.keys())[0]
-                self.show_node(first_node, add_to_history=True)
-            else:
-                messagebox.showwarning(self.get_label("Warning"), self.get_label("No valid nodes found in the file."))
+            self.open_guide(file_path)
+
+    def open_guide(self, file_path):
+        """Loads an AmigaGuide file and shows its MAIN node, or its first node without one."""
+        self.load_amiga_guide(file_path)
+        if "MAIN" in self.nodes:
+            self.show_node("MAIN", add_to_history=True)
+        elif self.loading is not None:
+            # Shown as soon as the scan has found MAIN, or the first node once it is done without one
+            self.wanted_node = ("MAIN", True, True)
+        elif self.nodes:
+            self.show_node(next(iter(self.nodes)), add_to_history=True)
+        else:
+            messagebox.showwarning(self.get_label("Warning"), self.get_label("No valid nodes found in the file."))
 
     def change_background_color(self):
         """Opens a color chooser to change the background color."""
@@ -167,6 +405,10 @@ class AmigaGuideViewer:
         # Update navigation buttons
         self.back_button.config(text=self.get_label('Back'))
         self.forward_button.config(text=self.get_label('Forward'))
+        self.contents_button.config(text=self.get_label('Contents'))
+        self.prev_button.config(text=self.get_label('Previous'))
+        self.next_button.config(text=self.get_label('Next'))
+        self.cancel_button.config(text=self.get_label('Cancel'))
 
         # Update centering if needed
         if self.center_text:
@@ -186,188 +428,628 @@ class AmigaGuideViewer:
             self.text.tag_remove('center', '1.0', 'end')
 
     def load_amiga_guide(self, file_path):
-        """Parses the AmigaGuide file and stores nodes in a dictionary."""
-        self.nodes.clear()
+        """Opens the AmigaGuide file with a fresh history; node bodies are read when they are shown."""
         self.history = []
         self.history_index = -1
         self.stop_audio()  # Stop any playing audio
-        try:
-            # Open the file with the correct encoding
-            with open(file_path, "r", encoding='latin-1') as file:
-                content = file.read()
+        if self.switch_guide(file_path) and not self.nodes and self.loading is None:
+            messagebox.showwarning(self.get_label("Warning"), self.get_label("No valid nodes found in the file."))
 
-            # Regex for nodes
-            nodes = re.findall(r'@node\s+"(.*?)"\s+"(.*?)"(.*?)@endnode', content, re.DOTALL | re.IGNORECASE)
-            for name, title, text in nodes:
-                self.nodes[name.upper()] = text.strip()
-
-            if not self.nodes:
-                messagebox.showwarning(self.get_label("Warning"), self.get_label("No valid nodes found in the file."))
-            else:
-                print(f"Found nodes: {', '.join(self.nodes.keys())}")
+    def switch_guide(self, file_path):
+        """Makes a guide file the current one, opening it unless it is still open from earlier.
 
+        Only the node headers are scanned when a file is opened, the file itself stays memory-mapped.
+        The scan runs in the background and nodes can be shown as soon as they have been found.
+        An unchanged file that was opened in an earlier session is not even scanned, its index is
+        read from the disk cache in the background instead.
+        """
+        start = time.perf_counter()
+        current = self.current_guide
+        try:
+            # Back and Forward pass the file of every step, which mostly is the current one
+            if current is not None and self.guides.normalize(file_path) == current.file_path and not self.guides.changed(current):
+                return True
+            entry = self.guides.open(file_path, scan=False)
         except FileNotFoundError:
             messagebox.showerror(self.get_label("Error"), f"{self.get_label('File not found.')}: {file_path}")
+            return False
         except Exception as e:
             messagebox.showerror(self.get_label("Error"), f"{self.get_label('Error loading file:')} {e}")
+            return False
+        if entry is self.current_guide:
+            return True
+        # Only the guide being shown is loaded
+        self.cancel_loading()
+
+        self.set_current_guide(entry)
+        if entry.loading:
+            self.start_loading(entry, start)
+            return True
+        if self.profiler:
+            self.profiler.record('load', time.perf_counter() - start, os.path.basename(entry.file_path), entry.key[1])
+        if self.nodes:
+            print(f"Found {len(self.nodes)} nodes")
+        return True
+
+    def start_loading(self, entry, start):
+        """Loads the nodes of the current guide in a worker thread, taking them over batch by batch."""
+        self.loading = entry
+        self.load_started = start
+        self.load_cancel = threading.Event()
+        self.load_queue = queue.Queue()
+        self.load_future = self.decoder.submit(self.scan_guide, entry, self.load_cancel, self.load_queue)
+        self.progress_label.config(text=f"{self.get_label('Loading')} 0%")
+        self.progress_label.pack(side=tk.LEFT)
+        self.cancel_button.pack(side=tk.LEFT)
+        self.load_poll_id = self.root.after(LOAD_POLL_MS, self.poll_loading)
+
+    def scan_guide(self, entry, cancel, results):
+        """Runs in a worker thread: reads the index from the disk cache, or else scans the node headers
+        and queues them batch by batch until done or cancelled.
+
+        Each batch is queued as the call that adds it to the guide on the Tk thread, with the
+        percentage loaded so far. A pack holds all of its nodes from the start, nothing is added.
+        """
+        if entry.packed:
+            results.put((None, 100, True))
+            return
+        index = entry.disk_cache.load_index()
+        if index is not None:
+            results.put((functools.partial(entry.use_index, index), 100, True))
+            return
+        guide = entry.guide
+        pos = 0
+        limit = SCAN_FIRST_BATCH_BYTES
+        done = False
+        while not done and not cancel.is_set():
+            rows, pos, done = guide.scan_nodes(pos, limit)
+            results.put((functools.partial(guide.add_nodes, rows), pos * 100 // max(1, guide.scan_size()), done))
+            limit = min(limit * 2, SCAN_BATCH_BYTES)
+
+    def poll_loading(self):
+        """Adds the nodes scanned so far to the current guide and shows the node waited for once it is there."""
+        self.load_poll_id = None
+        entry = self.loading
+        done = False
+        progress = None
+        while not done:
+            try:
+                add_nodes, progress, done = self.load_queue.get_nowait()
+            except queue.Empty:
+                break
+            if add_nodes is not None:
+                add_nodes()
+        # An index from the disk cache comes as a table of its own
+        self.nodes = entry.nodes
+        if progress is not None:
+            self.progress_label.config(text=f"{self.get_label('Loading')} {progress}%")
+            self.show_wanted_node()
+
+        if done:
+            # The link graph and the disk cache need all nodes
+            self.load_future = self.run_in_background(lambda f: self.finish_loading(entry, f),
+                                                      functools.partial(entry.complete, save=not entry.cached))
+        elif self.load_future.done() and self.load_future.exception() is not None and self.load_queue.empty():
+            error = self.load_future.exception()
+            self.cancel_loading()
+            messagebox.showerror(self.get_label("Error"), f"{self.get_label('Error loading file:')} {error}")
+        else:
+            self.load_poll_id = self.root.after(LOAD_POLL_MS, self.poll_loading)
+
+    def finish_loading(self, entry, future):
+        """Makes the fully scanned guide navigable and searchable once its link graph has been built."""
+        if entry is not self.loading:
+            return  # Cancelled meanwhile
+        self.loading = None
+        self.load_future = None
+        self.progress_label.pack_forget()
+        self.cancel_button.pack_forget()
+        try:
+            future.result()
+        except Exception as e:
+            print(f"Error building link graph: {e}")
+        self.link_graph = entry.link_graph
+        self.guides.resize(entry)
+        if self.profiler:
+            self.profiler.record('load', time.perf_counter() - self.load_started, os.path.basename(entry.file_path), entry.key[1])
+
+        if self.nodes:
+            print(f"Found {len(self.nodes)} nodes")
+            self.start_search_index()
+        if self.watch_file:
+            self.start_watching()
+        if self.wanted_node is not None:
+            node_name, add_to_history, or_first = self.wanted_node
+            self.wanted_node = None
+            if or_first and self.nodes:
+                self.show_node(next(iter(self.nodes)), add_to_history)
+            elif self.nodes:
+                messagebox.showwarning(self.get_label("Warning"), f"{self.get_label('Node not found.')}: '{node_name}'")
+        if not self.nodes:
+            messagebox.showwarning(self.get_label("Warning"), self.get_label("No valid nodes found in the file."))
+        self.update_nav_buttons()
+
+    def show_wanted_node(self):
+        """Shows the node waited for if the scan has found it by now."""
+        if self.wanted_node is not None and self.wanted_node[0] in self.nodes:
+            node_name, add_to_history, _ = self.wanted_node
+            self.show_node(node_name, add_to_history)
+
+    def cancel_loading(self):
+        """Stops loading the current guide in the background and closes it."""
+        entry = self.loading
+        if entry is None:
+            return
+        self.loading = None
+        self.wanted_node = None
+        self.load_cancel.set()
+        if self.load_poll_id is not None:
+            self.root.after_cancel(self.load_poll_id)
+            self.load_poll_id = None
+        future = self.load_future
+        self.load_future = None
+        self.progress_label.pack_forget()
+        self.cancel_button.pack_forget()
+        if entry is self.current_guide:
+            self.close_guide()
+            self.current_node = None
+            self.current_parsed = None
+            self.text.config(state=tk.NORMAL)
+            self.text.delete(1.0, tk.END)
+            self.text.config(state=tk.DISABLED)
+            self.update_nav_buttons()
+        if future is None or future.done():
+            self.guides.forget(entry)
+        else:
+            # The scan stops after the batch at hand, which for a compressed guide may first have to
+            # decompress all of it. Not waiting for that here keeps the window responsive; the file
+            # is closed once the worker is done with it.
+            self.guides.forget(entry, close=False)
+            self.when_done(future, lambda f: entry.close())
+
+    def set_current_guide(self, entry):
+        """Makes an OpenGuide the one shown and resumes building its search index."""
+        self.close_guide()
+        self.guides.pin(entry)
+        self.current_guide = entry
+        self.guide = entry.guide
+        self.disk_cache = entry.disk_cache
+        self.link_graph = entry.link_graph
+        self.nodes = entry.nodes
+        if entry.loading:
+            return  # Continued by finish_loading()
+        if self.nodes:
+            self.start_search_index()
+        if self.watch_file:
+            self.start_watching()
+
+    def close_guide(self):
+        """Stops showing the current guide; its file stays open in the guide database."""
+        self.stop_search_index()
+        self.search_index = None
+        self.search_pending = None
+        self.current_guide = None
+        self.guide = None
+        self.disk_cache = None
+        self.link_graph = None
+        self.nodes = {}
 
-    def show_node(self, node_name, add_to_history=False):
-        """Displays the content of a specific node."""
+    def toggle_watch(self):
+        """Switches reloading the guide when its file changes on or off."""
+        self.watch_file = bool(self.watch_var.get())
+        if self.watch_file:
+            self.start_watching()
+        elif self.watch_id is not None:
+            self.root.after_cancel(self.watch_id)
+            self.watch_id = None
+
+    def start_watching(self):
+        """Hashes the nodes of the current guide to compare them after a change, and starts polling its file."""
+        if self.current_guide is not None and not self.current_guide.loading and self.current_guide.guide.hashes is None:
+            self.current_guide.guide.hash_nodes()
+        if self.watch_id is None:
+            self.watch_id = self.root.after(WATCH_POLL_MS, self.poll_file)
+
+    def poll_file(self):
+        """Reloads the current guide if its file has changed since the last check, while watching."""
+        self.watch_id = None
+        if not self.watch_file:
+            return
+        entry = self.current_guide
+        if entry is not None and not entry.loading and self.guides.changed(entry):
+            # The nodes still to be indexed are carried over to the reloaded guide
+            self.stop_search_index()
+            try:
+                reloaded, changed = self.guides.reload(entry)
+            except Exception as e:
+                # E.g. saved only halfway, tried again with the next check
+                print(f"Error reloading file: {e}")
+                self.start_search_index()
+            else:
+                self.apply_reload(entry, reloaded, changed)
+        if self.watch_id is None:
+            self.watch_id = self.root.after(WATCH_POLL_MS, self.poll_file)
+
+    def apply_reload(self, old, reloaded, changed):
+        """Shows the reloaded guide in place of the old one; only the changed nodes are parsed and decoded again.
+
+        History, the cached unchanged nodes and their images and the scroll position are kept.
+        """
+        start = time.perf_counter()
+        for future in self.prefetch_futures:
+            future.cancel()
+        self.prefetch_futures = []
+
+        # Unchanged nodes only get the key of the reloaded guide, changed ones are dropped
+        parsed_nodes = self.node_cache.values()
+        if self.current_parsed is not None:
+            parsed_nodes.append(self.current_parsed)
+        for parsed in parsed_nodes:
+            if parsed.source is not old:
+                continue
+            self.node_cache.discard(parsed.key)
+            if parsed.name not in changed:
+                moved = parsed.move_to(reloaded)
+                self.audio_source = moved.get(self.audio_source, self.audio_source)
+                self.node_cache.put(parsed.key, parsed, parsed.size())
+        for key in self.image_cache.keys():
+            (guide_key, node_name), index, width = key
+            if guide_key != old.key:
+                continue
+            image = self.image_cache.peek(key)
+            self.image_cache.discard(key)
+            if node_name not in changed:
+                self.image_cache.put(((reloaded.key, node_name), index, width), image, image.width() * image.height() * 4)
+
+        self.set_current_guide(reloaded)
+        if self.current_node in self.nodes:
+            # Added or removed nodes change which links of the page are dangling
+            nodes_changed = any(node_name not in old.nodes or node_name not in self.nodes for node_name in changed)
+            if self.current_node in changed or nodes_changed:
+                self.refresh_node()
+            else:
+                self.schedule_prefetch()
+        else:
+            # Kept on screen until it comes back or another node is opened
+            print(f"Node {self.current_node} was removed from the file")
+        self.update_nav_buttons()
+        print(f"Reloaded {os.path.basename(reloaded.file_path)}, changed nodes: {', '.join(sorted(changed))}")
+        if self.profiler:
+            self.profiler.record('load', time.perf_counter() - start, os.path.basename(reloaded.file_path), reloaded.key[1])
+
+    def refresh_node(self):
+        """Renders the current node again, e.g. after its guide was reloaded, keeping the scroll position."""
+        top = self.text.index('@0,0')
+        parsed = self.parse_node(self.current_node)
+        self.current_parsed = parsed
+        self.insert_content_with_formatting(parsed)
+        # Render at least as far as the view reached before
+        while self.render_index < len(parsed.tokens) and self.text.compare('end', '<=', top):
+            self.render_chunk(parsed)
+        self.text.config(state=tk.DISABLED)
+        self.text.yview(top)
+        self.node_cache.put(parsed.key, parsed, parsed.size())
+        self.schedule_prefetch()
+
+    def start_search_index(self):
+        """Builds the full-text index of the current guide in the background, continuing where it stopped."""
+        entry = self.current_guide
+        if entry.search_index is None:
+            entry.search_index = SearchIndex()
+            entry.search_pending = iter(self.nodes)
+        self.search_index = entry.search_index
+        self.search_pending = entry.search_pending
+        if self.search_pending is not None:
+            self.index_next_batches()
+
+    def stop_search_index(self):
+        """Cancels the batches being tokenized; their nodes are indexed once the guide is shown again."""
+        if not self.search_jobs:
+            return
+        for future in self.search_jobs:
+            future.cancel()
+        entry = self.current_guide
+        entry.search_pending = itertools.chain(*self.search_jobs.values(), entry.search_pending)
+        self.search_pending = entry.search_pending
+        self.search_jobs = {}
+
+    def index_next_batches(self):
+        """Queues the next nodes for reading and tokenizing in the worker pool, up to SEARCH_INDEX_JOBS batches."""
+        while len(self.search_jobs) < SEARCH_INDEX_JOBS:
+            batch = list(itertools.islice(self.search_pending, SEARCH_INDEX_BATCH))
+            if not batch:
+                break
+            future = self.run_in_background(self.finish_search_batch, self.count_node_words, self.guide, batch)
+            self.search_jobs[future] = batch
+        if not self.search_jobs:
+            self.current_guide.search_pending = None
+            self.search_pending = None
+
+    def count_node_words(self, guide, node_names):
+        """Runs in the worker pool: returns (node name, word counts, length) of nodes, leaving the search index alone."""
+        nodes = guide.nodes
+        return [(node_name, *count_words(nodes[node_name].title, guide.read_node(node_name))) for node_name in node_names]
+
+    def finish_search_batch(self, future):
+        """Adds a tokenized batch of nodes to the search index and starts on the next one."""
+        if self.search_jobs.pop(future, None) is None:
+            return  # Cancelled meanwhile
+        try:
+            counted = future.result()
+        except Exception as e:
+            print(f"Error indexing nodes for search: {e}")
+            counted = []
+        # The next batch is tokenized while this one is merged
+        self.index_next_batches()
+        for node_name, counts, length in counted:
+            self.search_index.add_counts(node_name, counts, length)
+        self.update_search_status()
+
+    def open_search(self):
+        """Opens the "Find in Guide" window."""
+        if self.search_window is not None and self.search_window.winfo_exists():
+            self.search_window.lift()
+            self.search_entry.focus_set()
+            return
+        window = tk.Toplevel(self.root)
+        window.title(self.get_label('Find in Guide'))
+        window.geometry("400x360")
+        self.search_window = window
+
+        entry_frame = tk.Frame(window)
+        entry_frame.pack(fill=tk.X)
+        self.search_entry = tk.Entry(entry_frame)
+        self.search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.search_entry.bind('<Return>', lambda e: self.run_search())
+        tk.Button(entry_frame, text=self.get_label('Search'), command=self.run_search).pack(side=tk.RIGHT)
+
+        self.search_results = tk.Listbox(window)
+        self.search_results.pack(fill=tk.BOTH, expand=True)
+        self.search_results.bind('<Double-Button-1>', lambda e: self.open_search_result())
+        self.search_results.bind('<Return>', lambda e: self.open_search_result())
+        self.search_result_nodes = []
+
+        self.search_status = tk.Label(window, anchor=tk.W)
+        self.search_status.pack(fill=tk.X)
+        self.update_search_status()
+        self.search_entry.focus_set()
+
+    def run_search(self):
+        """Lists the nodes matching the query of the search window, best first."""
+        self.search_results.delete(0, tk.END)
+        self.search_result_nodes = []
+        if self.search_index is not None:
+            for node_name, score in self.search_index.search(self.search_entry.get()):
+                self.search_results.insert(tk.END, f"{self.nodes[node_name].title} ({node_name})")
+                self.search_result_nodes.append(node_name)
+        self.update_search_status()
+
+    def update_search_status(self):
+        """Shows the number of results and the indexing progress in the search window."""
+        if self.search_window is None or not self.search_window.winfo_exists():
+            return
+        status = f"{self.get_label('Results')}: {len(self.search_result_nodes)}"
+        if self.search_pending is not None:
+            status += f" - {self.get_label('Indexing')} {len(self.search_index)}/{len(self.nodes)}"
+        self.search_status.config(text=status)
+
+    def open_search_result(self):
+        """Shows the selected search result and highlights the query words in it."""
+        selection = self.search_results.curselection()
+        if not selection:
+            return
+        self.show_node(self.search_result_nodes[selection[0]], add_to_history=True)
+        self.highlight_words(WORD_RE.findall(self.search_entry.get()))
+
+    def highlight_words(self, words):
+        """Highlights whole-word matches in the page, rendering further chunks until one is found."""
+        self.text.tag_configure('search', background="yellow")
+        self.text.tag_remove('search', '1.0', tk.END)
+        if not words:
+            return
+        pattern = "|".join(rf"\m{word}\M" for word in words)
+        length = tk.IntVar()
+        first_match = None
+        start = '1.0'
+        while True:
+            index = start
+            while True:
+                index = self.text.search(pattern, index, stopindex=tk.END, nocase=True, regexp=True, count=length)
+                if not index or not length.get():
+                    break
+                end = f"{index}+{length.get()}c"
+                self.text.tag_add('search', index, end)
+                first_match = first_match or index
+                index = end
+            if first_match or self.render_index >= len(self.current_parsed.tokens):
+                break
+            # The match lies further down the node than what has been inserted so far
+            start = self.text.index('end-1c linestart')
+            self.render_more()
+        if first_match:
+            self.text.see(first_match)
+
+    def show_node(self, node_name, add_to_history=False, file_path=None):
+        """Displays the content of a specific node, of another guide file if file_path is given."""
+        if file_path is not None and not self.switch_guide(file_path):
+            return
         node_name = node_name.upper()
+        if node_name not in self.nodes and self.loading is not None:
+            # Shown as soon as the background scan has found it
+            self.wanted_node = (node_name, add_to_history, False)
+            return
         if node_name in self.nodes:
+            self.wanted_node = None
             if add_to_history:
                 # Update history when displaying a new node
                 # Remove entries after the current index
                 self.history = self.history[:self.history_index+1]
-                self.history.append(node_name)
+                self.history.append((self.current_guide.file_path, node_name))
                 self.history_index += 1
 
             self.current_node = node_name
-            content = self.nodes[node_name]
+            parsed = self.parse_node(node_name)
+            self.current_parsed = parsed
             self.text.config(state=tk.NORMAL)
             self.text.delete(1.0, tk.END)
-            self.insert_content_with_formatting(content)
+            self.insert_content_with_formatting(parsed)
             self.text.config(state=tk.DISABLED)
+            # Store again after rendering so the decoded payloads count towards the budget
+            self.node_cache.put(parsed.key, parsed, parsed.size())
+            self.schedule_prefetch()
 
             self.update_nav_buttons()
         else:
             messagebox.showwarning(self.get_label("Warning"), f"{self.get_label('Node not found.')}: '{node_name}'")
 
-    def insert_content_with_formatting(self, content):
-        """Parses AmigaGuide formatting, links, images, and displays them."""
+    def schedule_prefetch(self):
+        """Parses and decodes the nodes most likely to be opened next while the user reads this one.
+
+        Candidates are the history neighbours and then the links of the page in order. Jobs from
+        the previous page that have not started yet are cancelled first.
+        """
+        for future in self.prefetch_futures:
+            future.cancel()
+        self.prefetch_futures = []
+        self.prefetch_bytes = 0
+
+        entry = self.current_guide
+        candidates = []
+        for history_index in (self.history_index - 1, self.history_index + 1):
+            if 0 <= history_index < len(self.history) and self.history[history_index][0] == entry.file_path:
+                candidates.append(self.history[history_index][1])
+        candidates.extend(token[2].upper() for token in self.current_parsed.tokens if token[0] == LINK)
+
+        seen = {self.current_node}
+        for node_name in candidates:
+            if len(seen) > PREFETCH_NODES:
+                break
+            if node_name in seen or node_name not in self.nodes or (entry.key, node_name) in self.node_cache:
+                continue
+            seen.add(node_name)
+            future = self.run_in_background(
+                lambda f, name=node_name: self.finish_prefetch(entry, name, f),
+                entry.guide.read_tokens, node_name
+            )
+            self.prefetch_futures.append(future)
+
+    def finish_prefetch(self, entry, node_name, future):
+        """Caches a prefetched node and queues the decoding of its images, within the prefetch budget."""
+        if future.cancelled() or entry is not self.current_guide or (entry.key, node_name) in self.node_cache:
+            return
+        try:
+            parsed = ParsedNode(entry, node_name, future.result())
+        except Exception as e:
+            print(f"Error prefetching node {node_name}: {e}")
+            return
+        size = parsed.size()
+        if self.prefetch_bytes + size > self.node_cache.max_bytes * PREFETCH_CACHE_SHARE:
+            return
+        self.prefetch_bytes += size
+        self.node_cache.put(parsed.key, parsed, size)
+        for index, token in enumerate(parsed.tokens):
+            if token[0] == BINARY and token[1].lower().endswith(IMAGE_EXTENSIONS):
+                self.prefetch_futures.append(self.submit_decode(parsed, index, True, self.image_width))
+
+    def parse_node(self, node_name):
+        """Returns the parsed node from the cache, tokenizing it on the first visit (or reading the tokens of a pack)."""
+        parsed = self.node_cache.get((self.current_guide.key, node_name))
+        if parsed is None:
+            start = time.perf_counter()
+            parsed = ParsedNode(self.current_guide, node_name, self.guide.read_tokens(node_name))
+            if self.profiler:
+                entry = self.nodes[node_name]
+                self.profiler.record('tokenize', time.perf_counter() - start, parsed.label(), entry.end - entry.start)
+        return parsed
+
+    def insert_content_with_formatting(self, parsed):
+        """Displays the formatting, links and images of a parsed node, starting with its first chunk."""
         self.text.config(state=tk.NORMAL)
         self.text.delete(1.0, tk.END)
         self.images.clear()  # Clear the image references
-        pos = 0
-        stack = []
-        # Counter for unique link tags
-        link_counter = 0
-
-        # Replace bullet points and ASCII emojis before processing
-        content = self.replace_ascii_emojis(content)
-
-        while pos < len(content):
-            # Search for the next tag, link, or uuencoded block
-            tag_match = re.search(r'@{\w+}|@{/\w*}|@{"|begin\s+\d+\s+\S+', content[pos:])
-            if not tag_match:
-                # No more tags, insert remaining text
-                text = content[pos:]
-                if stack:
-                    tags = tuple(stack)
-                    self.text.insert(tk.END, text, tags)
-                else:
-                    self.text.insert(tk.END, text)
-                break
+        self.link_targets = []
+        self.render_index = 0
+        self.render_offset = 0
+        self.render_stack = []
+        if self.render_chunks:
+            self.text.mark_unset(*(mark for mark, _ in self.render_chunks))
+            self.render_chunks = []
+        self.render_chunk(parsed)
 
-            start = pos + tag_match.start()
-            end = pos + tag_match.end()
-            tag_text = tag_match.group(0)
+    def render_chunk(self, parsed):
+        """Inserts the next RENDER_CHUNK_CHARS worth of tokens at the end of the text widget.
 
-            # Insert text before the tag
-            if start > pos:
-                text = content[pos:start]
-                if stack:
-                    tags = tuple(stack)
-                    self.text.insert(tk.END, text, tags)
-                else:
-                    self.text.insert(tk.END, text)
-
-            # Process the tag
-            if tag_text.startswith('@{') and tag_text.endswith('}'):
+        Adjacent text with the same tags is joined into one run, and the runs go into the widget
+        with one multi-segment insert per chunk, or per stretch between embedded images. A text
+        run longer than what is left of the budget is split, the next chunk goes on with the rest.
+        """
+        start = time.perf_counter()
+        tokens = parsed.tokens
+        stack = self.render_stack
+        tags = tuple(stack)  # Rebuilt only when the formatting changes
+        segments = []  # chars, tags, chars, tags, ... for text.insert()
+        run = []  # Text pieces with run_tags, not yet in segments
+        run_tags = tags
+        budget = RENDER_CHUNK_CHARS
+        index = self.render_index
+        offset = self.render_offset
+        # Marks where the chunk starts, so that it can be dropped again once scrolled far out of view
+        mark = f"chunk{self.render_chunk_id}"
+        self.render_chunk_id += 1
+        self.text.mark_set(mark, 'end-1c')
+        self.text.mark_gravity(mark, tk.LEFT)
+        while index < len(tokens) and budget > 0:
+            token = tokens[index]
+            kind = token[0]
+            if kind == TEXT:
+                text = token[1]
+                if offset or len(text) > budget:
+                    text = text[offset:offset + budget]
+                    offset += len(text)
+                    if offset == len(token[1]):
+                        offset = 0
+                budget -= len(text)
+                if tags != run_tags:
+                    if run:
+                        segments += ("".join(run), run_tags)
+                        run = []
+                    run_tags = tags
+                run.append(text)
+                if offset:
+                    break  # The rest of the run goes into the next chunk
+            elif kind == STYLE:
                 # Formatting start or end tag
-                tag_content = tag_text[2:-1]
-                if tag_content == 'b':
-                    stack.append('bold')
-                elif tag_content == 'ub':
-                    if 'bold' in stack:
-                        stack.remove('bold')
-                elif tag_content == 'u':
-                    stack.append('underline')
-                elif tag_content == 'uu':
-                    if 'underline' in stack:
-                        stack.remove('underline')
-                else:
-                    # Unknown tag, ignore
-                    pass
-                pos = end
-            elif tag_text == '@{"':
-                # Link tag found, parse the entire link
-                link_match = re.match(r'@{"(.*?)"\s+link\s+"(.*?)"(?:\s+\d+)?}', content[start:])
-                if link_match:
-                    link_text = link_match.group(1)
-                    link_target = link_match.group(2)
-                    link_end = start + link_match.end()
-
-                    # Insert text before the button
-                    if stack:
-                        tags = tuple(stack)
-                    else:
-                        tags = ()
-
-                    # Create button
-                    btn = tk.Button(
-                        self.text,
-                        text=link_text,
-                        padx=2,
-                        pady=0,
-                        relief=tk.RAISED,
-                        bd=2,
-                        fg="blue",
-                        cursor="hand2",
-                        font=("Arial", 12, "underline")
-                    )
-                    btn.bind("<Button-1>", lambda e, target=link_target: self.show_node(target, add_to_history=True))
-
-                    # Insert button into the text widget
-                    self.text.window_create(tk.END, window=btn)
-                    self.text.insert(tk.END, " ", tags)  # Space after the button
-
-                    pos = link_end
-                else:
-                    # Could not parse the link, insert as normal text
-                    self.text.insert(tk.END, tag_text)
-                    pos = end
-            elif tag_text.startswith('begin'):
-                # Possibly a uuencoded block (image or audio)
-                uu_match = re.match(r'begin\s+\d+\s+(\S+)(.*?)\nend', content[start:], re.DOTALL)
-                if uu_match:
-                    filename = uu_match.group(1)
-                    uu_data = uu_match.group(2)
-                    uu_end = start + uu_match.end()
-
-                    # Decode the uuencoded data
-                    try:
-                        decoded_data = self.decode_uu_data(f"begin {filename}{uu_data}\nend")
-                        if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tif', '.tiff', '.webp', '.ppm', '.eps')):
-                            # Handle image
-                            image = Image.open(io.BytesIO(decoded_data))
-                            photo = ImageTk.PhotoImage(image)
-                            self.images.append(photo)  # Keep a reference to avoid garbage collection
-                            # Insert image into the text widget
-                            self.text.image_create(tk.END, image=photo)
-                            self.text.insert(tk.END, "\n")  # Newline after the image
-                            # Insert audio into the text widget (autoplay)
-                        elif filename.lower().endswith(('.mp3', '.ogg', '.wav', '.midi', '.mid')):
-                            # Handle audio 
-                            if self.current_node == 'MAIN':
-                                self.play_audio(decoded_data)
-                        else:
-                            # Unknown file type, insert as text
-                            self.text.insert(tk.END, content[start:uu_end])
-                    except Exception as e:
-                        print(f"Error decoding data: {e}")
-                        # Insert the uuencoded data as text if decoding fails
-                        self.text.insert(tk.END, content[start:uu_end])
-
-                    pos = uu_end
-                else:
-                    # Not a valid uuencoded block, insert as text
-                    self.text.insert(tk.END, tag_text)
-                    pos = end
-            else:
-                # Unknown tag, insert as text
-                self.text.insert(tk.END, tag_text)
-                pos = end
+                tag_name, on = token[1], token[2]
+                if on:
+                    stack.append(tag_name)
+                elif tag_name in stack:
+                    stack.remove(tag_name)
+                tags = tuple(stack)
+            elif kind == LINK:
+                budget -= len(token[1])
+                if run:
+                    segments += ("".join(run), run_tags)
+                segments += (token[1], self.link_tags(token[2], tags))
+                # Space after the link
+                run = [" "]
+                run_tags = tags
+            elif kind == BINARY:
+                if run:
+                    segments += ("".join(run), run_tags)
+                    run = []
+                if segments:
+                    self.text.insert(tk.END, *segments)
+                    segments = []
+                # Only what is inserted counts, not the size of the embedded data
+                budget -= self.insert_binary(parsed, index, token[1], token[2])
+            index += 1
+        if run:
+            segments += ("".join(run), run_tags)
+        if segments:
+            self.text.insert(tk.END, *segments)
+        self.render_index = index
+        self.render_offset = offset
+        self.render_chunks.append((mark, RENDER_CHUNK_CHARS - budget))
 
         # Apply centering if enabled
         if self.center_text:
@@ -376,68 +1058,410 @@ class AmigaGuideViewer:
         else:
             self.text.tag_configure('center', justify='left')
             self.text.tag_remove('center', '1.0', 'end')
+        if self.profiler:
+            self.profiler.record('render', time.perf_counter() - start, parsed.label(), RENDER_CHUNK_CHARS - budget)
 
-    def decode_uu_data(self, uu_content):
-        """Decodes uuencoded data and returns bytes."""
-        uu_file = io.StringIO(uu_content)
-        out_file = io.BytesIO()
-        uu.decode(uu_file, out_file)
-        return out_file.getvalue()
-
-    def replace_ascii_emojis(self, text):
-        """Replaces ASCII emojis with Unicode emojis and bullet points with emojis."""
-        # Define a mapping of ASCII emojis to Unicode emojis
-        emoji_mapping = {
-            ':)': '😊',
-            ':-)': '😊',
-            ':(': '☹️',
-            ':-(': '☹️',
-            ':D': '😃',
-            ':-D': '😃',
-            ';)': '😉',
-            ';-)': '😉',
-            ':o': '😮',
-            ':-o': '😮',
-            ':p': '😛',
-            ':-p': '😛',
-            '<3': '❤️',
-            'o/': '👋',
-            ':-|': '😐',
-            ':|': '😐',
-        }
+    def render_more(self):
+        """Appends the next chunk of the current node when the view has scrolled close to the end."""
+        self.render_scheduled = False
+        parsed = self.current_parsed
+        if parsed is None or self.render_index >= len(parsed.tokens):
+            return
+        self.text.config(state=tk.NORMAL)
+        self.render_chunk(parsed)
+        self.drop_hidden_chunks()
+        self.text.config(state=tk.DISABLED)
 
-        # Replace bullet points "o " at the beginning of a line with "📌 "
-        text = re.sub(r'(?m)^\s*o\s+', '📌 ', text)
-        text = re.sub(r'(?m)^\s*-\s+', '• ', text)
+    def drop_hidden_chunks(self):
+        """Deletes the oldest chunks of the node from the text widget while it holds more than
+        RENDER_KEEP_CHARS, as long as they lie above the view.
 
-        # Replace ASCII emojis
-        for ascii_emoji, unicode_emoji in emoji_mapping.items():
-            text = text.replace(ascii_emoji, unicode_emoji)
+        They are replaced by a line that renders the node from its start again when clicked.
+        """
+        chunks = self.render_chunks
+        kept = sum(chars for _, chars in chunks)
+        if kept <= RENDER_KEEP_CHARS:
+            return
+        # The view stays on the same text while the lines above it are deleted
+        self.text.mark_set('render_view', '@0,0')
+        dropped = False
+        while kept > RENDER_KEEP_CHARS and len(chunks) > 1 and self.text.compare(chunks[1][0], '<=', 'render_view'):
+            mark, chars = chunks.pop(0)
+            self.text.delete(mark, chunks[0][0])
+            self.text.mark_unset(mark)
+            kept -= chars
+            dropped = True
+        if dropped and not self.text.tag_ranges('dropped'):
+            self.text.insert('1.0', f"[{self.get_label('Show the start of the node')}]\n", ('link', 'dropped'))
+            # The first chunk kept starts after that line
+            self.text.mark_set(chunks[0][0], 'dropped.last')
+        self.text.yview('render_view')
+        self.text.mark_unset('render_view')
 
-        return text
+    def render_from_start(self, event=None):
+        """Renders the current node again from its start, after its first chunks were dropped."""
+        parsed = self.current_parsed
+        if parsed is None:
+            return
+        self.insert_content_with_formatting(parsed)
+        self.text.config(state=tk.DISABLED)
+        self.text.yview('1.0')
 
-    def play_audio(self, audio_data):
-        """Plays the given audio data (MP3) in a loop."""
+    def on_text_scroll(self, first, last):
+        """Updates the scrollbar and materializes more of the node ahead of the visible area."""
+        self.scrollbar.set(first, last)
+        parsed = self.current_parsed
+        if (parsed is not None and self.render_index < len(parsed.tokens)
+                and float(last) >= RENDER_AHEAD and not self.render_scheduled):
+            self.render_scheduled = True
+            self.root.after_idle(self.render_more)
+
+    def link_tags(self, link_target, tags):
+        """Registers the target of a link on the page and returns the tags making its text clickable."""
+        link_tag = f"link{len(self.link_targets)}"
+        self.link_targets.append(link_target)
+        if '/' not in link_target and self.loading is None and link_target.upper() not in self.nodes:
+            # Known to be broken from the link graph, shown struck through
+            tags = tags + ('dangling',)
+        return tags + ('link', link_tag)
+
+    def on_link_click(self, event):
+        """Follows the link under the mouse pointer."""
+        for tag_name in self.text.tag_names(f"@{event.x},{event.y}"):
+            if tag_name.startswith('link') and tag_name[4:].isdigit():
+                self.follow_link(self.link_targets[int(tag_name[4:])])
+                return
+
+    def follow_link(self, target):
+        """Shows the target of a link, a node of the current guide or "file.guide/NODE" in another one."""
+        if '/' not in target:
+            self.show_node(target, add_to_history=True)
+            return
+        file_path, node_name = self.guides.resolve(self.current_guide.file_path, target)
+        if file_path is None:
+            messagebox.showerror(self.get_label("Error"), f"{self.get_label('File not found.')}: {target.rsplit('/', 1)[0]}")
+            return
+        self.show_node(node_name, add_to_history=True, file_path=file_path)
+
+    def insert_binary(self, parsed, index, filename, raw_block):
+        """Shows an embedded image or plays embedded audio, decoding it in the background on first use.
+
+        Returns the number of characters inserted into the text widget.
+        """
+        is_image = filename.lower().endswith(IMAGE_EXTENSIONS)
+        if not (is_image or filename.lower().endswith(AUDIO_EXTENSIONS)):
+            # Unknown file type, insert as text
+            self.text.insert(tk.END, raw_block)
+            return len(raw_block)
+
+        if parsed.payloads.get(index, False) is None:
+            # Insert the uuencoded data as text if decoding fails
+            raw_text = self.binary_text(filename, raw_block)
+            self.text.insert(tk.END, raw_text)
+            return len(raw_text)
+
+        if not is_image:
+            if index in parsed.payloads:
+                # Handle audio, once the text of the page is on screen
+                self.root.after_idle(self.play_page_audio, parsed, index)
+            elif (index, None) not in parsed.pending:
+                self.submit_decode(parsed, index, False)
+            return 0
+
+        # The image, or its placeholder until it has been decoded, carries a tag to find it again
+        image = self.image_cache.get((parsed.key, index, self.image_width))
+        if image is None:
+            self.request_image(parsed, index)
+            self.text.insert(tk.END, f"[{filename}]", f"binary{index}")
+        else:
+            self.images[index] = image  # Keep a reference to avoid garbage collection
+            position = self.text.index('end-1c')
+            self.text.image_create(position, image=image)
+            self.text.tag_add(f"binary{index}", position)
+        self.text.insert(tk.END, "\n")  # Newline after the image
+        return len(filename) + 3
+
+    def binary_text(self, filename, raw_block):
+        """Returns the text shown for an embedded block that cannot be decoded.
+
+        That is the uuencoded data, or just the file name for data that comes decoded from a guide pack.
+        """
+        return raw_block if isinstance(raw_block, str) else f"[{filename}]"
+
+    def run_in_background(self, on_done, func, *args):
+        """Runs func in the worker pool and calls on_done(future) on the Tk thread once it has finished."""
+        future = self.decoder.submit(func, *args)
+        self.when_done(future, on_done)
+        return future
+
+    def when_done(self, future, on_done):
+        """Calls on_done(future) on the Tk thread once a job in the worker pool has finished."""
+        future.add_done_callback(lambda f: self.done_queue.put((on_done, f)))
+        self.background_jobs += 1
+        if self.poll_id is None:
+            self.poll_id = self.root.after(DECODE_POLL_MS, self.poll_background)
+
+    def request_image(self, parsed, index):
+        """Queues an embedded image for decoding at the current display width, unless it is queued already."""
+        if (index, self.image_width) not in parsed.pending:
+            self.submit_decode(parsed, index, True, self.image_width)
+
+    def submit_decode(self, parsed, index, is_image, width=None):
+        """Queues an embedded block for decoding in the worker pool, images at the given width."""
+        parsed.pending.add((index, width))
+        disk_cache = parsed.source.disk_cache
+        if is_image:
+            cache_path = disk_cache.thumbnail_path(parsed.name, index, width)
+        else:
+            cache_path = disk_cache.media_path(parsed.name, index, os.path.splitext(parsed.tokens[index][1])[1])
+        return self.run_in_background(
+            lambda f: self.finish_decode(parsed, index, width, f),
+            self.decode_binary, parsed.tokens[index][2], is_image, cache_path, width,
+            parsed.label() if self.profiler else None
+        )
+
+    def decode_binary(self, raw_block, is_image, cache_path=None, width=THUMBNAIL_SIZE[0], profile_label=None):
+        """Runs in a worker thread: uudecodes a block and decodes images scaled to the given width.
+
+        Scaled images are kept in the on-disk cache per width, so later sessions load the
+        thumbnail instead of decoding the embedded data again. Audio is written to the on-disk
+        cache as well and returned as the file name, for the mixer to stream it from there.
+        """
+        if not is_image:
+            # Imported here so that playing the track does not wait for it on the Tk thread
+            load_pygame()
+            if cache_path and os.path.exists(cache_path):
+                return cache_path
+        else:
+            load_imaging()
+        if cache_path and is_image:
+            try:
+                image = Image.open(cache_path)
+                image.load()
+                return image
+            except OSError:
+                pass  # Not cached yet
+
+        if isinstance(raw_block, str):
+            start = time.perf_counter()
+            decoded_data = self.decode_uu_data(raw_block)
+            if self.profiler:
+                self.profiler.record('uudecode', time.perf_counter() - start, profile_label, len(decoded_data))
+        else:
+            decoded_data = raw_block  # Stored decoded in a guide pack
+        if not is_image:
+            if cache_path and self.save_media(decoded_data, cache_path):
+                return cache_path
+            return decoded_data
+        # Decoded here instead of lazily on the Tk thread
+        start = time.perf_counter()
+        image = fit_image(Image.open(io.BytesIO(decoded_data)), (min(width, THUMBNAIL_SIZE[0]), THUMBNAIL_SIZE[1]))
+        if self.profiler:
+            self.profiler.record('image', time.perf_counter() - start, profile_label, image.width * image.height * 4)
+        if cache_path:
+            self.save_thumbnail(image, cache_path)
+        return image
+
+    def save_media(self, data, cache_path):
+        """Writes decoded audio to the on-disk cache; returns False if that is not possible."""
+        temp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(temp_path, 'wb') as file:
+                file.write(data)
+            os.replace(temp_path, cache_path)
+            return True
+        except OSError as e:
+            remove_file(temp_path)
+            print(f"Error writing cache: {e}")
+            return False
+
+    def save_thumbnail(self, image, thumbnail_path):
+        """Writes a decoded image to the on-disk cache, JPEG for photos and PNG otherwise."""
+        temp_path = f"{thumbnail_path}.{threading.get_ident()}.tmp"
+        try:
+            if image.mode in ('RGB', 'L'):
+                image.save(temp_path, format='JPEG', quality=90)
+            else:
+                image.save(temp_path, format='PNG')
+            os.replace(temp_path, thumbnail_path)
+        except (OSError, ValueError) as e:
+            # Neither pruned nor counted against the cache budget if left behind
+            remove_file(temp_path)
+            print(f"Error writing cache: {e}")
+
+    def poll_background(self):
+        """Hands finished background jobs to their callbacks on the Tk thread."""
+        self.poll_id = None
+        while True:
+            try:
+                on_done, future = self.done_queue.get_nowait()
+            except queue.Empty:
+                break
+            self.background_jobs -= 1
+            on_done(future)
+        if self.background_jobs > 0:
+            self.poll_id = self.root.after(DECODE_POLL_MS, self.poll_background)
+
+    def finish_decode(self, parsed, index, width, future):
+        """Stores a decoded payload and swaps it into the page if the node is still shown."""
+        parsed.pending.discard((index, width))
+        if future.cancelled():
+            # A prefetch that was dropped before it started; only needed again if the node is shown now
+            if parsed is self.current_parsed:
+                if width is None:
+                    self.submit_decode(parsed, index, False)
+                else:
+                    self.request_image(parsed, index)
+            return
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"Error decoding data: {e}")
+            parsed.payloads[index] = None
+            image = None
+        else:
+            if width is None:
+                parsed.payloads[index] = result
+            else:
+                # PhotoImages may only be created on the Tk thread
+                start = time.perf_counter()
+                image = ImageTk.PhotoImage(result)
+                if self.profiler:
+                    self.profiler.record('photoimage', time.perf_counter() - start, parsed.label(),
+                                         image.width() * image.height() * 4)
+                self.image_cache.put((parsed.key, index, width), image, image.width() * image.height() * 4)
+
+        if self.node_cache.peek(parsed.key) is parsed:
+            self.node_cache.put(parsed.key, parsed, parsed.size())
+        if parsed is not self.current_parsed:
+            return
+
+        if width is None:
+            self.play_page_audio(parsed, index)
+            return
+        if image is not None and width != self.image_width:
+            # The window was resized while this was being decoded
+            self.request_image(parsed, index)
+            return
+        self.replace_image(parsed, index, image)
+
+    def replace_image(self, parsed, index, image):
+        """Swaps the image or placeholder of an embedded block on the page; None shows the raw data."""
+        ranges = self.text.tag_ranges(f"binary{index}")
+        if not ranges:
+            return
+        start, end = ranges[0], ranges[1]
+        self.text.config(state=tk.NORMAL)
+        self.text.delete(start, end)
+        if image is None:
+            # Insert the uuencoded data as text if decoding fails
+            self.text.insert(start, self.binary_text(*parsed.tokens[index][1:]))
+            self.images.pop(index, None)
+        else:
+            self.images[index] = image  # Keep a reference to avoid garbage collection
+            self.text.image_create(start, image=image)
+            self.text.tag_add(f"binary{index}", start)
+        if self.center_text:
+            self.text.tag_add('center', '1.0', 'end')
+        self.text.config(state=tk.DISABLED)
+
+    def display_image_width(self):
+        """Returns the width images are scaled to, from the current width of the text widget."""
+        width = self.text.winfo_width()
+        if width <= 1:
+            # Not mapped yet
+            width = self.text.winfo_reqwidth()
+        return max(IMAGE_WIDTH_STEP, (width - IMAGE_MARGIN) // IMAGE_WIDTH_STEP * IMAGE_WIDTH_STEP)
+
+    def on_text_configure(self, event):
+        """Re-scales the images of the page once the window has stopped being resized."""
+        if self.resize_id is not None:
+            self.root.after_cancel(self.resize_id)
+        self.resize_id = self.root.after(RESIZE_DEBOUNCE_MS, self.rescale_images)
+
+    def rescale_images(self):
+        """Shows the images of the page at the new display width, from the cache or decoded anew.
+
+        The images at the old width stay visible until their replacement has been decoded.
+        """
+        self.resize_id = None
+        width = self.display_image_width()
+        if width == self.image_width:
+            return
+        self.image_width = width
+        parsed = self.current_parsed
+        if parsed is None:
+            return
+        for tag_name in self.text.tag_names():
+            if not (tag_name.startswith('binary') and tag_name[6:].isdigit()):
+                continue
+            index = int(tag_name[6:])
+            if parsed.payloads.get(index, False) is None:
+                continue
+            image = self.image_cache.get((parsed.key, index, width))
+            if image is None:
+                self.request_image(parsed, index)
+            else:
+                self.replace_image(parsed, index, image)
+
+    def decode_uu_data(self, uu_content):
+        """Decodes uuencoded data and returns bytes."""
+        return uudecode(uu_content)
+
+    def play_page_audio(self, parsed, index):
+        """Plays the decoded audio of a block if its page is still the MAIN node being shown."""
+        if parsed is self.current_parsed and self.current_node == 'MAIN' and parsed.payloads.get(index):
+            self.play_audio(parsed.payloads[index])
+
+    def play_audio(self, audio_source):
+        """Plays audio (MP3, OGG, ...) from a file or bytes in a loop; the track already playing keeps going."""
+        if self.audio_playing and audio_source == self.audio_source:
+            return
         self.stop_audio()
+        if not self.init_mixer():
+            return
         try:
-            # Save audio data to a temporary file-like object
-            audio_file = io.BytesIO(audio_data)
-            pygame.mixer.music.load(audio_file)
+            # A file is streamed by the mixer, bytes have to be wrapped in a file-like object
+            pygame.mixer.music.load(audio_source if isinstance(audio_source, str) else io.BytesIO(audio_source))
             pygame.mixer.music.play(loops=-1)  # Play indefinitely
 
             self.audio_playing = True
+            self.audio_source = audio_source
         except Exception as e:
             print(f"Error playing audio: {e}")
             self.audio_playing = False
 
+    def init_mixer(self):
+        """Initializes the pygame mixer on first use; returns False if there is no audio output."""
+        if not self.mixer_ready:
+            try:
+                load_pygame()
+                pygame.mixer.init()
+                self.mixer_ready = True
+            except Exception as e:
+                print(f"Error initializing audio: {e}")
+        return self.mixer_ready
+
     def stop_audio(self):
         """Stops the audio playback if any."""
         if self.audio_playing:
             pygame.mixer.music.stop()
+            # Releases the file, so the cache can prune it
+            pygame.mixer.music.unload()
             self.audio_playing = False
+            self.audio_source = None
 
     def update_nav_buttons(self):
-        """Updates the state of the back and forward buttons."""
+        """Updates the state of the history and the contents/browse buttons."""
+        navigation = self.link_graph.navigation(self.current_node) if self.link_graph and self.current_node else {}
+        for kind, button in (('toc', self.contents_button), ('prev', self.prev_button), ('next', self.next_button)):
+            target = navigation.get(kind)
+            if target in self.nodes and target != self.current_node:
+                button.config(state=tk.NORMAL)
+            else:
+                button.config(state=tk.DISABLED)
+
         if self.history_index > 0:
             self.back_button.config(state=tk.NORMAL)
         else:
@@ -448,30 +1472,89 @@ class AmigaGuideViewer:
         else:
             self.forward_button.config(state=tk.DISABLED)
 
+    def go_related(self, kind):
+        """Shows the contents, previous or next node of the current one."""
+        if self.link_graph and self.current_node:
+            target = self.link_graph.navigation(self.current_node).get(kind)
+            if target:
+                self.show_node(target, add_to_history=True)
+
     def go_back(self):
         """Navigates to the previous node."""
         if self.history_index > 0:
             self.history_index -= 1
-            node_name = self.history[self.history_index]
-            self.show_node(node_name, add_to_history=False)
+            file_path, node_name = self.history[self.history_index]
+            self.show_node(node_name, add_to_history=False, file_path=file_path)
         self.update_nav_buttons()
 
     def go_forward(self):
         """Navigates to the next node."""
         if self.history_index < len(self.history) - 1:
             self.history_index += 1
-            node_name = self.history[self.history_index]
-            self.show_node(node_name, add_to_history=False)
+            file_path, node_name = self.history[self.history_index]
+            self.show_node(node_name, add_to_history=False, file_path=file_path)
         self.update_nav_buttons()
 
+    def update_profile_counters(self):
+        """Copies the cache statistics into the profiler."""
+        counters = self.profiler.counters
+        for name, cache in (('node_cache', self.node_cache), ('image_cache', self.image_cache), ('open_guides', self.guides.guides)):
+            lookups = cache.hits + cache.misses
+            counters[f"{name}_hits"] = cache.hits
+            counters[f"{name}_misses"] = cache.misses
+            counters[f"{name}_hit_rate"] = round(cache.hits / lookups, 3) if lookups else None
+            counters[f"{name}_entries"] = len(cache)
+            counters[f"{name}_bytes"] = cache.total_bytes
+
+    def open_stats_window(self):
+        """Opens the window showing the timings collected with --profile, refreshed while it is open."""
+        if self.stats_window is not None and self.stats_window.winfo_exists():
+            self.stats_window.lift()
+            return
+        window = tk.Toplevel(self.root)
+        window.title(self.get_label('Statistics'))
+        window.geometry("640x420")
+        self.stats_window = window
+        self.stats_text = tk.Text(window, wrap=tk.NONE, font=("Courier", 10))
+        self.stats_text.pack(fill=tk.BOTH, expand=True)
+        self.refresh_stats_window()
+
+    def refresh_stats_window(self):
+        """Shows the current statistics and reschedules itself until the window is closed."""
+        if self.stats_window is None or not self.stats_window.winfo_exists():
+            return
+        self.update_profile_counters()
+        self.stats_text.config(state=tk.NORMAL)
+        self.stats_text.delete(1.0, tk.END)
+        self.stats_text.insert(tk.END, self.profiler.report())
+        self.stats_text.config(state=tk.DISABLED)
+        self.stats_window.after(STATS_REFRESH_MS, self.refresh_stats_window)
+
     def on_closing(self):
         """Handles application closing."""
+        if self.profiler:
+            self.update_profile_counters()
+            self.profiler.write_log()
         self.stop_audio()
+        self.cancel_loading()
+        self.decoder.shutdown(wait=False, cancel_futures=True)
+        self.close_guide()
+        self.guides.close()
         self.root.destroy()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AmigaGuide Viewer")
+    parser.add_argument("--profile", action="store_true", help="time parsing, decoding and rendering (File > Statistics)")
+    parser.add_argument("--profile-log", metavar="FILE", help="write the timings as JSON on exit, implies --profile")
+    parser.add_argument("--watch", action="store_true", help="reload the guide whenever its file is saved (Options > Watch File)")
+    parser.add_argument("file", nargs="?", help="guide file to open")
+    args = parser.parse_args()
+
     root = tk.Tk()
-    app = AmigaGuideViewer(root)
+    app = AmigaGuideViewer(root, profiler=Profiler(args.profile_log) if args.profile or args.profile_log else None,
+                           watch=args.watch)
     root.geometry("800x600")
     root.protocol("WM_DELETE_WINDOW", app.on_closing)
+    if args.file:
+        app.open_guide(args.file)
     root.mainloop()
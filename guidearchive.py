@@ -0,0 +1,446 @@
+import bisect
+import mmap
+import os
+import posixpath
+import struct
+import sys
+import threading
+import zlib
+
+# Guideview by Zeittresor
+# Compressed guides: .guide.gz, .guide.xz and guides inside .zip archives, read without
+# extracting them. A guide in an archive is named by the path of the archive followed by the
+# path inside it, e.g. "docs.zip/sub/Other.guide". zipfile and lzma are imported where they are
+# needed, importing zipfile alone takes about a sixth of the startup time of the viewer.
+
+COMPRESSED_EXTENSIONS = ('.gz', '.xz')
+ARCHIVE_EXTENSION = '.zip'
+# Distance of the seek points recorded in gzip files and deflated zip members, in uncompressed
+# bytes. Reading a node decompresses at most this much data in front of it; every seek point
+# keeps a copy of the decompressor, about 40 KB.
+SEEK_POINT_SPACING = 1024 * 1024
+# Compressed bytes fed to a decompressor at a time, and the most uncompressed bytes taken out
+INPUT_CHUNK = 64 * 1024
+OUTPUT_CHUNK = 256 * 1024
+# Reading a node of an xz file decompresses its block up to the node, so files with larger blocks
+# are decompressed into memory as a whole instead
+XZ_BLOCK_LIMIT = 8 * 1024 * 1024
+
+GZIP_MAGIC = b'\x1f\x8b'
+XZ_MAGIC = b'\xfd7zXZ\x00'
+XZ_FOOTER_MAGIC = b'YZ'
+# Fixed part of a local file header of a zip archive, up to the lengths of the name and extra field
+ZIP_LOCAL_HEADER = struct.Struct('<4s22xHH')
+
+
+def split_archive_path(file_path):
+    """Splits "dir/docs.zip/sub/Other.guide" into the archive and the name inside it, or returns (None, None)."""
+    lower = file_path.lower()
+    index = lower.find(ARCHIVE_EXTENSION)
+    while index >= 0:
+        end = index + len(ARCHIVE_EXTENSION)
+        if end < len(file_path) and file_path[end] in '/\\' and os.path.isfile(file_path[:end]):
+            return file_path[:end], file_path[end + 1:].replace('\\', '/')
+        index = lower.find(ARCHIVE_EXTENSION, end)
+    return None, None
+
+
+def is_archived(file_path):
+    """Returns whether a guide is read from a compressed file or an archive instead of being mapped as it is."""
+    return file_path.lower().endswith(COMPRESSED_EXTENSIONS) or split_archive_path(file_path)[0] is not None
+
+
+def guide_stat(file_path):
+    """Returns os.stat() of a guide file, or of the archive it is in."""
+    archive_path, _ = split_archive_path(file_path)
+    return os.stat(archive_path or file_path)
+
+
+def guide_path(file_path):
+    """Returns the path of the guide a file stands for; a .zip archive stands for the main guide in it.
+
+    That is the guide named like the archive, or else the one closest to its root.
+    """
+    if not (file_path.lower().endswith(ARCHIVE_EXTENSION) and os.path.isfile(file_path)):
+        return file_path
+    names = archive_guides(file_path)
+    if not names:
+        raise FileNotFoundError(f"No guide in {file_path}")
+    stem = os.path.splitext(os.path.basename(file_path))[0].lower()
+    names.sort(key=lambda name: (posixpath.basename(name).lower().split('.')[0] != stem, name.count('/'), name.lower()))
+    return os.path.join(file_path, names[0])
+
+
+def archive_guides(archive_path):
+    """Returns the names of the guides in a zip archive, compressed ones included, in archive order."""
+    import zipfile
+    with zipfile.ZipFile(archive_path) as archive:
+        return [info.filename for info in archive.infolist()
+                if not info.is_dir() and info.filename.lower().endswith(('.guide',) + tuple(f".guide{extension}" for extension in COMPRESSED_EXTENSIONS))]
+
+
+def find_member(archive_path, name):
+    """Returns the name of a file in a zip archive, matched case-insensitively like on the Amiga, or None."""
+    import zipfile
+    with zipfile.ZipFile(archive_path) as archive:
+        return _match_member(archive.namelist(), name)
+
+
+def _match_member(names, name):
+    name = posixpath.normpath(name.replace('\\', '/')).lstrip('/')
+    if name in names:
+        return name
+    return next((member for member in names if member.lower() == name.lower()), None)
+
+
+def _map_file(file_path):
+    with open(file_path, 'rb') as file:
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def open_stream(file_path):
+    """Opens a compressed or archived guide for random access to its uncompressed data."""
+    archive_path, name = split_archive_path(file_path)
+    if archive_path:
+        return _open_member(archive_path, name)
+    data = _map_file(file_path)
+    try:
+        if file_path.lower().endswith('.gz'):
+            return DeflateStream(data, 0, len(data), 16 + zlib.MAX_WBITS)
+        import lzma
+        try:
+            stream = XzStream(data)
+        except (ValueError, IndexError, struct.error, lzma.LZMAError):
+            # Unusual filters or a damaged index
+            stream = None
+        if stream is None or stream.block_size > XZ_BLOCK_LIMIT:
+            data.close()
+            return BufferStream(lambda: _read_xz(file_path))
+        return stream
+    except BaseException:
+        data.close()
+        raise
+
+
+def _open_member(archive_path, name):
+    """Opens a file in a zip archive: stored ones are read in place, deflated ones through seek points."""
+    import zipfile
+    with zipfile.ZipFile(archive_path) as archive:
+        member = _match_member(archive.namelist(), name)
+        if member is None:
+            raise FileNotFoundError(f"{name} is not in {archive_path}")
+        info = archive.getinfo(member)
+        if info.flag_bits & 0x1:
+            raise ValueError(f"{member} in {archive_path} is encrypted")
+        if member.lower().endswith(COMPRESSED_EXTENSIONS):
+            # A compressed guide in the archive, decompressed twice over
+            return BufferStream(lambda: _decompress(member, _read_member(archive_path, member)))
+        if info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            return BufferStream(lambda: _read_member(archive_path, member))
+    data = _map_file(archive_path)
+    try:
+        signature, name_length, extra_length = ZIP_LOCAL_HEADER.unpack_from(data, info.header_offset)
+        if signature != b'PK\x03\x04':
+            raise zipfile.BadZipFile(f"Bad local header of {member} in {archive_path}")
+        offset = info.header_offset + ZIP_LOCAL_HEADER.size + name_length + extra_length
+        if info.compress_type == zipfile.ZIP_STORED:
+            return MappedStream(data, offset, info.file_size)
+        return DeflateStream(data, offset, info.compress_size, -zlib.MAX_WBITS)
+    except BaseException:
+        data.close()
+        raise
+
+
+def _read_xz(file_path):
+    import lzma
+    with lzma.open(file_path) as file:
+        return file.read()
+
+
+def _decompress(name, data):
+    if name.lower().endswith('.gz'):
+        import gzip
+        return gzip.decompress(data)
+    import lzma
+    return lzma.decompress(data)
+
+
+def _read_member(archive_path, member):
+    import zipfile
+    with zipfile.ZipFile(archive_path) as archive:
+        return archive.read(member)
+
+
+class BufferStream:
+    """A guide decompressed into memory as a whole, for formats without seek points.
+
+    It is decompressed on first use, which usually is the scan in a worker thread of the viewer.
+    """
+
+    def __init__(self, load):
+        self._load = load  # Returns the uncompressed data
+        self._data = None
+        self._lock = threading.Lock()
+
+    def _buffer(self):
+        with self._lock:
+            if self._data is None:
+                self._data = self._load()
+                self._load = None
+            return self._data
+
+    def read(self, start, end):
+        """Returns the uncompressed bytes from start to end."""
+        return self._buffer()[start:end]
+
+    def read_all(self):
+        """Returns all of the uncompressed data."""
+        return self._buffer()
+
+    def close(self):
+        self._data = b""
+
+
+class MappedStream:
+    """A file stored uncompressed in a zip archive, read from the mapped archive."""
+
+    def __init__(self, data, offset, length):
+        self._data = data
+        self._offset = offset
+        self._length = length
+
+    def read(self, start, end):
+        """Returns the bytes from start to end."""
+        return self._data[self._offset + start:self._offset + min(end, self._length)]
+
+    def read_all(self):
+        """Returns a copy of the whole file, for scanning it."""
+        return self._data[self._offset:self._offset + self._length]
+
+    def close(self):
+        self._data.close()
+
+
+class StreamCursor:
+    """Position of a decompressor in the compressed and the uncompressed data."""
+    __slots__ = ('decompressor', 'in_pos', 'in_end', 'out_pos', 'last', 'block')
+
+    def __init__(self, decompressor, in_pos, out_pos, in_end=None, block=0):
+        self.decompressor = decompressor
+        self.in_pos = in_pos  # Next compressed byte to feed
+        self.in_end = in_end
+        self.out_pos = out_pos  # Uncompressed offset after the last output
+        self.last = b""  # The last output, ending at out_pos
+        self.block = block
+
+
+class SeekableStream:
+    """Random access to the uncompressed data of a compressed file, through seek points.
+
+    A read starts at the seek point before the range, or continues where the previous read
+    stopped if that is closer, so reading the nodes in file order decompresses the file once.
+    Subclasses provide the seek points and step the decompressor. Reads may come from several
+    threads.
+    """
+
+    def __init__(self, data):
+        self._data = data  # Memory map of the compressed file
+        self._lock = threading.Lock()
+        self._positions = []  # Uncompressed offsets of the seek points
+        self._cursor = None  # Where the previous read stopped
+
+    def read(self, start, end):
+        """Returns the uncompressed bytes from start to end."""
+        with self._lock:
+            index = bisect.bisect_right(self._positions, start) - 1
+            point = self._positions[index] if index >= 0 else 0
+            cursor = self._cursor
+            if cursor is None or not point <= cursor.out_pos - len(cursor.last) <= start:
+                cursor = self._seek(index)
+            result = bytearray()
+            while True:
+                last_start = cursor.out_pos - len(cursor.last)
+                if cursor.out_pos > start:
+                    result += cursor.last[max(0, start - last_start):end - last_start]
+                if cursor.out_pos >= end or not self._step(cursor):
+                    break
+            self._cursor = cursor
+            return result
+
+    def read_all(self):
+        """Decompresses the whole file, e.g. for scanning it, recording the seek points on the way."""
+        return self.read(0, sys.maxsize)
+
+    def close(self):
+        self._cursor = None
+        self._data.close()
+
+
+class DeflateStream(SeekableStream):
+    """A gzip file or a deflated file in a zip archive.
+
+    Seek points are recorded every SEEK_POINT_SPACING bytes while it is read, as copies of the
+    decompressor, so only the first read of a part of the file decompresses everything before it.
+    """
+
+    def __init__(self, data, offset, length, wbits):
+        super().__init__(data)
+        self._end = offset + length
+        self._wbits = wbits
+        self._points = [(offset, zlib.decompressobj(wbits))]  # (compressed offset, decompressor) per seek point
+        self._positions.append(0)
+
+    def _seek(self, index):
+        in_pos, decompressor = self._points[index]
+        return StreamCursor(decompressor.copy(), in_pos, self._positions[index])
+
+    def _step(self, cursor):
+        """Decompresses the next piece into cursor.last; returns False at the end of the data."""
+        decompressor = cursor.decompressor
+        if decompressor.eof:
+            # A gzip file can hold several members, padded with null bytes
+            pos = cursor.in_pos
+            while pos < self._end and self._data[pos] == 0:
+                pos += 1
+            if self._wbits < 0 or self._data[pos:pos + 2] != GZIP_MAGIC:
+                return False
+            decompressor = cursor.decompressor = zlib.decompressobj(self._wbits)
+            cursor.in_pos = pos
+        chunk = self._data[cursor.in_pos:min(cursor.in_pos + INPUT_CHUNK, self._end)]
+        output = decompressor.decompress(chunk, OUTPUT_CHUNK)
+        # At the end of a member the rest of the input is in both unused_data and unconsumed_tail
+        consumed = len(chunk) - len(decompressor.unused_data if decompressor.eof else decompressor.unconsumed_tail)
+        if not output and not consumed and not decompressor.eof:
+            return False  # Truncated
+        cursor.in_pos += consumed
+        cursor.out_pos += len(output)
+        cursor.last = output
+        if cursor.out_pos >= self._positions[-1] + SEEK_POINT_SPACING:
+            self._positions.append(cursor.out_pos)
+            self._points.append((cursor.in_pos, decompressor.copy()))
+        return True
+
+
+def _xz_varint(data, pos):
+    """Reads a variable-length integer of the xz format; returns it and the position after it."""
+    value = 0
+    for shift in range(0, 63, 7):
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+    raise ValueError("Bad number in xz file")
+
+
+def _xz_blocks(data):
+    """Returns (compressed offset, unpadded size, uncompressed size, check size) of every block of an xz file.
+
+    They are read from the indexes at the end of its streams, the file is not decompressed.
+    """
+    blocks = []
+    end = len(data)
+    while end > 0:
+        # Streams can be followed by padding of null bytes
+        while end >= 4 and data[end - 4:end] == b"\0\0\0\0":
+            end -= 4
+        if end < 24 or data[end - 2:end] != XZ_FOOTER_MAGIC:
+            raise ValueError("Not an xz file")
+        index_size = (struct.unpack_from('<I', data, end - 8)[0] + 1) * 4
+        check_type = data[end - 3] & 0x0F
+        check_size = 0 if check_type == 0 else 4 << ((check_type - 1) // 3)
+        index_start = end - 12 - index_size
+        if index_start < 12 or data[index_start] != 0:
+            raise ValueError("Bad xz index")
+        count, pos = _xz_varint(data, index_start + 1)
+        records = []
+        for _ in range(count):
+            unpadded, pos = _xz_varint(data, pos)
+            uncompressed, pos = _xz_varint(data, pos)
+            records.append((unpadded, uncompressed))
+        stream_start = index_start - sum((unpadded + 3) & ~3 for unpadded, _ in records) - 12
+        if stream_start < 0 or data[stream_start:stream_start + len(XZ_MAGIC)] != XZ_MAGIC:
+            raise ValueError("Bad xz index")
+        offset = stream_start + 12
+        stream_blocks = []
+        for unpadded, uncompressed in records:
+            stream_blocks.append((offset, unpadded, uncompressed, check_size))
+            offset += (unpadded + 3) & ~3
+        blocks[:0] = stream_blocks
+        end = stream_start
+    return blocks
+
+
+def _xz_filters(data, offset):
+    """Reads the header of an xz block; returns its size and the filter chain for lzma.LZMADecompressor."""
+    import lzma
+    header_size = (data[offset] + 1) * 4
+    flags = data[offset + 1]
+    pos = offset + 2
+    if flags & 0x40:
+        _, pos = _xz_varint(data, pos)  # Compressed size, known from the index
+    if flags & 0x80:
+        _, pos = _xz_varint(data, pos)  # Uncompressed size
+    filters = []
+    for _ in range((flags & 0x03) + 1):
+        filter_id, pos = _xz_varint(data, pos)
+        size, pos = _xz_varint(data, pos)
+        properties = data[pos:pos + size]
+        pos += size
+        if filter_id == lzma.FILTER_LZMA2 and size == 1 and properties[0] <= 40:
+            bits = properties[0]
+            dict_size = 0xFFFFFFFF if bits == 40 else (2 | (bits & 1)) << (bits // 2 + 11)
+            filters.append({'id': filter_id, 'dict_size': dict_size})
+        elif filter_id == lzma.FILTER_DELTA and size == 1:
+            filters.append({'id': filter_id, 'dist': properties[0] + 1})
+        else:
+            raise ValueError(f"Unsupported xz filter {filter_id:#x}")
+    return header_size, filters
+
+
+class XzStream(SeekableStream):
+    """An xz file, with a seek point at every block listed in its index.
+
+    xz writes several blocks when compressing with threads (-T0) or --block-size; a file of a single
+    block is read from its start, or from where the previous read stopped.
+    """
+
+    def __init__(self, data):
+        super().__init__(data)
+        self._blocks = _xz_blocks(data)
+        self.block_size = max((uncompressed for _, _, uncompressed, _ in self._blocks), default=0)
+        # Filter chains are checked here, so that an unsupported one is noticed on opening
+        for offset, _, _, _ in self._blocks:
+            _xz_filters(data, offset)
+        position = 0
+        for _, _, uncompressed, _ in self._blocks:
+            self._positions.append(position)
+            position += uncompressed
+
+    def _seek(self, index):
+        # The block is opened by the first step
+        return StreamCursor(None, 0, self._positions[index] if index >= 0 else 0, block=max(index, 0) - 1)
+
+    def _step(self, cursor):
+        """Decompresses the next piece into cursor.last; returns False at the end of the data."""
+        import lzma
+        while cursor.decompressor is None or cursor.decompressor.eof:
+            if cursor.block + 1 >= len(self._blocks):
+                return False
+            cursor.block += 1
+            offset, unpadded, _, check_size = self._blocks[cursor.block]
+            header_size, filters = _xz_filters(self._data, offset)
+            cursor.decompressor = lzma.LZMADecompressor(lzma.FORMAT_RAW, filters=filters)
+            cursor.in_pos = offset + header_size
+            cursor.in_end = offset + unpadded - check_size
+        decompressor = cursor.decompressor
+        chunk = b""
+        if decompressor.needs_input:
+            chunk = self._data[cursor.in_pos:min(cursor.in_pos + INPUT_CHUNK, cursor.in_end)]
+            if not chunk:
+                return False  # Truncated
+            cursor.in_pos += len(chunk)
+        output = decompressor.decompress(chunk, OUTPUT_CHUNK)
+        cursor.out_pos += len(output)
+        cursor.last = output
+        return True
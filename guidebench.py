@@ -0,0 +1,1279 @@
+import argparse
+import binascii
+import collections
+import contextlib
+import gzip
+import io
+import itertools
+import json
+import lzma
+import os
+import platform
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tkinter
+import tkinter.constants
+import tracemalloc
+import types
+import warnings
+import wave
+import zipfile
+
+import guideparser
+from guidearchive import split_archive_path
+from guideparser import GuideIndex, LinkGraph, read_index, tokenize, parse_node_text, uudecode, EMOJI_MAPPING, TEXT, STYLE, LINK, BINARY
+from guidecache import GuideDatabase
+from guidepack import GuidePack, compile_pack
+from guideprofile import Profiler
+from guidesearch import SearchIndex
+
+# Guideview by Zeittresor
+# Benchmarks for the parsing side of the viewer, run e.g. with "python guidebench.py tokenize".
+
+
+def make_node_body(size):
+    """Builds a format-heavy node body of roughly the given number of characters."""
+    chunk = (
+        'Plain text with @{b}bold@{ub} and @{u}underlined@{uu} words, '
+        '@{"a link" link "TARGET" 0} and some more text.\n'
+    )
+    return chunk * max(1, size // len(chunk))
+
+
+def best_time(func, repeat):
+    """Returns the fastest of several runs of func in seconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def bench_tokenize(sizes, repeat):
+    """Times tokenize() on growing node bodies; the time per character should stay flat."""
+    print(f"{'chars':>10} {'tokens':>8} {'ms':>10} {'ns/char':>8}")
+    for size in sizes:
+        body = make_node_body(size)
+        tokens = tokenize(body)
+        elapsed = best_time(lambda: tokenize(body), repeat)
+        print(f"{len(body):>10} {len(tokens):>8} {elapsed * 1000:>10.2f} {elapsed * 1e9 / len(body):>8.1f}")
+
+
+def uuencode(data, filename):
+    """Returns data as a uuencoded block."""
+    lines = [f"begin 644 {filename}\n".encode('latin-1')]
+    lines.extend(binascii.b2a_uu(data[i:i + 45]) for i in range(0, len(data), 45))
+    lines.append(b"`\nend\n")
+    return b"".join(lines)
+
+
+def make_uu_block(size, filename="payload.bin"):
+    """Returns a uuencoded block holding size random bytes."""
+    data = os.urandom(size)
+    return data, uuencode(data, filename)
+
+
+def legacy_uudecode(block):
+    """The previous decoder based on the uu module, for comparison."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        import uu
+    out_file = io.BytesIO()
+    uu.decode(io.BytesIO(block), out_file, quiet=True)
+    return out_file.getvalue()
+
+
+def bench_uudecode(sizes, repeat):
+    """Compares uudecode() throughput against the uu module on multi-MB payloads."""
+    try:
+        legacy_uudecode(make_uu_block(45)[1])
+        has_legacy = True
+    except ImportError:
+        # The uu module is gone since Python 3.13
+        has_legacy = False
+
+    print(f"uudecode NumPy path: {'on' if guideparser.load_numpy() is not None else 'off'}")
+    print(f"{'MB':>8} {'new MB/s':>10} {'uu MB/s':>10} {'speedup':>8}")
+    for size in sizes:
+        data, block = make_uu_block(size)
+        assert uudecode(block) == data
+        mb = size / (1024 * 1024)
+        new_rate = mb / best_time(lambda: uudecode(block), repeat)
+        if has_legacy:
+            legacy_rate = mb / best_time(lambda: legacy_uudecode(block), repeat)
+            print(f"{mb:>8.1f} {new_rate:>10.1f} {legacy_rate:>10.1f} {new_rate / legacy_rate:>7.1f}x")
+        else:
+            print(f"{mb:>8.1f} {new_rate:>10.1f} {'-':>10} {'-':>8}")
+
+
+def legacy_replace_ascii_emojis(text):
+    """The previous emoji replacement: two re.sub passes and one str.replace per emoji."""
+    text = re.sub(r'(?m)^\s*o\s+', '📌 ', text)
+    text = re.sub(r'(?m)^\s*-\s+', '• ', text)
+    for ascii_emoji, unicode_emoji in EMOJI_MAPPING.items():
+        text = text.replace(ascii_emoji, unicode_emoji)
+    return text
+
+
+def bench_emoji(sizes, image_size, repeat):
+    """Compares the old whole-node emoji replacement plus tokenizing with the single-pass version."""
+    print(f"{'chars':>10} {'old ms':>10} {'new ms':>10} {'speedup':>8}")
+    for size in sizes:
+        text = make_node_body(size // 2).replace("words,", "words :-) ;)\n o item\n - item\n")
+        body = text + make_uu_block(image_size, "picture.jpg")[1].decode('latin-1') + text
+        old_time = best_time(lambda: tokenize(legacy_replace_ascii_emojis(body)), repeat)
+        new_time = best_time(lambda: parse_node_text(body), repeat)
+        print(f"{len(body):>10} {old_time * 1000:>10.2f} {new_time * 1000:>10.2f} {old_time / new_time:>7.1f}x")
+
+
+def make_words(count, rng):
+    """Returns a vocabulary of random lowercase words."""
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(count)]
+
+
+def bench_search(node_count, words_per_node, queries, seed):
+    """Builds a search index over synthetic nodes and reports build time and query latency."""
+    rng = random.Random(seed)
+    vocabulary = make_words(20_000, rng)
+    # Zipf-like word frequencies, like natural text
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+    nodes = []
+    for number in range(node_count):
+        words = rng.choices(vocabulary, cum_weights=cum_weights, k=words_per_node)
+        body = " ".join(words[:20]) + " @{b}" + " ".join(words[20:]) + "@{ub}"
+        nodes.append((f"NODE{number}", " ".join(words[:3]), body))
+
+    index = SearchIndex()
+    start = time.perf_counter()
+    for node_name, title, body in nodes:
+        index.add_node(node_name, title, body)
+    build_time = time.perf_counter() - start
+    print(f"indexed {node_count} nodes in {build_time:.2f} s ({node_count / build_time:.0f} nodes/s)")
+
+    for term_count in (1, 2, 3):
+        latencies = []
+        hits = 0
+        for _ in range(queries):
+            query = " ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=term_count))
+            start = time.perf_counter()
+            results = index.search(query)
+            latencies.append(time.perf_counter() - start)
+            hits += bool(results)
+        latencies.sort()
+        print(f"{term_count}-word queries: median {statistics.median(latencies) * 1000:.2f} ms, "
+              f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.2f} ms, {hits}/{queries} with results")
+
+    # What reloading the guide after an edit of every node does on the Tk thread
+    start = time.perf_counter()
+    for node_name, _, _ in nodes:
+        index.remove_node(node_name)
+    remove_time = time.perf_counter() - start
+    print(f"removed {node_count} nodes in {remove_time * 1000:.1f} ms ({remove_time / node_count * 1e6:.1f} us per node)")
+
+
+def bench_image(sizes, width, repeat):
+    """Compares decoding embedded JPEGs at full size with decoding them scaled to the display width."""
+    from PIL import Image
+    from Guideview import fit_image
+
+    print(f"{'image':>11} {'full ms':>9} {'full MB':>8} {'fit ms':>8} {'fit MB':>7} {'speedup':>8}")
+    for size in sizes:
+        image_width, image_height = size, size * 2 // 3
+        picture = Image.effect_mandelbrot((image_width, image_height), (-2, -1.5, 1, 1.5), 50).convert('RGB')
+        buffer = io.BytesIO()
+        picture.save(buffer, format='JPEG', quality=90)
+        data = buffer.getvalue()
+
+        def full():
+            image = Image.open(io.BytesIO(data))
+            image.load()
+            return image
+
+        def fit():
+            return fit_image(Image.open(io.BytesIO(data)), (width, image_height))
+
+        full_time = best_time(full, repeat)
+        fit_time = best_time(fit, repeat)
+        # Tk keeps four bytes per pixel of a PhotoImage
+        full_mb = image_width * image_height * 4 / (1024 * 1024)
+        fitted = fit()
+        fit_mb = fitted.width * fitted.height * 4 / (1024 * 1024)
+        print(f"{image_width:>5}x{image_height:<5} {full_time * 1000:>9.1f} {full_mb:>8.1f} "
+              f"{fit_time * 1000:>8.1f} {fit_mb:>7.1f} {full_time / fit_time:>7.1f}x")
+
+
+def import_times(module):
+    """Imports a module in a fresh interpreter with -X importtime; returns {module: (self us, cumulative us)}."""
+    code = f"import {module}, sys; print(' '.join(sorted(sys.modules)))"
+    # Run next to the viewer's modules, so that the benchmark works from any directory
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times, set(result.stdout.split())
+
+
+def bench_startup(module, repeat, target_ms, top):
+    """Reports the cold import time of the viewer and its heaviest imports, like python -X importtime.
+
+    Returns False if the best import time is above target_ms.
+    """
+    runs = [import_times(module) for _ in range(repeat)]
+    times, loaded = min(runs, key=lambda run: run[0][module][1])
+    total_ms = times[module][1] / 1000
+    print(f"import {module}: {total_ms:.1f} ms (best of {repeat}, target {target_ms} ms)")
+    print(f"{'self ms':>8} {'total ms':>9}  module")
+    for name, (self_us, cumulative_us) in sorted(times.items(), key=lambda item: -item[1][1])[:top]:
+        print(f"{self_us / 1000:>8.1f} {cumulative_us / 1000:>9.1f}  {name}")
+    deferred = [name for name in ("PIL", "pygame", "numpy") if name in loaded]
+    if deferred:
+        print(f"imported at startup although only needed for media: {', '.join(deferred)}")
+    return total_ms <= target_ms
+
+
+def make_jpeg(width):
+    """Returns a JPEG of the given width with a 3:2 aspect ratio."""
+    from PIL import Image
+
+    picture = Image.effect_mandelbrot((width, width * 2 // 3), (-2, -1.5, 1, 1.5), 50).convert('RGB')
+    buffer = io.BytesIO()
+    picture.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def make_wav(seconds):
+    """Returns a WAV file of silence."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as file:
+        file.setnchannels(1)
+        file.setsampwidth(2)
+        file.setframerate(22050)
+        file.writeframes(b"\0\0" * int(22050 * seconds))
+    return buffer.getvalue()
+
+
+def node_name(number):
+    return "MAIN" if number == 0 else f"NODE{number}"
+
+
+def make_guide(path, nodes=200, node_chars=4000, links=5, images=10, image_width=1024, audio=0, audio_seconds=2, seed=1):
+    """Writes a synthetic guide; the same arguments always give the same file.
+
+    Nodes hold formatted text with bullets and emojis and links to random nodes; images are
+    embedded in randomly chosen nodes and audio in the first nodes, starting with MAIN.
+    """
+    rng = random.Random(seed)
+    vocabulary = make_words(2000, rng)
+    image_block = uuencode(make_jpeg(image_width), "picture.jpg").decode('latin-1') if images else ""
+    audio_block = uuencode(make_wav(audio_seconds), "music.wav").decode('latin-1') if audio else ""
+    image_nodes = set(rng.sample(range(nodes), min(images, nodes)))
+
+    with open(path, 'w', encoding='latin-1', newline='\n') as file:
+        file.write('@database "synthetic.guide"\n@author "guidebench"\n')
+        for number in range(nodes):
+            lines = []
+            length = 0
+            while length < node_chars:
+                words = rng.choices(vocabulary, k=10)
+                kind = rng.random()
+                if kind < 0.1:
+                    line = f"@{{b}}{' '.join(words[:3])}@{{ub}} {' '.join(words[3:])}"
+                elif kind < 0.15:
+                    line = f" o {' '.join(words)}"
+                elif kind < 0.2:
+                    line = f"{' '.join(words)} :-)"
+                else:
+                    line = " ".join(words)
+                lines.append(line)
+                length += len(line) + 1
+            for _ in range(links):
+                position = rng.randrange(len(lines))
+                lines[position] += f' @{{"{rng.choice(vocabulary)}" link "{node_name(rng.randrange(nodes))}" 0}}'
+            if number in image_nodes:
+                lines.insert(len(lines) // 2, image_block)
+            if number < audio:
+                lines.insert(0, audio_block)
+            file.write(f'@node "{node_name(number)}" "Node {number}"\n')
+            file.write("\n".join(lines))
+            file.write("\n@endnode\n")
+
+
+class DummyWidget:
+    """Stands in for any Tk widget without a display: accepts every method call and counts it.
+
+    The counts approximate the Tcl commands the viewer would issue.
+    """
+    calls = collections.Counter()
+
+    def __init__(self, *args, **kwargs):
+        DummyWidget.calls['create'] += 1
+
+    def __getattr__(self, name):
+        def method(*args, **kwargs):
+            DummyWidget.calls[name] += 1
+        return method
+
+
+class DummyText(DummyWidget):
+    """Text widget of the dummy Tk layer, keeping track of the number of characters inserted."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self.length = 0
+
+    def insert(self, index, chars, *args):
+        # args are the tags of chars, then further chars and tags
+        DummyWidget.calls['insert'] += 1
+        self.length += len(chars) + sum(len(more) for more in args[1::2])
+
+    def delete(self, start, end=None):
+        DummyWidget.calls['delete'] += 1
+        if str(start) in ('1.0', '1'):
+            self.length = 0
+
+    def index(self, index):
+        DummyWidget.calls['index'] += 1
+        return f"1.{self.length}"
+
+    def tag_ranges(self, tag_name):
+        DummyWidget.calls['tag_ranges'] += 1
+        return ()
+
+    def tag_names(self, index=None):
+        DummyWidget.calls['tag_names'] += 1
+        return ()
+
+    def search(self, *args, **kwargs):
+        DummyWidget.calls['search'] += 1
+        return ""
+
+    def winfo_width(self):
+        return 800
+
+    def winfo_reqwidth(self):
+        return 800
+
+
+class DummyRoot(DummyWidget):
+    """Tk root of the dummy Tk layer; after() callbacks run once they are due while settle() is running."""
+
+    def __init__(self):
+        super().__init__()
+        self.scheduled = {}
+        self.next_id = 0
+
+    def after(self, delay_ms, func=None, *args):
+        self.next_id += 1
+        self.scheduled[self.next_id] = (time.perf_counter() + delay_ms / 1000, func, args)
+        return self.next_id
+
+    def after_idle(self, func, *args):
+        return self.after(0, func, *args)
+
+    def after_cancel(self, after_id):
+        self.scheduled.pop(after_id, None)
+
+    def settle(self, viewer, until=None):
+        """Runs scheduled callbacks until no callbacks and no background jobs are left, or until until() is true."""
+        while (self.scheduled or viewer.background_jobs) and not (until and until()):
+            if not self.scheduled:
+                time.sleep(0.001)
+                continue
+            after_id = min(self.scheduled, key=lambda scheduled_id: self.scheduled[scheduled_id][0])
+            due, func, args = self.scheduled[after_id]
+            if due > time.perf_counter():
+                time.sleep(max(0, min(due - time.perf_counter(), 0.001)))
+                continue
+            del self.scheduled[after_id]
+            func(*args)
+
+
+class DummyPhotoImage:
+    """PhotoImage of the dummy Tk layer, keeps only the size."""
+
+    def __init__(self, image):
+        self._size = image.size
+
+    def width(self):
+        return self._size[0]
+
+    def height(self):
+        return self._size[1]
+
+
+def dummy_tk_layer():
+    """Returns a stand-in for the tkinter module with the constants of the real one."""
+    layer = types.SimpleNamespace(**{name: getattr(tkinter.constants, name) for name in dir(tkinter.constants) if name.isupper()})
+    for widget in ('Frame', 'Button', 'Scrollbar', 'Menu', 'Toplevel', 'Listbox', 'Entry', 'Label', 'IntVar', 'BooleanVar'):
+        setattr(layer, widget, DummyWidget)
+    layer.Text = DummyText
+    return layer
+
+
+class CountingTcl:
+    """Wraps the Tcl interpreter of a real Tk widget and counts its commands in DummyWidget.calls."""
+
+    def __init__(self, interpreter):
+        self._interpreter = interpreter
+
+    def call(self, *args):
+        DummyWidget.calls[str(args[1]) if len(args) > 1 else str(args[0])] += 1
+        return self._interpreter.call(*args)
+
+    def __getattr__(self, name):
+        return getattr(self._interpreter, name)
+
+
+@contextlib.contextmanager
+def render_viewer(cache_root):
+    """Yields a viewer on a hidden Tk window, or on the dummy Tk layer without a display, and the name of the layer."""
+    try:
+        root = tkinter.Tk()
+    except tkinter.TclError:
+        with dummy_viewer(cache_root) as (viewer, _):
+            yield viewer, "dummy Tk layer, no display"
+        return
+    import Guideview
+
+    root.withdraw()
+    viewer = Guideview.AmigaGuideViewer(root)
+    viewer.guides = GuideDatabase(Guideview.OPEN_GUIDES_BYTES, cache_root)
+    viewer.text.tk = CountingTcl(viewer.text.tk)
+    DummyWidget.calls.clear()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield viewer, f"Tk {root.tk.call('info', 'patchlevel')}"
+    finally:
+        viewer.decoder.shutdown(wait=True, cancel_futures=True)
+        viewer.guides.close()
+        root.destroy()
+
+
+def legacy_render(viewer, tokens):
+    """The previous renderer: one insert per text token and two per link, for comparison."""
+    viewer.text.delete('1.0', tkinter.END)
+    viewer.link_targets = []
+    stack = []
+    for token in tokens:
+        kind = token[0]
+        if kind == TEXT:
+            if stack:
+                viewer.text.insert(tkinter.END, token[1], tuple(stack))
+            else:
+                viewer.text.insert(tkinter.END, token[1])
+        elif kind == STYLE:
+            if token[2]:
+                stack.append(token[1])
+            elif token[1] in stack:
+                stack.remove(token[1])
+        elif kind == LINK:
+            tags = tuple(stack)
+            viewer.text.insert(tkinter.END, token[1], viewer.link_tags(token[2], tags))
+            viewer.text.insert(tkinter.END, " ", tags)
+
+
+def batched_render(viewer, parsed):
+    """Renders a whole node with the viewer's chunked, batched renderer."""
+    viewer.insert_content_with_formatting(parsed)
+    while viewer.render_index < len(parsed.tokens):
+        viewer.render_chunk(parsed)
+
+
+def bench_render(sizes, repeat):
+    """Counts the Tcl commands and times rendering format-heavy nodes, one insert per run against batched inserts.
+
+    Also checks that a long text-only node, a single text run, is not inserted in one piece; returns whether it is not.
+    """
+    import Guideview
+
+    source = types.SimpleNamespace(key=("bench.guide", 0, 0), file_path="bench.guide", disk_cache=None)
+    rows = []
+    with tempfile.TemporaryDirectory() as directory, render_viewer(directory) as (viewer, layer):
+        for size in sizes:
+            body = make_node_body(size)
+            parsed = Guideview.ParsedNode(source, "BENCH", parse_node_text(body))
+            row = [len(body), len(parsed.tokens)]
+            for render in (lambda: legacy_render(viewer, parsed.tokens), lambda: batched_render(viewer, parsed)):
+                DummyWidget.calls.clear()
+                render()
+                calls = DummyWidget.calls['insert']
+                elapsed = best_time(render, repeat)
+                row += [calls, elapsed]
+            rows.append(row)
+
+        line = "Plain text without any formatting, as in a long README or log file.\n"
+        body = line * (1_000_000 // len(line))
+        parsed = Guideview.ParsedNode(source, "TEXT", parse_node_text(body))
+        inserted = []  # Characters per insert
+        insert = viewer.text.insert
+
+        def counting_insert(index, chars, *args):
+            inserted.append(len(chars) + sum(len(more) for more in args[1::2]))
+            return insert(index, chars, *args)
+
+        viewer.text.insert = counting_insert
+        batched_render(viewer, parsed)
+        del viewer.text.insert
+    print(f"Rendering on the {layer}")
+    print(f"{'chars':>10} {'tokens':>8} {'old inserts':>12} {'old ms':>9} {'new inserts':>12} {'new ms':>9} {'speedup':>8}")
+    for chars, tokens, old_calls, old_time, new_calls, new_time in rows:
+        print(f"{chars:>10} {tokens:>8} {old_calls:>12} {old_time * 1000:>9.1f} {new_calls:>12} {new_time * 1000:>9.1f} "
+              f"{old_time / new_time:>7.1f}x")
+    passed = max(inserted) <= Guideview.RENDER_CHUNK_CHARS
+    print(f"\nText-only node of {len(body)} chars in {len(parsed.tokens)} token(s): "
+          f"{len(inserted)} inserts of at most {max(inserted)} chars")
+    print("OK" if passed else f"FAIL: inserts of more than {Guideview.RENDER_CHUNK_CHARS} chars")
+    return passed
+
+
+def malformed_guides(size, rng):
+    """Returns (name, data) of malformed guides of roughly size bytes, each aimed at a way a parser can backtrack."""
+    valid = io.StringIO()
+    body = make_node_body(2000) + uuencode(b"\0" * 400, "picture.jpg").decode('latin-1')
+    for number in range(max(1, size // 2200)):
+        valid.write(f'@node "{node_name(number)}" "Node {number}"\n{body}\n@endnode\n')
+    valid = bytearray(valid.getvalue().encode('latin-1'))
+    # Corrupted download: slices cut out, repeated and overwritten with markup
+    markup = [b'@node "', b'@endnode', b'@{"', b'" link "', b'begin 644 x.jpg\n', b'\nend\n', b'"', b'\n']
+    for _ in range(max(1, size // 500)):
+        position = rng.randrange(len(valid))
+        action = rng.random()
+        if action < 0.3:
+            del valid[position:position + rng.randrange(1, 200)]
+        elif action < 0.6:
+            valid[position:position] = valid[position:position + rng.randrange(1, 200)]
+        else:
+            valid[position:position] = rng.choice(markup)
+
+    header = b'@node "N" "T"\n'
+    return [
+        ("unterminated node names", b'@node "name\n' * (size // 12)),
+        ("missing @endnode", b''.join(b'@node "N%d" "T"\ntext\n' % number for number in range(size // 24))),
+        ("nodes without @endnode after a valid one",
+         header + b'@endnode\n' + b''.join(b'@node "N%d" "T"\n' % number for number in range(size // 19))),
+        ("unterminated uu blocks", header + b'begin 644 a.jpg\nM\n' * (size // 18) + b'@endnode\n'),
+        ("unterminated links", header + b'@{"' * (size // 3) + b'\n@endnode\n'),
+        ("links without target", header + b'@{"label" link ' * (size // 15) + b'\n@endnode\n'),
+        ("whitespace runs", header + b'x' + b'\n \t' * (size // 3) + b'x\n@endnode\n'),
+        ("corrupted guide", bytes(valid)),
+    ]
+
+
+def parse_everything(path):
+    """Runs all of the parser on a guide file: node index, link graph and the tokens of every node."""
+    guide = GuideIndex(path)
+    try:
+        LinkGraph(guide)
+        tokens = 0
+        for node in guide.nodes:
+            tokens += len(parse_node_text(guide.read_node(node)))
+        return len(guide.nodes), tokens
+    finally:
+        guide.close()
+
+
+def bench_fuzz(sizes, ms_per_mb, seed):
+    """Parses malformed guides of growing size; fails if one takes too long or grows faster than linearly."""
+    rng = random.Random(seed)
+    failed = False
+    print(f"{'input':<42} {'KB':>7} {'nodes':>7} {'tokens':>8} {'ms':>9} {'growth':>7}")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "malformed.guide")
+        previous = {}
+        for size in sorted(sizes):
+            for name, data in malformed_guides(size, rng):
+                with open(path, 'wb') as file:
+                    file.write(data)
+                start = time.perf_counter()
+                try:
+                    nodes, tokens = parse_everything(path)
+                except Exception as e:
+                    print(f"{name:<42} {len(data) // 1024:>7} raised {type(e).__name__}: {e}")
+                    failed = True
+                    continue
+                elapsed = time.perf_counter() - start
+                # Time per byte should stay flat; allow for noise on small inputs
+                growth = ""
+                if name in previous:
+                    old_bytes, old_time = previous[name]
+                    ratio = (elapsed / len(data)) / max(old_time / old_bytes, 1e-12)
+                    growth = f"{ratio:.1f}x"
+                    if ratio > 2.5 and elapsed > 0.05:
+                        growth += " !"
+                        failed = True
+                previous[name] = (len(data), elapsed)
+                limit = ms_per_mb * max(len(data), 1024 * 1024) / (1024 * 1024)
+                flag = ""
+                if elapsed * 1000 > limit:
+                    flag = " !"
+                    failed = True
+                print(f"{name:<42} {len(data) // 1024:>7} {nodes:>7} {tokens:>8} {elapsed * 1000:>9.1f} {growth:>7}{flag}")
+    print("FAIL: superlinear or over the time limit (marked !)" if failed else "OK: linear and within the time limit")
+    return not failed
+
+
+def legacy_parse_nodes(data):
+    """The previous node parser: one regex over the whole decoded file. Returns upper-cased name -> (title, text)."""
+    nodes = {}
+    content = data.decode('latin-1')
+    for name, title, text in re.findall(r'@node\s+"(.*?)"\s+"(.*?)"(.*?)@endnode', content, re.DOTALL | re.IGNORECASE):
+        nodes[name.upper()] = (title, text.strip())
+    return nodes
+
+
+# Well-formed guide with @node mentioned inside the text, which must not start a node
+INLINE_MENTIONS_GUIDE = (
+    '@database "mentions.guide"\n'
+    'Text before the first node is not part of any node.\n'
+    '@node "MAIN" "Main"\n'
+    'Use \\@node to begin each page.\n'
+    'Escaped header: \\@node "ESCAPED" "Escaped"\n'
+    'See @{"two" link "TWO"} and @{"three" link "Three"}.\n'
+    '@endnode\n'
+    '@NODE "TWO" "Two"\n'
+    'two @node "INLINE" "Inline" mentioned, and @node "AGAIN"  "Again" once more\n'
+    ' o a bullet :-)\n'
+    '@ENDNODE\n'
+    '  \t@node "Three" "Indented header"\n'
+    'Indented header, @{b}bold@{ub} text.\n'
+    '@endnode\n'
+    '@node "EMPTY" ""\n'
+    '@endnode\n'
+    '@node "two" "Duplicate replaces the first one"\n'
+    'Second TWO\n'
+    '@endnode\n'
+    'Trailing text.\n'
+)
+
+
+def check_parse_equivalence(path):
+    """Compares the nodes of a well-formed guide with the previous parser; returns a list of differences."""
+    with open(path, 'rb') as file:
+        expected = legacy_parse_nodes(file.read())
+    guide = GuideIndex(path)
+    try:
+        problems = []
+        if list(guide.nodes) != list(expected):
+            problems.append(f"nodes {list(guide.nodes)[:10]} instead of {list(expected)[:10]}")
+        for key in guide.nodes:
+            if key not in expected:
+                continue
+            title, text = expected[key]
+            if guide.nodes[key].title != title:
+                problems.append(f"{key}: title {guide.nodes[key].title!r} instead of {title!r}")
+            if guide.read_node(key) != text:
+                problems.append(f"{key}: text differs")
+        return problems
+    finally:
+        guide.close()
+
+
+def check_parser(sizes, ms_per_mb, seed):
+    """Fuzzes the parser at small sizes and compares well-formed guides with the previous parser; for automated runs."""
+    passed = bench_fuzz(sizes, ms_per_mb, seed)
+    print()
+    with tempfile.TemporaryDirectory() as directory:
+        guides = []
+        for name, newline in (("mentions.guide", '\n'), ("mentions-crlf.guide", '\r\n')):
+            path = os.path.join(directory, name)
+            with open(path, 'w', encoding='latin-1', newline=newline) as file:
+                file.write(INLINE_MENTIONS_GUIDE)
+            guides.append(path)
+        path = os.path.join(directory, "synthetic.guide")
+        make_guide(path, nodes=200, node_chars=1000, images=3, audio=1, audio_seconds=0.1, seed=seed)
+        guides.append(path)
+        for path in guides:
+            problems = check_parse_equivalence(path)
+            print(f"{os.path.basename(path):<24} {'same as the previous parser' if not problems else 'DIFFERENT'}")
+            for problem in problems:
+                print(f"    {problem}")
+            passed = passed and not problems
+    print("OK" if passed else "FAIL")
+    return passed
+
+
+def retained_memory(build):
+    """Returns the result of build and the Python memory it still holds afterwards, in bytes."""
+    tracemalloc.start()
+    try:
+        result = build()
+        return result, tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_nodes(node_count, node_chars, lookups, seed):
+    """Compares the memory of the node index and its lookup time: node texts, NodeEntry objects and the NodeTable."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "nodes.guide")
+        make_guide(path, node_count, node_chars, links=5, images=0, audio=0, seed=seed)
+        guide = GuideIndex(path)
+        guide.links  # Fills the flags and link counts
+
+        def node_texts():
+            # All node texts in memory, as the viewer kept them before the index read from the mapped file
+            return {name: guide.read_node(name) for name in guide.nodes}
+
+        def node_entries():
+            table = guide.nodes
+            return {name: table[name] for name in table}
+
+        def node_table():
+            table = guideparser.NodeTable()
+            source = guide.nodes
+            for row in range(len(source)):
+                table.append(source.names[row], source.titles[row], source.starts[row], source.ends[row],
+                             source.flags[row], source.link_counts[row])
+            return table
+
+        rng = random.Random(seed)
+        names = [rng.choice(guide.nodes.names) for _ in range(lookups)]
+        queries = [name.lower() if rng.random() < 0.5 else name.title() for name in names]
+        print(f"{node_count} nodes, {os.path.getsize(path) / (1024 * 1024):.1f} MB guide")
+        print(f"{'index':<8} {'MB':>8} {'bytes/node':>11} {'lookup us':>10}")
+        for label, build in (("texts", node_texts), ("entries", node_entries), ("table", node_table)):
+            nodes, size = retained_memory(build)
+            start = time.perf_counter()
+            for query in queries:
+                nodes[query.upper()]
+            lookup = (time.perf_counter() - start) / lookups
+            print(f"{label:<8} {size / (1024 * 1024):>8.2f} {size / node_count:>11.0f} {lookup * 1e6:>10.2f}")
+        guide.close()
+
+
+def latency_stats(latencies):
+    """Returns median, p95 and maximum of a list of seconds in milliseconds."""
+    latencies = sorted(latencies)
+    return {
+        'median_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+        'max_ms': latencies[-1] * 1000,
+    }
+
+
+def bench_parser_layer(path):
+    """Times the parser side on a guide: scanning, link graph, tokenizing, uudecoding and search indexing."""
+    results = {}
+    start = time.perf_counter()
+    guide = GuideIndex(path)
+    results['index_ms'] = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    LinkGraph(guide)
+    results['link_graph_ms'] = (time.perf_counter() - start) * 1000
+    cached = guide.to_bytes()
+    # Everything the viewer does with the bytes of the cached index, the links included
+    start = time.perf_counter()
+    cached_guide = GuideIndex(path, read_index(cached))
+    results['index_from_cache_ms'] = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    LinkGraph(cached_guide)
+    results['link_graph_from_cache_ms'] = (time.perf_counter() - start) * 1000
+    cached_guide.close()
+
+    start = time.perf_counter()
+    token_lists = [parse_node_text(guide.read_node(name)) for name in guide.nodes]
+    results['tokenize_ms'] = (time.perf_counter() - start) * 1000
+    blocks = [token[2] for tokens in token_lists for token in tokens if token[0] == BINARY]
+    start = time.perf_counter()
+    decoded = sum(len(uudecode(block)) for block in blocks)
+    results['uudecode_ms'] = (time.perf_counter() - start) * 1000
+    results['uudecode_mb'] = decoded / (1024 * 1024)
+
+    index = SearchIndex()
+    start = time.perf_counter()
+    for name, entry in guide.nodes.items():
+        index.add_node(name, entry.title, guide.read_node(name))
+    results['search_index_ms'] = (time.perf_counter() - start) * 1000
+    guide.close()
+    return results
+
+
+@contextlib.contextmanager
+def dummy_viewer(cache_root, **kwargs):
+    """Yields a viewer running on the dummy Tk layer and its root, with the on-disk cache in cache_root."""
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    import Guideview
+
+    Guideview.load_imaging()
+    saved = (Guideview.tk, Guideview.messagebox, Guideview.ImageTk)
+    Guideview.tk = dummy_tk_layer()
+    Guideview.messagebox = DummyWidget()
+    Guideview.ImageTk = types.SimpleNamespace(PhotoImage=DummyPhotoImage)
+    DummyWidget.calls.clear()
+    root = DummyRoot()
+    viewer = Guideview.AmigaGuideViewer(root, **kwargs)
+    viewer.guides = GuideDatabase(Guideview.OPEN_GUIDES_BYTES, cache_root)
+    try:
+        # The viewer reports what it loads on stdout, which is where the results go
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield viewer, root
+    finally:
+        viewer.decoder.shutdown(wait=True, cancel_futures=True)
+        viewer.guides.close()
+        Guideview.tk, Guideview.messagebox, Guideview.ImageTk = saved
+
+
+def bench_viewer_layer(path, steps, seed, cache_root):
+    """Drives the viewer on the dummy Tk layer: load, first paint of MAIN and link navigation."""
+    with dummy_viewer(cache_root) as (viewer, root):
+        results = {}
+        start = time.perf_counter()
+        viewer.load_amiga_guide(path)
+        # Until the window responds again, the nodes are scanned in the background
+        results['load_ms'] = (time.perf_counter() - start) * 1000
+        viewer.show_node("MAIN", add_to_history=True)
+        root.settle(viewer, until=lambda: viewer.current_node == "MAIN")
+        results['first_paint_ms'] = (time.perf_counter() - start) * 1000
+        root.settle(viewer, until=lambda: viewer.loading is None)
+        results['loaded_ms'] = (time.perf_counter() - start) * 1000
+        root.settle(viewer)
+        results['settled_ms'] = (time.perf_counter() - start) * 1000
+        results['tk_calls_first_paint'] = sum(DummyWidget.calls.values())
+
+        rng = random.Random(seed)
+        latencies = []
+        back_latencies = []
+        for _ in range(steps):
+            targets = viewer.link_targets or ["MAIN"]
+            start = time.perf_counter()
+            viewer.follow_link(rng.choice(targets))
+            latencies.append(time.perf_counter() - start)
+            root.settle(viewer)
+            if rng.random() < 0.2:
+                start = time.perf_counter()
+                viewer.go_back()
+                back_latencies.append(time.perf_counter() - start)
+                root.settle(viewer)
+        results['navigation'] = latency_stats(latencies)
+        if back_latencies:
+            results['back'] = latency_stats(back_latencies)
+        results['node_cache_hit_rate'] = viewer.node_cache.hits / max(1, viewer.node_cache.hits + viewer.node_cache.misses)
+        results['tk_calls'] = dict(DummyWidget.calls.most_common())
+        return results
+
+
+def bench_pack(node_counts, node_chars, images, steps, repeat, seed):
+    """Compiles synthetic guides into packs and compares opening, tokens, media and the viewer on both."""
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        for node_count in node_counts:
+            path = os.path.join(directory, f"pack{node_count}.guide")
+            pack_path = os.path.join(directory, f"pack{node_count}.guidepack")
+            make_guide(path, node_count, node_chars, images=images, image_width=1024, seed=seed)
+            start = time.perf_counter()
+            compile_pack(path, pack_path)
+            compile_time = time.perf_counter() - start
+
+            guide = GuideIndex(path)
+            pack = GuidePack(pack_path)
+            cached = guide.to_bytes()
+            open_times = (
+                best_time(lambda: GuideIndex(path).close(), repeat),
+                # What the on-disk cache does: read the stored index, no scan
+                best_time(lambda: GuideIndex(path, read_index(cached)).close(), repeat),
+                best_time(lambda: GuidePack(pack_path).close(), repeat),
+            )
+            token_times = (
+                best_time(lambda: [guide.read_tokens(name) for name in guide.nodes], 1),
+                best_time(lambda: [pack.read_tokens(name) for name in pack.nodes], 1),
+            )
+            blocks = [token[2] for name in guide.nodes for token in guide.read_tokens(name) if token[0] == BINARY]
+            views = [token[2] for name in pack.nodes for token in pack.read_tokens(name) if token[0] == BINARY]
+            media_times = (
+                best_time(lambda: [io.BytesIO(uudecode(block)) for block in blocks], 1),
+                best_time(lambda: [io.BytesIO(view) for view in views], 1),
+            )
+            del views
+            guide.close()
+            pack.close()
+
+            viewer_results = []
+            for viewer_path, cache_name in ((path, "cold"), (path, "cold"), (pack_path, "pack")):
+                viewer_results.append(bench_viewer_layer(viewer_path, steps, seed, os.path.join(directory, f"{node_count}{cache_name}")))
+            rows.append((node_count, os.path.getsize(path), os.path.getsize(pack_path), compile_time,
+                         open_times, token_times, media_times, viewer_results))
+
+    print(f"{'nodes':>6} {'guide MB':>9} {'pack MB':>8} {'compile ms':>11}")
+    for node_count, size, pack_size, compile_time, *_ in rows:
+        print(f"{node_count:>6} {size / (1024 * 1024):>9.1f} {pack_size / (1024 * 1024):>8.1f} {compile_time * 1000:>11.0f}")
+    print(f"\nOpening the file alone, ms\n{'nodes':>6} {'scan':>9} {'cached':>9} {'pack':>9}")
+    for node_count, _, _, _, open_times, *_ in rows:
+        print(f"{node_count:>6} " + " ".join(f"{elapsed * 1000:>9.3f}" for elapsed in open_times))
+    print(f"\nTokens of all nodes and embedded media ready for PIL, ms\n"
+          f"{'nodes':>6} {'tokenize':>9} {'pack':>9} {'uudecode':>9} {'pack':>9}")
+    for node_count, _, _, _, _, token_times, media_times, _ in rows:
+        print(f"{node_count:>6} " + " ".join(f"{elapsed * 1000:>9.1f}" for elapsed in token_times + media_times))
+    # Opening in the viewer: how long the Tk thread is blocked, until MAIN is shown and until the
+    # link graph and all nodes are there
+    print(f"\nViewer on the dummy Tk layer, ms\n{'nodes':>6} {'file':<18} {'blocked':>8} {'MAIN':>7} {'loaded':>7} "
+          f"{'settled':>8} {'nav median':>11}")
+    for node_count, *_, viewer_results in rows:
+        for label, results in zip(("guide", "guide, disk cache", "pack"), viewer_results):
+            print(f"{node_count:>6} {label:<18} {results['load_ms']:>8.1f} {results['first_paint_ms']:>7.1f} "
+                  f"{results['loaded_ms']:>7.1f} {results['settled_ms']:>8.1f} {results['navigation']['median_ms']:>11.2f}")
+
+
+def compress_guide(path, directory, block_size):
+    """Writes a guide compressed in every way the viewer reads directly; returns label -> path to open."""
+    with open(path, 'rb') as file:
+        data = file.read()
+    name = os.path.basename(path)
+    variants = {'gzip': os.path.join(directory, name + '.gz'), 'xz': os.path.join(directory, name + '.xz'),
+                'xz blocks': os.path.join(directory, 'blocks', name + '.xz')}
+    with open(variants['gzip'], 'wb') as file:
+        file.write(gzip.compress(data, mtime=0))
+    with open(variants['xz'], 'wb') as file:
+        file.write(lzma.compress(data))
+    # One stream per block, which is what xz -T0 --block-size writes as far as seeking is concerned
+    os.makedirs(os.path.dirname(variants['xz blocks']), exist_ok=True)
+    with open(variants['xz blocks'], 'wb') as file:
+        for start in range(0, len(data), block_size):
+            file.write(lzma.compress(data[start:start + block_size]))
+    for label, method in (('zip', zipfile.ZIP_DEFLATED), ('zip stored', zipfile.ZIP_STORED)):
+        archive_path = os.path.join(directory, label.replace(' ', '_') + '.zip')
+        with zipfile.ZipFile(archive_path, 'w', method) as archive:
+            archive.write(path, 'guides/' + name)
+        variants[label] = os.path.join(archive_path, 'guides', name)
+    return variants
+
+
+def extract_guide(path, target):
+    """Decompresses a compressed or archived guide into a plain file, the way to open it without guidearchive."""
+    archive_path, name = split_archive_path(path)
+    if archive_path:
+        with zipfile.ZipFile(archive_path) as archive, archive.open(name) as source, open(target, 'wb') as file:
+            shutil.copyfileobj(source, file)
+    else:
+        with (gzip.open if path.endswith('.gz') else lzma.open)(path) as source, open(target, 'wb') as file:
+            shutil.copyfileobj(source, file)
+
+
+def bench_archive(node_count, node_chars, images, block_size, reads, steps, repeat, seed):
+    """Opens a guide compressed as gzip, xz and in a zip archive directly and after extracting it.
+
+    Scanning needs all of the data either way; reopening with the index from the disk cache only
+    decompresses up to the node read, and the seek points recorded on the way make later reads cheap.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "archive.guide")
+        make_guide(path, node_count, node_chars, images=images, image_width=1024, seed=seed)
+        variants = compress_guide(path, directory, block_size)
+        guide = GuideIndex(path)
+        cached = guide.to_bytes()
+        names = list(guide.nodes)
+        guide.close()
+        rng = random.Random(seed)
+        targets = rng.sample(names, min(reads, len(names)))
+        extracted = os.path.join(directory, "extracted.guide")
+
+        def scan(file_path):
+            guide = GuideIndex(file_path)
+            guide.links
+            guide.release_buffer()
+            return guide
+
+        def extract_and_scan(file_path):
+            extract_guide(file_path, extracted)
+            return scan(extracted)
+
+        def reopen(file_path, extract):
+            # Returns the time to the text of the last node and per later random node
+            start = time.perf_counter()
+            if extract:
+                extract_guide(file_path, extracted)
+                file_path = extracted
+            guide = GuideIndex(file_path, read_index(cached))
+            guide.read_node(names[-1])
+            first = time.perf_counter() - start
+            start = time.perf_counter()
+            for name in targets:
+                guide.read_node(name)
+            later = (time.perf_counter() - start) / len(targets)
+            guide.close()
+            return first, later
+
+        rows = []
+        for label, file_path in variants.items():
+            archive_path, _ = split_archive_path(file_path)
+            scan_times = (best_time(lambda: scan(file_path).close(), repeat),
+                          best_time(lambda: extract_and_scan(file_path).close(), repeat))
+            reopen_times = [min(reopen(file_path, extract) for _ in range(repeat)) for extract in (False, True)]
+            viewer = bench_viewer_layer(file_path, steps, seed, os.path.join(directory, label.replace(' ', '_')))
+            rows.append((label, os.path.getsize(archive_path or file_path), scan_times, reopen_times, viewer))
+        size = os.path.getsize(path)
+
+    print(f"Guide: {node_count} nodes, {size / (1024 * 1024):.1f} MB")
+    print(f"\nFirst open, scanning the guide, ms\n{'file':<11} {'MB':>6} {'direct':>8} {'extract':>8}")
+    for label, file_size, scan_times, *_ in rows:
+        print(f"{label:<11} {file_size / (1024 * 1024):>6.1f} " + " ".join(f"{elapsed * 1000:>8.1f}" for elapsed in scan_times))
+    print(f"\nReopening with the disk cache: ms to the last node, then per random node\n"
+          f"{'file':<11} {'direct':>8} {'random':>8} {'extract':>8} {'random':>8}")
+    for label, _, _, reopen_times, _ in rows:
+        print(f"{label:<11} " + " ".join(f"{elapsed * 1000:>8.2f}" for times in reopen_times for elapsed in times))
+    print(f"\nViewer on the dummy Tk layer, ms\n{'file':<11} {'load':>7} {'MAIN':>7} {'settled':>8} {'nav median':>11}")
+    for label, *_, results in rows:
+        print(f"{label:<11} {results['load_ms']:>7.1f} {results['first_paint_ms']:>7.1f} "
+              f"{results['settled_ms']:>8.1f} {results['navigation']['median_ms']:>11.2f}")
+
+
+def edit_node(path, node_name):
+    """Adds a line to the top of a node of a guide file, as an author saving an edit would."""
+    with open(path, 'rb') as file:
+        data = file.read()
+    header = data.index(f'@node "{node_name}"'.encode('latin-1'))
+    line_end = data.index(b"\n", header) + 1
+    with open(path, 'wb') as file:
+        file.write(data[:line_end] + b"Edited by guidebench.\n" + data[line_end:])
+    # Coarse file system timestamps would hide the change otherwise
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def bench_reload(node_count, node_chars, images, visits, seed):
+    """Edits the node shown in the viewer and compares reloading the guide with opening it again."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "reload.guide")
+        make_guide(path, node_count, node_chars, images=images, image_width=1024, seed=seed)
+        with dummy_viewer(os.path.join(directory, "cache"), profiler=Profiler()) as (viewer, root):
+            rng = random.Random(seed)
+            viewer.open_guide(path)
+            root.settle(viewer)
+            for node in rng.sample(list(viewer.nodes), min(visits, len(viewer.nodes))):
+                viewer.show_node(node, add_to_history=True)
+                root.settle(viewer)
+            viewer.guide.hash_nodes()
+            tokenized = viewer.profiler.phases['tokenize'][0]
+            history = list(viewer.history)
+
+            edit_node(path, viewer.current_node)
+            viewer.watch_file = True
+            start = time.perf_counter()
+            viewer.poll_file()
+            root.after_cancel(viewer.watch_id)
+            viewer.watch_file = False
+            root.settle(viewer)
+            reload_time = time.perf_counter() - start
+            assert viewer.history == history
+            reload_tokenized = viewer.profiler.phases['tokenize'][0] - tokenized
+            kept = (len(viewer.node_cache), len(viewer.image_cache))
+
+            edit_node(path, viewer.current_node)
+            tokenized = viewer.profiler.phases['tokenize'][0]
+            current = viewer.current_node
+            start = time.perf_counter()
+            viewer.load_amiga_guide(path)
+            viewer.show_node(current, add_to_history=True)
+            root.settle(viewer)
+            reopen_time = time.perf_counter() - start
+            # Every node visited before has to be tokenized and decoded again
+            for _, node in history:
+                viewer.show_node(node)
+                root.settle(viewer)
+            revisit_time = time.perf_counter() - start
+            reopen_tokenized = viewer.profiler.phases['tokenize'][0] - tokenized
+    print(f"reload: {reload_time * 1000:.1f} ms, {reload_tokenized} nodes tokenized, "
+          f"{kept[0]} parsed nodes and {kept[1]} images kept, history of {len(history)} kept")
+    print(f"reopen: {reopen_time * 1000:.1f} ms, history lost; {revisit_time * 1000:.1f} ms with the "
+          f"{len(history)} visited nodes shown again, {reopen_tokenized} nodes tokenized")
+
+
+def peak_memory_mb(func, *args):
+    """Returns the peak of Python allocations while running func, in MB."""
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    finally:
+        tracemalloc.stop()
+
+
+def bench_suite(args):
+    """Generates a synthetic guide and measures the parser and viewer layers; returns JSON-serialisable results."""
+    config = {
+        'nodes': args.nodes, 'node_chars': args.node_chars, 'links': args.links, 'images': args.images,
+        'image_width': args.image_width, 'audio': args.audio, 'audio_seconds': args.audio_seconds,
+        'steps': args.steps, 'seed': args.seed,
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "synthetic.guide")
+        start = time.perf_counter()
+        make_guide(path, args.nodes, args.node_chars, args.links, args.images, args.image_width,
+                   args.audio, args.audio_seconds, args.seed)
+        results = {
+            'config': config,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': guideparser.load_numpy() is not None,
+            'guide_mb': os.path.getsize(path) / (1024 * 1024),
+            'generate_ms': (time.perf_counter() - start) * 1000,
+        }
+        results['parser'] = bench_parser_layer(path)
+        results['parser']['peak_python_mb'] = peak_memory_mb(bench_parser_layer, path)
+        results['viewer'] = bench_viewer_layer(path, args.steps, args.seed, os.path.join(directory, "cold"))
+        results['viewer']['peak_python_mb'] = peak_memory_mb(
+            bench_viewer_layer, path, args.steps, args.seed, os.path.join(directory, "peak"))
+        # Second run on the disk cache of the first one
+        warm = bench_viewer_layer(path, args.steps, args.seed, os.path.join(directory, "cold"))
+        results['viewer_warm_cache'] = {name: warm[name] for name in ('load_ms', 'first_paint_ms', 'loaded_ms', 'settled_ms', 'navigation')}
+    try:
+        import resource
+    except ImportError:
+        pass  # Not available on Windows
+    else:
+        # Kilobytes on Linux, bytes on macOS
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        results['max_rss_mb'] = max_rss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Guideview benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    tokenize_parser = subparsers.add_parser("tokenize", help="tokenizer time versus node length")
+    tokenize_parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000, 4_000_000])
+    tokenize_parser.add_argument("--repeat", type=int, default=3)
+
+    uudecode_parser = subparsers.add_parser("uudecode", help="uudecode throughput against the uu module")
+    uudecode_parser.add_argument("--sizes", type=int, nargs="+", default=[1024 * 1024, 8 * 1024 * 1024])
+    uudecode_parser.add_argument("--repeat", type=int, default=3)
+
+    emoji_parser = subparsers.add_parser("emoji", help="emoji and bullet substitution against the old implementation")
+    emoji_parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    emoji_parser.add_argument("--image-size", type=int, default=256 * 1024, help="bytes of embedded data per node")
+    emoji_parser.add_argument("--repeat", type=int, default=3)
+
+    search_parser = subparsers.add_parser("search", help="search index build time and query latency")
+    search_parser.add_argument("--nodes", type=int, default=20_000)
+    search_parser.add_argument("--words", type=int, default=200, help="words per node")
+    search_parser.add_argument("--queries", type=int, default=200)
+    search_parser.add_argument("--seed", type=int, default=1)
+
+    image_parser = subparsers.add_parser("image", help="full-size image decoding against display-width decoding")
+    image_parser.add_argument("--sizes", type=int, nargs="+", default=[1600, 3000, 6000], help="image widths")
+    image_parser.add_argument("--width", type=int, default=768, help="display width")
+    image_parser.add_argument("--repeat", type=int, default=3)
+
+    reload_parser = subparsers.add_parser("reload", help="reloading an edited guide against opening it again")
+    reload_parser.add_argument("--nodes", type=int, default=2000)
+    reload_parser.add_argument("--node-chars", type=int, default=4000, help="characters of text per node")
+    reload_parser.add_argument("--images", type=int, default=200, help="number of nodes with an embedded JPEG")
+    reload_parser.add_argument("--visits", type=int, default=30, help="nodes shown before the edit")
+    reload_parser.add_argument("--seed", type=int, default=1)
+
+    fuzz_parser = subparsers.add_parser("fuzz", help="parse malformed guides, failing on superlinear time")
+    fuzz_parser.add_argument("--sizes", type=int, nargs="+", default=[256 * 1024, 1024 * 1024, 4 * 1024 * 1024])
+    fuzz_parser.add_argument("--ms-per-mb", type=float, default=2000, help="fail above this parse time per MB")
+    fuzz_parser.add_argument("--seed", type=int, default=1)
+
+    check_parser_ = subparsers.add_parser("check", help="small fuzz run and comparison with the previous parser, for automated runs")
+    check_parser_.add_argument("--sizes", type=int, nargs="+", default=[64 * 1024, 256 * 1024])
+    check_parser_.add_argument("--ms-per-mb", type=float, default=2000, help="fail above this parse time per MB")
+    check_parser_.add_argument("--seed", type=int, default=1)
+
+    pack_parser = subparsers.add_parser("pack", help="opening compiled guide packs against parsing the guides")
+    pack_parser.add_argument("--nodes", type=int, nargs="+", default=[500, 5000, 50_000])
+    pack_parser.add_argument("--node-chars", type=int, default=2000, help="characters of text per node")
+    pack_parser.add_argument("--images", type=int, default=50, help="number of nodes with an embedded JPEG")
+    pack_parser.add_argument("--steps", type=int, default=50, help="links followed in the viewer")
+    pack_parser.add_argument("--repeat", type=int, default=3)
+    pack_parser.add_argument("--seed", type=int, default=1)
+
+    archive_parser = subparsers.add_parser("archive", help="opening compressed and zipped guides directly against extracting them")
+    archive_parser.add_argument("--nodes", type=int, default=20_000)
+    archive_parser.add_argument("--node-chars", type=int, default=2000, help="characters of text per node")
+    archive_parser.add_argument("--images", type=int, default=50, help="number of nodes with an embedded JPEG")
+    archive_parser.add_argument("--block-size", type=int, default=1024 * 1024, help="uncompressed size of the blocks of the xz file with blocks")
+    archive_parser.add_argument("--reads", type=int, default=100, help="random nodes read after the last one")
+    archive_parser.add_argument("--steps", type=int, default=50, help="links followed in the viewer")
+    archive_parser.add_argument("--repeat", type=int, default=3)
+    archive_parser.add_argument("--seed", type=int, default=1)
+
+    render_parser = subparsers.add_parser("render", help="Tk inserts and time per node, one insert per run against batched inserts")
+    render_parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    render_parser.add_argument("--repeat", type=int, default=3)
+
+    nodes_parser = subparsers.add_parser("nodes", help="memory and lookup time of the node index")
+    nodes_parser.add_argument("--nodes", type=int, default=100_000)
+    nodes_parser.add_argument("--node-chars", type=int, default=500, help="characters of text per node")
+    nodes_parser.add_argument("--lookups", type=int, default=100_000)
+    nodes_parser.add_argument("--seed", type=int, default=1)
+
+    startup_parser = subparsers.add_parser("startup", help="cold import time of the viewer")
+    startup_parser.add_argument("--module", default="Guideview")
+    startup_parser.add_argument("--repeat", type=int, default=5)
+    startup_parser.add_argument("--target-ms", type=float, default=150, help="fail above this import time")
+    startup_parser.add_argument("--top", type=int, default=15, help="number of imports listed")
+
+    for command, help_text in (("generate", "write a synthetic guide"), ("suite", "load, paint, navigation and memory benchmarks as JSON")):
+        suite_parser = subparsers.add_parser(command, help=help_text)
+        if command == "generate":
+            suite_parser.add_argument("output", help="guide file to write")
+        else:
+            suite_parser.add_argument("-o", "--output", help="JSON file for the results (default: stdout)")
+            suite_parser.add_argument("--steps", type=int, default=100, help="links followed in the viewer")
+        suite_parser.add_argument("--nodes", type=int, default=500)
+        suite_parser.add_argument("--node-chars", type=int, default=4000, help="characters of text per node")
+        suite_parser.add_argument("--links", type=int, default=5, help="links per node")
+        suite_parser.add_argument("--images", type=int, default=20, help="number of nodes with an embedded JPEG")
+        suite_parser.add_argument("--image-width", type=int, default=1600)
+        suite_parser.add_argument("--audio", type=int, default=1, help="number of nodes with embedded audio, from MAIN on")
+        suite_parser.add_argument("--audio-seconds", type=float, default=5)
+        suite_parser.add_argument("--seed", type=int, default=1)
+
+    args = parser.parse_args()
+    if args.command == "tokenize":
+        bench_tokenize(args.sizes, args.repeat)
+    elif args.command == "uudecode":
+        bench_uudecode(args.sizes, args.repeat)
+    elif args.command == "emoji":
+        bench_emoji(args.sizes, args.image_size, args.repeat)
+    elif args.command == "search":
+        bench_search(args.nodes, args.words, args.queries, args.seed)
+    elif args.command == "image":
+        bench_image(args.sizes, args.width, args.repeat)
+    elif args.command == "reload":
+        bench_reload(args.nodes, args.node_chars, args.images, args.visits, args.seed)
+    elif args.command == "fuzz":
+        return 0 if bench_fuzz(args.sizes, args.ms_per_mb, args.seed) else 1
+    elif args.command == "check":
+        return 0 if check_parser(args.sizes, args.ms_per_mb, args.seed) else 1
+    elif args.command == "pack":
+        bench_pack(args.nodes, args.node_chars, args.images, args.steps, args.repeat, args.seed)
+    elif args.command == "archive":
+        bench_archive(args.nodes, args.node_chars, args.images, args.block_size, args.reads, args.steps, args.repeat, args.seed)
+    elif args.command == "render":
+        return 0 if bench_render(args.sizes, args.repeat) else 1
+    elif args.command == "nodes":
+        bench_nodes(args.nodes, args.node_chars, args.lookups, args.seed)
+    elif args.command == "generate":
+        make_guide(args.output, args.nodes, args.node_chars, args.links, args.images, args.image_width,
+                   args.audio, args.audio_seconds, args.seed)
+    elif args.command == "suite":
+        results = json.dumps(bench_suite(args), indent=2)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as file:
+                file.write(results)
+        else:
+            print(results)
+    elif args.command == "startup":
+        return 0 if bench_startup(args.module, args.repeat, args.target_ms, args.top) else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,429 @@
+import hashlib
+import os
+import shutil
+import struct
+import sys
+from collections import OrderedDict
+
+from guidearchive import COMPRESSED_EXTENSIONS, find_member, guide_path, guide_stat, split_archive_path
+from guideparser import GuideIndex, LinkGraph, read_index
+from guidepack import GuidePack, is_pack
+
+# Guideview by Zeittresor
+# Caches shared by the viewer to avoid parsing and decoding the same data twice.
+
+# Bump when the layout of the on-disk cache changes, older entries are then ignored
+DISK_CACHE_VERSION = 4
+# Name of the index in the cache directory of a guide, written by GuideIndex.to_bytes() after the version
+INDEX_FILE = 'index.bin'
+VERSION = struct.Struct('<I')
+# Total size of the on-disk cache before the least recently opened guides are dropped
+DISK_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# Estimated memory of the index of an open guide per node and per link, on top of the mapped file
+NODE_INDEX_BYTES = 150
+LINK_INDEX_BYTES = 200
+
+
+def user_cache_dir():
+    """Returns the per-user cache directory of the viewer."""
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~\\AppData\\Local')
+        return os.path.join(base, 'Guideview', 'Cache')
+    if sys.platform == 'darwin':
+        return os.path.expanduser('~/Library/Caches/Guideview')
+    return os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'guideview')
+
+
+class LRUCache:
+    """Least-recently-used cache bounded by the total size of its entries in bytes.
+
+    on_evict(key, value) is called for entries dropped to stay within the budget.
+    """
+
+    def __init__(self, max_bytes, on_evict=None):
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (value, size)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """Returns the cached value and marks it as recently used."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def peek(self, key, default=None):
+        """Returns the cached value without touching the LRU order or the statistics."""
+        entry = self._entries.get(key)
+        return default if entry is None else entry[0]
+
+    def put(self, key, value, size):
+        """Stores a value, evicting the least recently used entries beyond the budget."""
+        self.discard(key)
+        if size > self.max_bytes:
+            # Would evict everything else and still not fit
+            return
+        self._entries[key] = (value, size)
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            evicted_key, (evicted, evicted_size) = self._entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+            if self.on_evict:
+                self.on_evict(evicted_key, evicted)
+
+    def discard(self, key):
+        """Removes a single entry if present."""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+
+    def keys(self):
+        """Returns the keys of the cached values, least recently used first."""
+        return list(self._entries)
+
+    def values(self):
+        """Returns the cached values, least recently used first."""
+        return [value for value, _ in self._entries.values()]
+
+    def clear(self):
+        """Removes all entries."""
+        self._entries.clear()
+        self.total_bytes = 0
+
+
+class GuideDiskCache:
+    """Sidecar cache of one guide file, keyed by its path, size and modification time.
+
+    Holds the node index and links in the layout of GuideIndex.to_bytes() plus pre-scaled thumbnails
+    of embedded images.
+    A changed file gets a new key, so stale entries are never read and are pruned eventually.
+    """
+
+    def __init__(self, file_path, root=None, max_bytes=DISK_CACHE_MAX_BYTES):
+        self.file_path = os.path.abspath(file_path)
+        stat = guide_stat(self.file_path)
+        key = f"{self.file_path}|{stat.st_size}|{stat.st_mtime_ns}"
+        self.root = root or user_cache_dir()
+        self.directory = os.path.join(self.root, hashlib.sha1(key.encode('utf-8')).hexdigest())
+        self.max_bytes = max_bytes
+
+    def load_index(self):
+        """Returns the cached index as read_index() does, or None if the guide has not been indexed yet."""
+        try:
+            with open(os.path.join(self.directory, INDEX_FILE), 'rb') as file:
+                data = file.read()
+            # Mark the entry as recently used for pruning
+            os.utime(self.directory)
+        except OSError:
+            return None
+        if len(data) < VERSION.size or VERSION.unpack_from(data)[0] != DISK_CACHE_VERSION:
+            return None
+        try:
+            return read_index(memoryview(data)[VERSION.size:])
+        except ValueError:
+            return None  # Damaged, the guide is scanned and the index written again
+
+    def save_index(self, data):
+        """Stores index data from GuideIndex.to_bytes() and prunes old entries beyond the size budget."""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            self._write(os.path.join(self.directory, INDEX_FILE), VERSION.pack(DISK_CACHE_VERSION) + data)
+            self.prune()
+        except OSError as e:
+            print(f"Error writing cache: {e}")
+
+    def thumbnail_path(self, node_name, index, width):
+        """Returns the file name of the thumbnail for an embedded image of a node, scaled to a width."""
+        return os.path.join(self.directory, f"{_node_key(node_name)}-{index}-{width}.thumb")
+
+    def media_path(self, node_name, index, extension):
+        """Returns the file name of an embedded audio file of a node, decoded once and then streamed."""
+        return os.path.join(self.directory, f"{_node_key(node_name)}-{index}{extension}")
+
+    def adopt(self, previous, changed):
+        """Moves the thumbnails and media of the nodes not in changed over from the cache of an earlier version of the file."""
+        changed_keys = {_node_key(node_name) for node_name in changed}
+        try:
+            entries = [entry for entry in os.scandir(previous.directory) if entry.is_file()]
+            os.makedirs(self.directory, exist_ok=True)
+        except OSError:
+            return
+        for entry in entries:
+            if entry.name == INDEX_FILE or entry.name.endswith('.tmp') or entry.name.split('-', 1)[0] in changed_keys:
+                continue
+            try:
+                os.replace(entry.path, os.path.join(self.directory, entry.name))
+            except OSError:
+                pass  # Still open, e.g. audio being played on Windows; decoded again when needed
+
+    def _write(self, path, data):
+        """Writes a file atomically so readers never see a partial entry."""
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'wb') as file:
+                file.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            remove_file(temp_path)
+            raise
+
+    def prune(self):
+        """Removes the least recently used guide entries until the cache fits its budget."""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.root):
+            if not entry.is_dir() or entry.path == self.directory:
+                continue
+            size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+            entries.append((entry.stat().st_mtime, size, entry.path))
+            total += size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+def remove_file(path):
+    """Removes a file if it is there, e.g. the temporary file of a write that failed."""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _node_key(node_name):
+    """Returns the prefix of the cache files of a node."""
+    return hashlib.sha1(node_name.encode('utf-8')).hexdigest()[:16]
+
+
+def _find_file(directory, relative_path):
+    """Returns the path of a file below directory, matching the names case-insensitively if needed."""
+    path = os.path.join(directory, relative_path)
+    archive_path, name = split_archive_path(path)
+    if archive_path:
+        name = find_member(archive_path, name)
+        return os.path.join(archive_path, name) if name else None
+    if os.path.isfile(path):
+        return path
+    # The Amiga file system ignores case, so links often differ from the actual file names
+    current = directory
+    for part in relative_path.replace('\\', '/').split('/'):
+        if part in ('', '.'):
+            continue
+        try:
+            names = os.listdir(current)
+        except OSError:
+            return None
+        match = next((name for name in names if name.lower() == part.lower()), None)
+        if match is None:
+            return None
+        current = os.path.join(current, match)
+    return current if os.path.isfile(current) else None
+
+
+class OpenGuide:
+    """A guide file opened by the GuideDatabase, with its index, link graph and search index."""
+
+    def __init__(self, file_path, stat, cache_root=None, guide=None, scan=True):
+        self.file_path = file_path
+        self.key = (file_path, stat.st_size, stat.st_mtime_ns)  # Changes whenever the file does
+        self.disk_cache = GuideDiskCache(file_path, cache_root)
+        # A compiled pack holds the index itself, the disk cache only takes its thumbnails
+        packed = is_pack(file_path)
+        if packed and guide is None:
+            guide = GuidePack(file_path)
+        # Without scan the index is left to the caller, which reads it from the disk cache or scans
+        # the file in the background and calls complete() once all nodes are there. A pack has all
+        # of its nodes right away, only its link graph is left to complete().
+        cached = self.disk_cache.load_index() if scan and not guide else None
+        self.cached = packed or cached is not None  # Index taken from the pack or the disk cache, not stored again
+        self.packed = packed
+        self.loading = not scan and (packed or not guide)
+        self.guide = guide or GuideIndex(file_path, cached, scan)
+        self.link_graph = None
+        self.search_index = None  # Filled by the viewer while the guide is shown
+        self.search_pending = None  # Names of the nodes still to be indexed, None once the index is complete
+        if not self.loading:
+            self.complete(save=not self.cached)
+
+    def use_index(self, index):
+        """Takes over an index read by GuideDiskCache.load_index() in place of scanning the guide."""
+        self.guide.use_index(index)
+        self.cached = True
+
+    def complete(self, save=True):
+        """Builds the link graph once all nodes are known and stores a newly scanned index in the disk cache."""
+        if save and self.guide.nodes:
+            self.disk_cache.save_index(self.guide.to_bytes())
+        self.link_graph = LinkGraph(self.guide)
+        self.guide.release_buffer()
+        self.loading = False
+
+    @property
+    def nodes(self):
+        return self.guide.nodes
+
+    def size(self):
+        """Estimates the memory held by this guide in bytes, counting the mapped file in full."""
+        link_count = sum(len(edges) for edges in self.link_graph.edges.values()) if self.link_graph else 0
+        return self.key[1] + len(self.nodes) * NODE_INDEX_BYTES + link_count * LINK_INDEX_BYTES
+
+    def close(self):
+        """Releases the mapped guide file."""
+        self.guide.close()
+
+
+class GuideDatabase:
+    """The guide files opened during a session, kept open in an LRU bounded by their memory footprint.
+
+    Links of the form "file.guide/NODE" open further guides on demand; a guide visited before is
+    taken from here instead of being opened and indexed again. The guide being shown is pinned
+    and only closed once another one has taken its place.
+    """
+
+    def __init__(self, max_bytes, cache_root=None):
+        self.guides = LRUCache(max_bytes, on_evict=self._evicted)  # Normalized path -> OpenGuide
+        self.cache_root = cache_root  # Directory of the on-disk cache, the user cache directory by default
+        self.pinned = None
+
+    def open(self, file_path, scan=True):
+        """Returns the OpenGuide of a file, opening and indexing it unless it is open already.
+
+        With scan=False a guide that is not open yet is returned without nodes, for the caller to
+        read its index from the disk cache or scan it in the background.
+        """
+        file_path = self.normalize(file_path)
+        stat = guide_stat(file_path)
+        entry = self.guides.get(file_path)
+        if entry is None and self.pinned is not None and self.pinned.file_path == file_path:
+            # Shown right now, but larger than the whole budget and so not kept in the LRU
+            entry = self.pinned
+        if entry is not None:
+            if entry.key == (file_path, stat.st_size, stat.st_mtime_ns):
+                return entry
+            # Changed on disk since it was opened
+            self.guides.discard(file_path)
+            self._evicted(file_path, entry)
+        entry = OpenGuide(file_path, stat, self.cache_root, scan=scan)
+        self.guides.put(file_path, entry, entry.size())
+        return entry
+
+    def normalize(self, file_path):
+        """Returns the path a guide is kept under: absolute, case-normalized and resolved into .zip archives."""
+        return os.path.normcase(os.path.abspath(guide_path(file_path)))
+
+    def resize(self, entry):
+        """Updates the memory estimate of an open guide, e.g. once it has been loaded in the background."""
+        if self.guides.peek(entry.file_path) is entry:
+            self.guides.put(entry.file_path, entry, entry.size())
+
+    def forget(self, entry, close=True):
+        """Closes a guide and drops it from the database, e.g. when loading it was cancelled.
+
+        With close=False the caller closes it later, once no worker uses it any more.
+        """
+        if self.guides.peek(entry.file_path) is entry:
+            self.guides.discard(entry.file_path)
+        if self.pinned is entry:
+            self.pinned = None
+        if close:
+            entry.close()
+
+    def changed(self, entry):
+        """Returns whether the file of an OpenGuide has been modified since it was opened."""
+        try:
+            stat = guide_stat(entry.file_path)
+        except OSError:
+            return False  # Being replaced by an editor right now, checked again later
+        return entry.key != (entry.file_path, stat.st_size, stat.st_mtime_ns)
+
+    def reload(self, entry):
+        """Opens the modified file of an OpenGuide again, keeping what is known about its unchanged nodes.
+
+        The node headers are scanned again since the offsets move, but links, cached thumbnails and
+        media and the search index are only redone for the nodes whose bodies changed. Returns the new
+        OpenGuide, which takes the place of the old one, and the names of the changed, added and
+        removed nodes.
+        """
+        stat = guide_stat(entry.file_path)
+        guide = GuidePack(entry.file_path) if is_pack(entry.file_path) else GuideIndex(entry.file_path)
+        try:
+            changed = guide.changed_nodes(entry.guide)
+            guide.reuse_links(entry.guide, changed)
+            reloaded = OpenGuide(entry.file_path, stat, self.cache_root, guide)
+        except Exception:
+            guide.close()
+            raise
+        reloaded.disk_cache.adopt(entry.disk_cache, changed)
+
+        search_index = entry.search_index
+        if search_index is not None:
+            pending = [] if entry.search_pending is None else list(entry.search_pending)
+            for node_name in changed:
+                search_index.remove_node(node_name)
+            pending = [node_name for node_name in dict.fromkeys(pending + sorted(changed)) if node_name in guide.nodes]
+            reloaded.search_index = search_index
+            reloaded.search_pending = iter(pending) if pending else None
+
+        self.guides.discard(entry.file_path)
+        self.guides.put(entry.file_path, reloaded, reloaded.size())
+        if entry is self.pinned:
+            self.pin(reloaded)
+        else:
+            entry.close()
+        return reloaded, changed
+
+    def pin(self, entry):
+        """Marks the guide being shown; the previously shown one is closed if it is no longer cached."""
+        previous = self.pinned
+        self.pinned = entry
+        if previous is not None and previous is not entry and self.guides.peek(previous.file_path) is not previous:
+            previous.close()
+
+    def _evicted(self, file_path, entry):
+        if entry is not self.pinned:
+            entry.close()
+
+    def resolve(self, current_path, target):
+        """Splits a link target "file/NODE" into the path of the guide file and the node name.
+
+        The file is looked up relative to the guide the link is in, also inside a .zip archive. Amiga
+        volume and assign names ("Help:file.guide") cannot be resolved here, so such files are also
+        looked for next to it.
+        Returns (None, node name) if no such file exists.
+        """
+        file_part, node_name = target.rsplit('/', 1)
+        directory = os.path.dirname(current_path)
+        candidates = [file_part]
+        if ':' in file_part:
+            candidates.append(file_part.split(':', 1)[1])
+        # Guides shipped compressed are still linked to by their uncompressed names
+        candidates += [candidate + extension for candidate in candidates for extension in COMPRESSED_EXTENSIONS]
+        for candidate in candidates:
+            path = _find_file(directory, candidate)
+            if path:
+                return path, node_name
+        return None, node_name
+
+    def close(self):
+        """Closes all open guide files."""
+        for entry in self.guides.values():
+            entry.close()
+        if self.pinned is not None:
+            self.pinned.close()
+        self.guides.clear()
+        self.pinned = None
@@ -0,0 +1,301 @@
+import argparse
+import html
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from guidearchive import archive_guides, guide_stat, ARCHIVE_EXTENSION, COMPRESSED_EXTENSIONS
+from guideparser import (
+    GuideIndex, LinkGraph, parse_node_text, uudecode, TEXT, STYLE, LINK, BINARY, IMAGE_EXTENSIONS, AUDIO_EXTENSIONS,
+)
+from guidepack import compile_pack, PACK_EXTENSION
+
+# Guideview by Zeittresor
+# Headless batch converter: python guideconvert.py -f html -o out/ guides/ --extract-media -j 8
+# Link check only: python guideconvert.py --check-links guides/
+# Guide packs for the viewer: python guideconvert.py -f pack -o packs/ guides/
+
+FORMAT_EXTENSIONS = {'html': '.html', 'md': '.md', 'text': '.txt', 'pack': PACK_EXTENSION}
+# Files collected from the input directories: guides, compressed guides and zip archives of guides
+GUIDE_EXTENSIONS = ('.guide', ARCHIVE_EXTENSION) + tuple(f".guide{extension}" for extension in COMPRESSED_EXTENSIONS)
+MARKDOWN_SPECIAL_RE = re.compile(r'([\\`*_\[\]<>#|])')
+
+
+def markdown_escape(text):
+    """Escapes the characters Markdown would treat as formatting."""
+    return MARKDOWN_SPECIAL_RE.sub(r'\\\1', text)
+
+
+def node_anchor(node_name):
+    """Returns the anchor id used for a node in HTML and Markdown output."""
+    return "node-" + re.sub(r'[^A-Za-z0-9_-]', '-', node_name.upper())
+
+
+def link_href(target, extension):
+    """Returns the href of a link target; "other.guide/NODE" points into the converted other guide."""
+    if '/' in target:
+        file_part, node_part = target.rsplit('/', 1)
+        return f"{os.path.splitext(file_part)[0]}{extension}#{node_anchor(node_part)}"
+    return f"#{node_anchor(target)}"
+
+
+class TextWriter:
+    """Writes a guide as plain text, one section per node."""
+    extension = '.txt'
+
+    def __init__(self, title):
+        self.parts = []
+
+    def begin_node(self, node_name, title):
+        self.parts.append(f"\n=== {title} ===\n\n")
+
+    def text(self, text, styles):
+        self.parts.append(text)
+
+    def link(self, label, target):
+        self.parts.append(f"[{label}]")
+
+    def media(self, filename, path, is_image):
+        self.parts.append(f"[{filename}]")
+
+    def end_node(self):
+        self.parts.append("\n")
+
+    def result(self):
+        return "".join(self.parts)
+
+
+class MarkdownWriter(TextWriter):
+    """Writes a guide as Markdown with one heading per node."""
+    extension = '.md'
+
+    def __init__(self, title):
+        self.parts = [f"# {title}\n"]
+
+    def begin_node(self, node_name, title):
+        self.parts.append(f'\n<a id="{node_anchor(node_name)}"></a>\n\n## {markdown_escape(title)}\n\n')
+
+    def text(self, text, styles):
+        text = markdown_escape(text)
+        core = text.strip()
+        if not core or not styles:
+            self.parts.append(text)
+            return
+        # Emphasis markers must touch the text, so surrounding whitespace stays outside
+        lead = text[:len(text) - len(text.lstrip())]
+        trail = text[len(text.rstrip()):]
+        if 'underline' in styles:
+            core = f"<u>{core}</u>"
+        if 'bold' in styles:
+            core = f"**{core}**"
+        self.parts.append(f"{lead}{core}{trail}")
+
+    def link(self, label, target):
+        self.parts.append(f"[{markdown_escape(label)}]({link_href(target, self.extension)})")
+
+    def media(self, filename, path, is_image):
+        if path and is_image:
+            self.parts.append(f"![{filename}]({path})")
+        elif path:
+            self.parts.append(f"[{filename}]({path})")
+        else:
+            self.parts.append(f"[{filename}]")
+
+
+class HtmlWriter(TextWriter):
+    """Writes a guide as a single HTML page with one section per node."""
+    extension = '.html'
+
+    def __init__(self, title):
+        self.parts = [
+            '<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n'
+            f'<title>{html.escape(title)}</title>\n</head>\n<body>\n'
+        ]
+
+    def begin_node(self, node_name, title):
+        self.parts.append(f'<section id="{node_anchor(node_name)}">\n<h2>{html.escape(title)}</h2>\n<pre>')
+
+    def text(self, text, styles):
+        text = html.escape(text, quote=False)
+        if 'underline' in styles:
+            text = f"<u>{text}</u>"
+        if 'bold' in styles:
+            text = f"<b>{text}</b>"
+        self.parts.append(text)
+
+    def link(self, label, target):
+        self.parts.append(f'<a href="{html.escape(link_href(target, self.extension))}">{html.escape(label)}</a>')
+
+    def media(self, filename, path, is_image):
+        if path and is_image:
+            self.parts.append(f'<img src="{html.escape(path)}" alt="{html.escape(filename)}">')
+        elif path:
+            self.parts.append(f'<audio controls src="{html.escape(path)}"></audio>')
+        else:
+            self.parts.append(f"[{html.escape(filename)}]")
+
+    def end_node(self):
+        self.parts.append("</pre>\n</section>\n")
+
+    def result(self):
+        return "".join(self.parts) + "</body>\n</html>\n"
+
+
+WRITERS = {'html': HtmlWriter, 'md': MarkdownWriter, 'text': TextWriter}
+
+
+def convert_guide(guide_path, output_path, output_format, extract_media):
+    """Converts one guide; runs in a worker process. Returns (input bytes, node count, None)."""
+    base_name = os.path.splitext(os.path.basename(output_path))[0]
+    media_dir = os.path.join(os.path.dirname(output_path), f"{base_name}_media")
+    writer = WRITERS[output_format](os.path.basename(guide_path))
+    guide = GuideIndex(guide_path)
+    try:
+        for node_name, entry in guide.nodes.items():
+            writer.begin_node(node_name, entry.title)
+            styles = []
+            for index, token in enumerate(parse_node_text(guide.read_node(node_name))):
+                kind = token[0]
+                if kind == TEXT:
+                    writer.text(token[1], styles)
+                elif kind == STYLE:
+                    if token[2]:
+                        styles.append(token[1])
+                    elif token[1] in styles:
+                        styles.remove(token[1])
+                elif kind == LINK:
+                    writer.link(token[1], token[2])
+                elif kind == BINARY:
+                    filename = os.path.basename(token[1])
+                    is_image = filename.lower().endswith(IMAGE_EXTENSIONS)
+                    if not (is_image or filename.lower().endswith(AUDIO_EXTENSIONS)):
+                        writer.text(token[2], styles)
+                        continue
+                    path = None
+                    if extract_media:
+                        media_name = f"{re.sub(r'[^A-Za-z0-9_-]', '_', node_name)}-{index}-{filename}"
+                        try:
+                            data = uudecode(token[2])
+                        except ValueError:
+                            writer.text(token[2], styles)
+                            continue
+                        os.makedirs(media_dir, exist_ok=True)
+                        with open(os.path.join(media_dir, media_name), 'wb') as file:
+                            file.write(data)
+                        path = f"{base_name}_media/{media_name}"
+                    writer.media(filename, path, is_image)
+            writer.end_node()
+        node_count = len(guide.nodes)
+    finally:
+        guide.close()
+
+    with open(output_path, 'w', encoding='utf-8') as file:
+        file.write(writer.result())
+    return guide_stat(guide_path).st_size, node_count, None
+
+
+def check_links(guide_path):
+    """Builds the link graph of one guide; runs in a worker process. Returns (input bytes, node count, report)."""
+    guide = GuideIndex(guide_path)
+    try:
+        report = LinkGraph(guide).report()
+        node_count = len(guide.nodes)
+    finally:
+        guide.close()
+    return guide_stat(guide_path).st_size, node_count, report
+
+
+def find_guides(paths):
+    """Returns (guide path, path relative to its input root) for all given files and directories.
+
+    Compressed guides are included, and the guides inside a .zip archive as if the archive was a
+    directory of the same name without .zip.
+    """
+    guides = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, filenames in os.walk(path):
+                for filename in sorted(filenames):
+                    if filename.lower().endswith(GUIDE_EXTENSIONS):
+                        full_path = os.path.join(directory, filename)
+                        guides.extend(archive_members(full_path, os.path.relpath(full_path, path)))
+        else:
+            guides.extend(archive_members(path, os.path.basename(path)))
+    return guides
+
+
+def archive_members(path, relative_path):
+    """Returns (guide path, relative path) of a guide file, or of every guide in it if it is a .zip archive."""
+    if not relative_path.lower().endswith(ARCHIVE_EXTENSION):
+        return [(path, relative_path)]
+    directory = relative_path[:-len(ARCHIVE_EXTENSION)]
+    return [(os.path.join(path, name), os.path.join(directory, *name.split('/'))) for name in archive_guides(path)]
+
+
+def output_path_for(output, relative_path, extension):
+    """Returns the path of the converted guide, named like it without .guide and .gz or .xz."""
+    stem = relative_path
+    if stem.lower().endswith(COMPRESSED_EXTENSIONS):
+        stem = os.path.splitext(stem)[0]
+    return os.path.join(output, os.path.splitext(stem)[0] + extension)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert AmigaGuide files to HTML, Markdown, plain text or guide packs.")
+    parser.add_argument("paths", nargs="+",
+                        help="guide files or directories to search for *.guide, *.guide.gz, *.guide.xz and *.zip files")
+    parser.add_argument("-f", "--format", choices=sorted(FORMAT_EXTENSIONS), default="html",
+                        help="'pack' compiles the guides into packs that the viewer opens without parsing them")
+    parser.add_argument("-o", "--output", default=".", help="output directory (default: current directory)")
+    parser.add_argument("--extract-media", action="store_true", help="write embedded images and audio to files")
+    parser.add_argument("--check-links", action="store_true",
+                        help="only report dangling links and unreachable nodes, do not convert")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="number of worker processes")
+    args = parser.parse_args(argv)
+
+    guides = find_guides(args.paths)
+    if not guides:
+        print("No guide files found.", file=sys.stderr)
+        return 1
+
+    failed = 0
+    total_bytes = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        futures = {}
+        for guide_path, relative_path in guides:
+            if args.check_links:
+                future = executor.submit(check_links, guide_path)
+            elif args.format == 'pack':
+                output_path = output_path_for(args.output, relative_path, PACK_EXTENSION)
+                os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+                future = executor.submit(compile_pack, guide_path, output_path)
+            else:
+                output_path = output_path_for(args.output, relative_path, FORMAT_EXTENSIONS[args.format])
+                os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+                future = executor.submit(convert_guide, guide_path, output_path, args.format, args.extract_media)
+            futures[future] = guide_path
+        for done, future in enumerate(as_completed(futures), 1):
+            guide_path = futures[future]
+            try:
+                size, node_count, report = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"[{done}/{len(guides)}] {guide_path}: error: {e}", file=sys.stderr)
+                continue
+            total_bytes += size
+            print(f"[{done}/{len(guides)}] {guide_path}: {node_count} nodes, {size / (1024 * 1024):.1f} MB", file=sys.stderr)
+            if report is not None:
+                print(f"{guide_path}:\n{report}\n")
+
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    converted = len(guides) - failed
+    print(f"{'Checked' if args.check_links else 'Converted'} {converted} of {len(guides)} files in {elapsed:.2f} s: "
+          f"{converted / elapsed:.1f} files/s, {total_bytes / (1024 * 1024) / elapsed:.1f} MB/s", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,364 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from collections.abc import ItemsView, Mapping, Sequence
+
+from guidearchive import guide_stat
+from guideparser import GuideIndex, NodeEntry, parse_node_text, uudecode, BINARY, IMAGE_EXTENSIONS, AUDIO_EXTENSIONS
+
+# Guideview by Zeittresor
+# Compiled guide packs: a guide with its node index, tokens, links and decoded media in one
+# read-only file, compiled with "python guideconvert.py -f pack". A pack is opened without
+# scanning or parsing and read through a memory map, which all viewers showing it share.
+
+PACK_EXTENSION = '.guidepack'
+PACK_MAGIC = b'GUIDEPAK'
+# Bump when the layout changes, packs of other versions have to be compiled again
+PACK_VERSION = 1
+# Magic, version, node count, hash slot count, then offsets of the node records and the hash
+# slots and offset and length of the JSON meta data (links and global links). All numbers are
+# little-endian.
+HEADER = struct.Struct('<8sIII4xQQQQ')
+# Every node has a record of NODE_FIELDS unsigned 64-bit numbers. Names, titles, text and tokens
+# are (offset, length) pairs into the pack; START, END and HASH describe the node in the guide.
+(NAME_OFFSET, NAME_LENGTH, TITLE_OFFSET, TITLE_LENGTH, START, END, TEXT_OFFSET, TEXT_LENGTH,
+ TOKENS_OFFSET, TOKENS_LENGTH, FLAGS, LINK_COUNT, HASH) = range(13)
+NODE_FIELDS = 13
+
+
+def is_pack(file_path):
+    """Returns whether a file is a guide pack, by its extension."""
+    return file_path.lower().endswith(PACK_EXTENSION)
+
+
+def _slot_count(node_count):
+    """Returns the size of the hash table of the node names, a power of two at most half full."""
+    slot_count = 1
+    while slot_count < 2 * node_count:
+        slot_count *= 2
+    return slot_count
+
+
+def _name_hash(key):
+    return zlib.crc32(key.encode('utf-8'))
+
+
+def _write(file, data):
+    """Appends data to the pack being written and returns its (offset, length)."""
+    offset = file.tell()
+    file.write(data)
+    return offset, len(data)
+
+
+def compile_pack(guide_path, pack_path):
+    """Compiles a guide into a pack; runs in a worker process of guideconvert. Returns (input bytes, node count, None).
+
+    Nodes are stored tokenized as parse_node_text() returns them, embedded images and audio
+    uudecoded. Blocks that cannot be decoded stay uuencoded, the viewer shows them as text. The
+    text of the nodes, for searching, is stored without the decoded blocks.
+    """
+    guide = GuideIndex(guide_path)
+    temp_path = f"{pack_path}.{os.getpid()}.tmp"
+    try:
+        links = guide.links  # Also sets the flags
+        guide.hash_nodes()
+        table = guide.nodes
+        node_count = len(table)
+        slot_count = _slot_count(node_count)
+        records = array('Q', bytes(8 * NODE_FIELDS * node_count))
+        slots = array('I', bytes(4 * slot_count))  # Row + 1 of the node with the name, 0 if free
+        records_offset = HEADER.size
+        slots_offset = records_offset + 8 * len(records)
+        with open(temp_path, 'wb') as file:
+            file.seek(slots_offset + 4 * len(slots))
+            for row, key in enumerate(table):
+                fields = row * NODE_FIELDS
+                text = guide.read_node(key)
+                tokens = []
+                block_spans = []
+                parsed = parse_node_text(text, block_spans)
+                spans = iter(block_spans)
+                kept = []  # Parts of the text between the decoded blocks
+                pos = 0
+                for token in parsed:
+                    if token[0] != BINARY:
+                        tokens.append(token)
+                        continue
+                    start, end = next(spans)
+                    if not token[1].lower().endswith(IMAGE_EXTENSIONS + AUDIO_EXTENSIONS):
+                        tokens.append(token)
+                        continue
+                    try:
+                        data = uudecode(token[2])
+                    except ValueError:
+                        tokens.append(token)
+                        continue
+                    # (BINARY, filename, offset, length) of the decoded data
+                    tokens.append((BINARY, token[1], *_write(file, data)))
+                    kept.append(text[pos:start])
+                    pos = end
+                if kept:
+                    kept.append(text[pos:])
+                    text = "".join(kept)
+                tokens = json.dumps(tokens, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+                records[fields + NAME_OFFSET], records[fields + NAME_LENGTH] = _write(file, table.names[row].encode('utf-8'))
+                records[fields + TITLE_OFFSET], records[fields + TITLE_LENGTH] = _write(file, table.titles[row].encode('utf-8'))
+                records[fields + TEXT_OFFSET], records[fields + TEXT_LENGTH] = _write(file, text.encode('latin-1'))
+                records[fields + TOKENS_OFFSET], records[fields + TOKENS_LENGTH] = _write(file, tokens)
+                records[fields + START] = table.starts[row]
+                records[fields + END] = table.ends[row]
+                records[fields + FLAGS] = table.flags[row]
+                records[fields + LINK_COUNT] = table.link_counts[row]
+                records[fields + HASH] = guide.hashes[key]
+
+                slot = _name_hash(key) & (slot_count - 1)
+                while slots[slot]:
+                    slot = (slot + 1) & (slot_count - 1)
+                slots[slot] = row + 1
+
+            meta = {'source': os.path.basename(guide_path), 'links': links, 'global_links': guide.global_links}
+            meta_offset, meta_length = _write(file, json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+            if sys.byteorder != 'little':
+                records.byteswap()
+                slots.byteswap()
+            file.seek(0)
+            file.write(HEADER.pack(PACK_MAGIC, PACK_VERSION, node_count, slot_count,
+                                   records_offset, slots_offset, meta_offset, meta_length))
+            file.write(records.tobytes())
+            file.write(slots.tobytes())
+        os.replace(temp_path, pack_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    finally:
+        guide.close()
+    return guide_stat(guide_path).st_size, node_count, None
+
+
+class PackColumn(Sequence):
+    """One field of the node records of a pack, read like the arrays of a NodeTable."""
+
+    def __init__(self, records, field):
+        self._records = records
+        self._field = field
+        self._count = len(records) // NODE_FIELDS
+
+    def __getitem__(self, row):
+        if not 0 <= row < self._count:
+            raise IndexError(row)
+        return self._records[row * NODE_FIELDS + self._field]
+
+    def __iter__(self):
+        return iter(self._records[self._field::NODE_FIELDS])
+
+    def __len__(self):
+        return self._count
+
+
+class PackStrings(PackColumn):
+    """Names or titles of the nodes of a pack, decoded on access."""
+
+    def __init__(self, view, records, field):
+        super().__init__(records, field)
+        self._view = view
+
+    def __getitem__(self, row):
+        offset = super().__getitem__(row)
+        return str(self._view[offset:offset + self._records[row * NODE_FIELDS + self._field + 1]], 'utf-8')
+
+    def __iter__(self):
+        view = self._view
+        for offset, length in zip(super().__iter__(), self._records[self._field + 1::NODE_FIELDS]):
+            yield str(view[offset:offset + length], 'utf-8')
+
+
+class PackItems(ItemsView):
+    """(upper-cased name, NodeEntry) of all nodes of a pack, read row by row instead of looking up every name."""
+
+    def __iter__(self):
+        table = self._mapping
+        for name, title, start, end, flags, link_count in zip(table.names, table.titles, table.starts, table.ends,
+                                                              table.flags, table.link_counts):
+            yield name.upper(), NodeEntry(name, title, start, end, flags, link_count)
+
+
+class PackNodeTable(Mapping):
+    """The node table of a pack, read in place from the memory map.
+
+    Reads like the NodeTable of a GuideIndex. Opening it costs the same for any number of nodes,
+    names are looked up in the hash table stored in the pack.
+    """
+
+    def __init__(self, view, records, slots):
+        self._slots = slots
+        self.names = PackStrings(view, records, NAME_OFFSET)
+        self.titles = PackStrings(view, records, TITLE_OFFSET)
+        self.starts = PackColumn(records, START)
+        self.ends = PackColumn(records, END)
+        self.flags = PackColumn(records, FLAGS)
+        self.link_counts = PackColumn(records, LINK_COUNT)
+
+    def row(self, key):
+        """Returns the row of an upper-cased node name; raises KeyError for unknown nodes."""
+        if not isinstance(key, str):
+            raise KeyError(key)
+        mask = len(self._slots) - 1
+        slot = _name_hash(key) & mask
+        while True:
+            row = self._slots[slot] - 1
+            if row < 0:
+                raise KeyError(key)
+            if self.names[row].upper() == key:
+                return row
+            slot = (slot + 1) & mask
+
+    def __getitem__(self, key):
+        row = self.row(key)
+        return NodeEntry(self.names[row], self.titles[row], self.starts[row], self.ends[row],
+                         self.flags[row], self.link_counts[row])
+
+    def __contains__(self, key):
+        try:
+            self.row(key)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return (name.upper() for name in self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def items(self):
+        return PackItems(self)
+
+    def detach(self):
+        """Copies the table out of the memory map, so that it can still be read once the pack is closed."""
+        if isinstance(self.names, PackStrings):
+            self._slots = array('I', self._slots)
+            self.names = list(self.names)
+            self.titles = list(self.titles)
+            for field in ('starts', 'ends', 'flags', 'link_counts'):
+                setattr(self, field, array('Q', getattr(self, field)))
+
+
+class GuidePack:
+    """A compiled guide pack, in place of the GuideIndex of its guide.
+
+    Only the header is read on opening. Tokens come pre-parsed, embedded media as memoryview
+    slices of the decoded data in the pack.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.hashes = None  # Upper-cased node name -> CRC-32 of the body in the guide, filled by hash_nodes()
+        self.nodes = None
+        self._meta = None
+        self._records = self._slots = None
+        with open(file_path, "rb") as file:
+            self._data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._data)
+        try:
+            if len(self._data) < HEADER.size:
+                raise ValueError(f"Not a guide pack: {file_path}")
+            (magic, version, node_count, slot_count,
+             records_offset, slots_offset, self._meta_offset, self._meta_length) = HEADER.unpack_from(self._data)
+            if magic != PACK_MAGIC:
+                raise ValueError(f"Not a guide pack: {file_path}")
+            if version != PACK_VERSION:
+                raise ValueError(f"Guide pack version {version} is not supported, compile it again: {file_path}")
+            if max(records_offset + 8 * NODE_FIELDS * node_count, slots_offset + 4 * slot_count,
+                   self._meta_offset + self._meta_length) > len(self._data):
+                raise ValueError(f"Guide pack is truncated: {file_path}")
+            self._records = self._view[records_offset:records_offset + 8 * NODE_FIELDS * node_count].cast('Q')
+            self._slots = self._view[slots_offset:slots_offset + 4 * slot_count].cast('I')
+            if sys.byteorder != 'little':
+                # Copied, as the pack is always little-endian
+                self._records = array('Q', self._records)
+                self._records.byteswap()
+                self._slots = array('I', self._slots)
+                self._slots.byteswap()
+        except Exception:
+            self.close()
+            raise
+        self.nodes = PackNodeTable(self._view, self._records, self._slots)
+
+    def _load_meta(self):
+        if self._meta is None:
+            self._meta = json.loads(str(self._view[self._meta_offset:self._meta_offset + self._meta_length], 'utf-8'))
+        return self._meta
+
+    @property
+    def links(self):
+        """Links of every node: upper-cased node name -> list of [kind, target] pairs, as in GuideIndex.links."""
+        return self._load_meta()['links']
+
+    @property
+    def global_links(self):
+        """Navigation commands given for the whole database, before the first node."""
+        return self._load_meta()['global_links']
+
+    def hash_nodes(self):
+        """Takes the CRC-32 of every node body in the guide from the pack."""
+        table = self.nodes
+        self.hashes = {key: self._records[row * NODE_FIELDS + HASH] for row, key in enumerate(table)}
+
+    # Nodes are compared the same way, as START, END and HASH are those of the guide
+    changed_nodes = GuideIndex.changed_nodes
+
+    def reuse_links(self, previous, changed):
+        """Nothing to do, the links of all nodes are stored in the pack."""
+
+    def release_buffer(self):
+        """Nothing to release, packs are never decompressed."""
+
+    def read_node(self, node_name):
+        """Returns the stripped text of a node, without the embedded images and audio."""
+        records = self._records
+        fields = self.nodes.row(node_name.upper()) * NODE_FIELDS
+        offset = records[fields + TEXT_OFFSET]
+        return str(self._view[offset:offset + records[fields + TEXT_LENGTH]], 'latin-1')
+
+    def read_tokens(self, node_name):
+        """Returns the tokens of a node as parse_node_text() gives them for the guide.
+
+        Embedded images and audio are (BINARY, filename, memoryview of the decoded data).
+        """
+        records = self._records
+        fields = self.nodes.row(node_name.upper()) * NODE_FIELDS
+        offset = records[fields + TOKENS_OFFSET]
+        tokens = json.loads(str(self._view[offset:offset + records[fields + TOKENS_LENGTH]], 'utf-8'))
+        view = self._view
+        for index, token in enumerate(tokens):
+            if len(token) == 4:
+                offset = token[2]
+                tokens[index] = (BINARY, token[1], view[offset:offset + token[3]])
+            else:
+                tokens[index] = tuple(token)
+        return tokens
+
+    def close(self):
+        """Releases the memory map. Media of parsed nodes keep it mapped until they are no longer in use.
+
+        Like that of a GuideIndex, the node table can still be read after closing, it is copied
+        out of the map first.
+        """
+        if self.nodes is not None:
+            self.nodes.detach()
+        for view in (self._records, self._slots, self._view):
+            if isinstance(view, memoryview):
+                view.release()
+        data, self._data = self._data, None
+        if data is not None:
+            try:
+                data.close()
+            except BufferError:
+                pass  # Unmapped when the last media view is dropped, as the pack no longer refers to the map
@@ -0,0 +1,784 @@
+import binascii
+import itertools
+import mmap
+import re
+import struct
+import zlib
+from array import array
+from collections.abc import Mapping
+
+from guidearchive import is_archived, open_stream
+
+# Optional, only used to speed up uudecoding of large embedded files. Imported by load_numpy()
+# on first use, as importing it takes longer than starting the viewer.
+numpy = None
+_numpy_missing = False
+
+# Guideview by Zeittresor
+# Parser side of the viewer: indexes AmigaGuide files without reading them into memory.
+
+# Node header and terminator, matched directly against the bytes of the file. The header is
+# "@node name title" with both optionally quoted; the title defaults to the name. All parts are
+# kept on one line so that a broken header cannot make the scan run through the rest of the file.
+# Only headers at the start of a line count, see _find_node_header().
+NODE_RE = re.compile(rb'@node[ \t]+(?:"([^"\r\n]*)"|([^\s"]+))(?:[ \t]+"([^"\r\n]*)")?', re.IGNORECASE)
+ENDNODE_RE = re.compile(rb'@endnode', re.IGNORECASE)
+
+# Formatting tags, links and the first line of uuencoded blocks inside a node body. Quoted parts
+# stop at the closing quote or the end of the line, so unterminated ones fail right away.
+TOKEN_RE = re.compile(r'@{\w+}|@{/\w*}|@{"|begin[ \t]+\d+[ \t]+(\S+)')
+LINK_RE = re.compile(r'@{"([^"\r\n]*)"\s+link\s+"([^"\r\n]*)"(?:\s+\d+)?}')
+# Links, the navigation commands @next, @prev, @toc, @index and @help and the first line of
+# uuencoded blocks in one pattern, for scanning node bodies in the file without decoding them.
+# Line starts are matched with the newline instead of "^", so that every branch starts with a
+# literal character and the regex engine can skip ahead to the next "@" or newline.
+LINK_GRAPH_RE = re.compile(
+    LINK_RE.pattern.encode('latin-1')
+    + rb'|\n(?i:@(next|prev|toc|index|help)[ \t]+(?:"([^"\r\n]*)"|(\S+)))'
+    + rb'|\nbegin[ \t]+\d+[ \t]+(\S+)'
+)
+
+# Token kinds produced by tokenize()
+TEXT = 'text'  # (TEXT, text)
+STYLE = 'style'  # (STYLE, tag_name, on)
+LINK = 'link'  # (LINK, label, target)
+BINARY = 'binary'  # (BINARY, filename, raw_block)
+
+# File types of embedded uuencoded blocks that are shown as images or played as audio
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tif', '.tiff', '.webp', '.ppm', '.eps')
+AUDIO_EXTENSIONS = ('.mp3', '.ogg', '.wav', '.midi', '.mid')
+
+# Mapping of ASCII emojis to Unicode emojis
+EMOJI_MAPPING = {
+    ':)': '😊',
+    ':-)': '😊',
+    ':(': '☹️',
+    ':-(': '☹️',
+    ':D': '😃',
+    ':-D': '😃',
+    ';)': '😉',
+    ';-)': '😉',
+    ':o': '😮',
+    ':-o': '😮',
+    ':p': '😛',
+    ':-p': '😛',
+    '<3': '❤️',
+    'o/': '👋',
+    ':-|': '😐',
+    ':|': '😐',
+}
+# All ASCII emojis and bullet points in one alternation. Longer emojis come first so that
+# ":-)" wins over ":" followed by something else. Bullets are matched with the preceding
+# newline instead of "^", which keeps the scan fast; BULLET_RE covers the first line of a run.
+# The indentation is limited, as otherwise every newline in a long run of whitespace would
+# scan the rest of the run.
+EMOJI_RE = re.compile(
+    '|'.join(re.escape(emoji) for emoji in sorted(EMOJI_MAPPING, key=len, reverse=True))
+    + r'|\n\s{0,80}([o-])\s+'
+)
+BULLET_RE = re.compile(r'\s*([o-])\s+')
+BULLETS = {'o': '📌 ', '-': '• '}
+
+# Flags of a node in the NodeTable, set while scanning the links
+HAS_IMAGES = 1
+HAS_AUDIO = 2
+
+# Index of a scanned guide as the disk cache stores it: the header, the starts, ends, link counts
+# and flags of the NodeTable as arrays and the names and the titles one per line, as headers
+# never span lines. Then the links of all nodes in file order followed by the global ones, their
+# kinds one byte each and their targets one per line; the link counts tell which belong to which
+# node. The links are only decoded once they are needed. Numbers are in the byte order and sizes
+# of the machine, the disk cache never leaves it.
+INDEX_HEADER = struct.Struct('=8sQQQQQ')
+INDEX_MAGIC = b'GUIDEIDX'
+INDEX_COLUMNS = ('starts', 'ends', 'link_counts', 'flags')
+LINK_KINDS = ('link', 'next', 'prev', 'toc', 'index', 'help')
+
+# Formatting commands and the text widget tag they switch on or off
+STYLE_TAGS = {
+    'b': ('bold', True),
+    'ub': ('bold', False),
+    'u': ('underline', True),
+    'uu': ('underline', False),
+}
+
+
+class NodeEntry:
+    """Name, title and byte range of a single node inside the guide file."""
+    __slots__ = ('name', 'title', 'start', 'end', 'flags', 'link_count')
+
+    def __init__(self, name, title, start, end, flags=0, link_count=0):
+        self.name = name
+        self.title = title
+        self.start = start  # First byte after the @node header
+        self.end = end  # Position of the matching @endnode
+        self.flags = flags  # HAS_IMAGES and HAS_AUDIO
+        self.link_count = link_count  # Links and navigation commands in the node
+
+    @property
+    def has_images(self):
+        return bool(self.flags & HAS_IMAGES)
+
+    @property
+    def has_audio(self):
+        return bool(self.flags & HAS_AUDIO)
+
+
+class NodeTable(Mapping):
+    """The nodes of a guide in parallel arrays instead of one object per node.
+
+    Reads like a dict from upper-cased node name to NodeEntry, in file order; the entries are
+    created on access. Node bodies are never copied, start and end are offsets into the file.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.titles = []
+        self.starts = array('q')
+        self.ends = array('q')
+        self.flags = array('B')
+        self.link_counts = array('L')
+        self._rows = {}  # Upper-cased name -> row
+
+    def append(self, name, title, start, end, flags=0, link_count=0):
+        """Adds a node; a second node of the same name replaces the first one, like in a dict."""
+        key = name.upper()
+        if key == name:
+            key = name  # Share the string
+        row = self._rows.get(key)
+        if row is None:
+            self._rows[key] = len(self.names)
+            self.names.append(name)
+            self.titles.append(title)
+            self.starts.append(start)
+            self.ends.append(end)
+            self.flags.append(flags)
+            self.link_counts.append(link_count)
+        else:
+            self.names[row] = name
+            self.titles[row] = title
+            self.starts[row] = start
+            self.ends[row] = end
+            self.flags[row] = flags
+            self.link_counts[row] = link_count
+
+    @classmethod
+    def from_columns(cls, names, titles, starts, ends, flags, link_counts):
+        """Returns a table of nodes with distinct names given as lists and arrays like those of a table."""
+        table = cls()
+        table.names, table.titles = names, titles
+        table.starts, table.ends, table.flags, table.link_counts = starts, ends, flags, link_counts
+        rows = table._rows
+        for row, name in enumerate(names):
+            key = name.upper()
+            rows[name if key == name else key] = row
+        return table
+
+    def row(self, key):
+        """Returns the row of an upper-cased node name; raises KeyError for unknown nodes."""
+        return self._rows[key]
+
+    def __getitem__(self, key):
+        row = self._rows[key]
+        return NodeEntry(self.names[row], self.titles[row], self.starts[row], self.ends[row],
+                         self.flags[row], self.link_counts[row])
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def __len__(self):
+        return len(self._rows)
+
+
+def read_index(data):
+    """Returns the NodeTable and the still encoded links of index data written by GuideIndex.to_bytes().
+
+    Raises ValueError if the data is not such an index or is truncated.
+    """
+    if len(data) < INDEX_HEADER.size:
+        raise ValueError("Not a guide index")
+    magic, count, names_length, titles_length, link_count, targets_length = INDEX_HEADER.unpack_from(data)
+    if magic != INDEX_MAGIC:
+        raise ValueError("Not a guide index")
+    table = NodeTable()
+    columns = [getattr(table, field) for field in INDEX_COLUMNS]
+    pos = INDEX_HEADER.size
+    if (pos + sum(column.itemsize for column in columns) * count + names_length + titles_length
+            + link_count + targets_length != len(data)):
+        raise ValueError("Guide index is truncated")
+    with memoryview(data) as view:
+        for column in columns:
+            column.frombytes(view[pos:pos + column.itemsize * count])
+            pos += column.itemsize * count
+        names = str(view[pos:pos + names_length], 'utf-8').split('\n') if count else []
+        pos += names_length
+        titles = str(view[pos:pos + titles_length], 'utf-8').split('\n') if count else []
+        pos += titles_length
+        links = (bytes(view[pos:pos + link_count]), bytes(view[pos + link_count:]))
+    if len(names) != count or len(titles) != count or sum(table.link_counts) > link_count:
+        raise ValueError("Guide index is damaged")
+    return NodeTable.from_columns(names, titles, table.starts, table.ends, table.flags, table.link_counts), links
+
+
+def _find_node_header(data, pos):
+    """Returns the next @node header from pos on, skipping mentions of @node that do not start a line.
+
+    The pattern itself is not anchored, so that the search can skip ahead to the next "@node".
+    """
+    match = NODE_RE.search(data, pos)
+    while match:
+        start = match.start()
+        while start > 0 and data[start - 1] in b' \t':
+            start -= 1
+        if start == 0 or data[start - 1] in b'\r\n':
+            return match
+        match = NODE_RE.search(data, match.start() + 1)
+    return None
+
+
+class GuideIndex:
+    """Scans an AmigaGuide file once and loads node bodies on demand."""
+
+    def __init__(self, file_path, cached=None, scan=True):
+        self.file_path = file_path
+        self.nodes = NodeTable()  # Upper-cased node name -> NodeEntry, in file order
+        self._links = None
+        self._global_links = None
+        self._links_data = None  # Kinds and targets of the links from the disk cache, decoded on first use
+        self.hashes = None  # Upper-cased node name -> CRC-32 of the body, filled by hash_nodes()
+        self._stream = None
+        if is_archived(file_path):
+            # Decompressed as a whole only for scanning, nodes are read through the stream
+            self._file = None
+            self._stream = open_stream(file_path)
+            self._data = None
+        else:
+            self._file = open(file_path, "rb")
+            try:
+                self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be mapped
+                self._data = b""
+        if cached:
+            # Index of this very file read by read_index(), no need to scan it again
+            self.use_index(cached)
+        elif scan:
+            self._scan()
+
+    def use_index(self, index):
+        """Takes over the nodes and links of an index read by read_index() instead of scanning the file."""
+        self.nodes, self._links_data = index
+
+    def _scan(self):
+        """Records the position of every @node ... @endnode block."""
+        rows, _, _ = self.scan_nodes()
+        self.add_nodes(rows)
+
+    def _buffer(self):
+        """Returns the whole file as one buffer for scanning, decompressing a compressed one until release_buffer()."""
+        data = self._data
+        if data is None:
+            data = self._data = self._stream.read_all()
+        return data
+
+    def release_buffer(self):
+        """Drops the decompressed copy of a compressed guide once it is scanned; nodes are then read through its seek points."""
+        if self._stream is not None:
+            self._data = None
+
+    def scan_size(self):
+        """Returns the length of the data scan_nodes() goes through, the uncompressed size for compressed guides."""
+        return len(self._buffer())
+
+    def scan_nodes(self, pos=0, limit=None):
+        """Finds the @node ... @endnode blocks from an offset on, up to the first one ending beyond pos + limit.
+
+        Returns the (name, title, start, end) rows found, the offset to continue at and whether the
+        end of the file was reached. Only reads the file, so it can run in a worker thread while the
+        nodes added so far are in use. A node without @endnode ends where the next one starts.
+        """
+        data = self._buffer()
+        stop = len(data) if limit is None else pos + limit
+        rows = []
+        header = _find_node_header(data, pos)
+        # Searched again only once the scan has passed it, so that a missing @endnode does
+        # not make every following node search the rest of the file
+        endnode = ENDNODE_RE.search(data, pos)
+        while header and pos < stop:
+            next_header = _find_node_header(data, header.end())
+            if endnode and endnode.start() < header.end():
+                endnode = ENDNODE_RE.search(data, header.end())
+            if endnode and (not next_header or endnode.start() < next_header.start()):
+                end, pos = endnode.start(), endnode.end()
+            else:
+                end = pos = next_header.start() if next_header else len(data)
+            name = (header.group(1) if header.group(1) is not None else header.group(2)).decode('latin-1')
+            title = header.group(3).decode('latin-1') if header.group(3) is not None else name
+            rows.append((name, title, header.end(), end))
+            header = next_header
+        if not header:
+            return rows, len(data), True
+        return rows, pos, pos >= len(data)
+
+    def add_nodes(self, rows):
+        """Adds nodes found by scan_nodes() to the index."""
+        for name, title, start, end in rows:
+            self.nodes.append(name, title, start, end)
+
+    @property
+    def links(self):
+        """Links of every node: upper-cased node name -> list of (kind, target), scanned on first use.
+
+        kind is 'link' for @{"..." link ...} or the navigation command: 'next', 'prev', 'toc', 'index', 'help'.
+        The same scan sets the flags and link counts of the node table.
+        """
+        if self._links is None:
+            self._load_links()
+        return self._links
+
+    @property
+    def global_links(self):
+        """Navigation commands given for the whole database, before the first node."""
+        if self._global_links is None:
+            self._load_links()
+        return self._global_links
+
+    def _load_links(self):
+        if self._links_data is None:
+            self._scan_links()
+            return
+        kinds, targets = self._links_data
+        self._links_data = None
+        links = zip(map(LINK_KINDS.__getitem__, kinds), str(targets, 'utf-8').split('\n') if kinds else ())
+        table = self.nodes
+        self._links = {key: list(itertools.islice(links, count)) for key, count in zip(table, table.link_counts)}
+        self._global_links = list(links)
+
+    def _scan_links(self, previous=None, changed=()):
+        """Collects links, navigation commands and node flags of all nodes in one pass over the node bodies.
+
+        Given an earlier index of the same file, the nodes not in changed are taken from there.
+        """
+        links_by_node = {}
+        table = self.nodes
+        first_start = len(self._buffer())
+        for row, key in enumerate(table):
+            start = table.starts[row]
+            if previous is None or key in changed:
+                links, table.flags[row] = self._find_links(start, table.ends[row])
+            else:
+                links = previous.links[key]
+                table.flags[row] = previous.nodes.flags[previous.nodes.row(key)]
+            table.link_counts[row] = len(links)
+            links_by_node[key] = links
+            first_start = min(first_start, start)
+        self._links = links_by_node
+        self._global_links = self._find_links(0, first_start)[0]
+
+    def hash_nodes(self):
+        """Computes the CRC-32 of every node body, to tell which nodes an edit of the file has changed."""
+        table = self.nodes
+        buffered = self._data is not None
+        with memoryview(self._buffer()) as view:
+            self.hashes = {key: zlib.crc32(view[table.starts[row]:table.ends[row]]) for row, key in enumerate(table)}
+        if not buffered:
+            self.release_buffer()
+
+    def changed_nodes(self, previous):
+        """Returns the names of the nodes changed, added or removed since an earlier index of the same file.
+
+        Nodes are compared by title, length and hash of their bodies, not by offset, so a node that
+        only moved because an earlier one was edited counts as unchanged. Without the hashes of the
+        earlier index every node counts as changed.
+        """
+        if self.hashes is None:
+            self.hash_nodes()
+        old, new = previous.nodes, self.nodes
+        if previous.hashes is None:
+            return set(old) | set(new)
+        changed = {key for key in old if key not in new}
+        for row, key in enumerate(new):
+            if key not in old:
+                changed.add(key)
+                continue
+            old_row = old.row(key)
+            if (new.ends[row] - new.starts[row] != old.ends[old_row] - old.starts[old_row]
+                    or new.titles[row] != old.titles[old_row]
+                    or self.hashes[key] != previous.hashes[key]):
+                changed.add(key)
+        return changed
+
+    def reuse_links(self, previous, changed):
+        """Takes links and flags of the unchanged nodes from an earlier index of the same file, scanning only the others."""
+        if previous._links is not None or previous._links_data is not None:
+            self._scan_links(previous, changed)
+
+    def _find_links(self, start, end):
+        """Returns (kind, target) for every link and navigation command between two offsets, and the node flags.
+
+        uuencoded blocks are skipped as a whole once their first line has been seen.
+        """
+        data = self._buffer()
+        links = []
+        flags = 0
+        pos = start
+        # Next "\nend" and "\nbegin" from pos on, -1 once there is none left before end
+        block_end = next_begin = start
+        while True:
+            match = LINK_GRAPH_RE.search(data, pos, end)
+            if not match:
+                break
+            pos = match.end()
+            if match.group(6):
+                filename = match.group(6).decode('latin-1').lower()
+                if filename.endswith(IMAGE_EXTENSIONS):
+                    flags |= HAS_IMAGES
+                elif filename.endswith(AUDIO_EXTENSIONS):
+                    flags |= HAS_AUDIO
+                if 0 <= block_end < pos:
+                    block_end = data.find(b"\nend", pos, end)
+                if 0 <= next_begin < pos:
+                    next_begin = data.find(b"\nbegin", pos, end)
+                # A block that another one starts in before its end line is unterminated
+                if block_end >= 0 and (next_begin < 0 or block_end < next_begin):
+                    pos = block_end
+            elif match.group(3):
+                target = match.group(4) if match.group(4) is not None else match.group(5)
+                links.append((match.group(3).decode('latin-1').lower(), target.decode('latin-1')))
+            else:
+                links.append(('link', match.group(2).decode('latin-1')))
+        return links, flags
+
+    def to_bytes(self):
+        """Returns the index as the disk cache stores it, for read_index() to pass it back as cached."""
+        links_by_node = self.links  # Also sets the flags and link counts
+        table = self.nodes
+        links = [link for key in table for link in links_by_node[key]] + self.global_links
+        kinds = bytes(LINK_KINDS.index(kind) for kind, _ in links)
+        targets = '\n'.join(target for _, target in links).encode('utf-8')
+        names = '\n'.join(table.names).encode('utf-8')
+        titles = '\n'.join(table.titles).encode('utf-8')
+        return b''.join([INDEX_HEADER.pack(INDEX_MAGIC, len(table), len(names), len(titles), len(kinds), len(targets))]
+                        + [getattr(table, field).tobytes() for field in INDEX_COLUMNS] + [names, titles, kinds, targets])
+
+    def read_node(self, node_name):
+        """Returns the stripped text of a node, reading it from the file."""
+        table = self.nodes
+        row = table.row(node_name.upper())
+        data = self._data
+        if data is None:
+            return self._stream.read(table.starts[row], table.ends[row]).decode('latin-1').strip()
+        return data[table.starts[row]:table.ends[row]].decode('latin-1').strip()
+
+    def read_tokens(self, node_name):
+        """Returns the tokens of a node as the viewer shows them, reading and parsing it."""
+        return parse_node_text(self.read_node(node_name))
+
+    def close(self):
+        """Releases the memory map and the file handle."""
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._data = b""
+        if self._file:
+            self._file.close()
+            self._file = None
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+
+class LinkGraph:
+    """Link graph of a guide with the navigation derived from it, built in linear time.
+
+    Targets of the form "file/NODE" point into another guide and are kept apart as external links.
+    """
+
+    def __init__(self, guide):
+        self.nodes = list(guide.nodes)  # Upper-cased node names in file order
+        self.positions = {node_name: position for position, node_name in enumerate(self.nodes)}
+        self.edges = {}  # Node name -> list of (kind, upper-cased target) within this guide
+        self.external = []  # (source node, kind, file, node) for links into other guides
+        self.global_links = {}  # Database-wide command -> upper-cased target
+        for kind, target in guide.global_links:
+            if '/' not in target:
+                self.global_links.setdefault(kind, target.upper())
+        for node_name, links in guide.links.items():
+            edges = []
+            for kind, target in links:
+                if '/' in target:
+                    file_part, node_part = target.rsplit('/', 1)
+                    self.external.append((node_name, kind, file_part, node_part.upper()))
+                else:
+                    edges.append((kind, target.upper()))
+            self.edges[node_name] = edges
+
+    def dangling(self):
+        """Returns (source node, kind, target) for every link to a node that does not exist."""
+        known = self.positions
+        return [
+            (node_name, kind, target)
+            for node_name, edges in self.edges.items()
+            for kind, target in edges
+            if target not in known
+        ]
+
+    def reachable(self, start=None):
+        """Returns the set of nodes reachable from MAIN (or the first node) and the global commands."""
+        known = self.positions
+        if start is None:
+            start = 'MAIN' if 'MAIN' in known else (self.nodes[0] if self.nodes else None)
+        roots = [start] + list(self.global_links.values())
+        seen = set()
+        stack = [node_name for node_name in roots if node_name in known]
+        while stack:
+            node_name = stack.pop()
+            if node_name in seen:
+                continue
+            seen.add(node_name)
+            stack.extend(target for _, target in self.edges.get(node_name, ()) if target in known)
+        return seen
+
+    def unreachable(self, start=None):
+        """Returns the nodes, in file order, that no chain of links leads to."""
+        seen = self.reachable(start)
+        return [node_name for node_name in self.nodes if node_name not in seen]
+
+    def navigation(self, node_name):
+        """Returns the 'toc', 'prev', 'next' and 'index' targets of a node.
+
+        Explicit @-commands of the node win, then the global ones; without them "prev" and "next"
+        follow the file order and "toc" falls back to MAIN, like the Browse buttons of AmigaGuide.
+        """
+        node_name = node_name.upper()
+        result = dict(self.global_links)
+        position = self.positions.get(node_name)
+        if position is not None:
+            if position > 0:
+                result.setdefault('prev', self.nodes[position - 1])
+            if position + 1 < len(self.nodes):
+                result.setdefault('next', self.nodes[position + 1])
+        if 'MAIN' in self.positions:
+            result.setdefault('toc', 'MAIN')
+        for kind, target in self.edges.get(node_name, ()):
+            if kind != 'link':
+                result[kind] = target
+        return result
+
+    def report(self):
+        """Returns a text report of dangling, external and unreachable links."""
+        lines = []
+        dangling = self.dangling()
+        lines.append(f"Dangling links: {len(dangling)}")
+        lines.extend(f"  {source} -> {target} ({kind})" for source, kind, target in dangling)
+        lines.append(f"Links into other guides: {len(self.external)}")
+        lines.extend(f"  {source} -> {file_part}/{target} ({kind})" for source, kind, file_part, target in self.external)
+        unreachable = self.unreachable()
+        lines.append(f"Unreachable nodes: {len(unreachable)}")
+        lines.extend(f"  {node_name}" for node_name in unreachable)
+        return "\n".join(lines)
+
+
+def _after_bullet(text, bullet, end):
+    """Returns where to continue after a bullet point match and the kinds of bullet points that may follow there.
+
+    The whitespace after a bullet may run into the next lines. This gives the same result as the
+    old replacement, which replaced all "o" bullets before the "-" ones: the whitespace after a "-"
+    stops at a line with an "o" bullet, and right after an "o" only another "o" is a bullet.
+    """
+    pos = bullet.end()
+    at_line_start = text[pos - 1] == '\n'
+    if bullet.group(1) == 'o':
+        return pos, 'o' if at_line_start else ''
+    newline = text.find('\n', bullet.start(1), pos)
+    if newline >= 0 and not at_line_start:
+        next_bullet = BULLET_RE.match(text, newline + 1, end)
+        if next_bullet and next_bullet.group(1) == 'o':
+            return newline + 1, 'o'
+    return pos, 'o-' if at_line_start else ''
+
+
+def replace_ascii_emojis(text, start=0, end=None):
+    """Replaces ASCII emojis with Unicode emojis and bullet points with emojis in text[start:end].
+
+    Bullet points ("o " and "- ") are only replaced at the beginning of a line of text.
+    """
+    if end is None:
+        end = len(text)
+    parts = []
+    pos = start
+    # Kinds of bullet points that may follow at pos, which is at the beginning of a line
+    line_bullets = 'o-' if start == 0 or text[start - 1] == '\n' else ''
+    while True:
+        if line_bullets:
+            bullet = BULLET_RE.match(text, pos, end)
+            if bullet and bullet.group(1) in line_bullets:
+                parts.append(BULLETS[bullet.group(1)])
+                pos, line_bullets = _after_bullet(text, bullet, end)
+                continue
+        match = EMOJI_RE.search(text, pos, end)
+        if not match:
+            break
+        parts.append(text[pos:match.start()])
+        if match.group(1):
+            parts.append('\n' + BULLETS[match.group(1)])
+            pos, line_bullets = _after_bullet(text, match, end)
+        else:
+            parts.append(EMOJI_MAPPING[match.group(0)])
+            pos = match.end()
+            line_bullets = ''
+    if not parts:
+        return text[start:end]
+    parts.append(text[pos:end])
+    return "".join(parts)
+
+
+def parse_node_text(content, block_spans=None):
+    """Turns the text of a node into the token list shown by the viewer."""
+    return tokenize(content, replace_emojis=True, block_spans=block_spans)
+
+
+def tokenize(content, replace_emojis=False, block_spans=None):
+    """Splits a node body into a list of text, style, link and binary tokens in a single pass.
+
+    With replace_emojis, ASCII emojis and bullet points are replaced in the text runs only,
+    never inside link targets or uuencoded blocks. Given a list as block_spans, the (start, end)
+    offsets in content of every binary token are appended to it.
+    """
+    text_run = replace_ascii_emojis if replace_emojis else lambda text, start, end: text[start:end]
+    tokens = []
+    pos = 0
+    length = len(content)
+    # Next "\nend" and "\nbegin" after the current uuencoded block, -1 once there is none left
+    uu_end = next_begin = 0
+    while pos < length:
+        tag_match = TOKEN_RE.search(content, pos)
+        if not tag_match:
+            tokens.append((TEXT, text_run(content, pos, length)))
+            break
+
+        start = tag_match.start()
+        end = tag_match.end()
+        tag_text = tag_match.group(0)
+        if start > pos:
+            tokens.append((TEXT, text_run(content, pos, start)))
+
+        if tag_text.startswith('@{') and tag_text.endswith('}'):
+            # Formatting start or end tag, unknown ones are dropped
+            style = STYLE_TAGS.get(tag_text[2:-1])
+            if style:
+                tokens.append((STYLE, style[0], style[1]))
+            pos = end
+        elif tag_text == '@{"':
+            link_match = LINK_RE.match(content, start)
+            if link_match:
+                tokens.append((LINK, link_match.group(1), link_match.group(2)))
+                pos = link_match.end()
+            else:
+                # Could not parse the link, keep it as normal text
+                tokens.append((TEXT, tag_text))
+                pos = end
+        else:
+            if 0 <= uu_end < end:
+                uu_end = content.find('\nend', end)
+            if 0 <= next_begin < end:
+                next_begin = content.find('\nbegin', end)
+            if uu_end >= 0 and (next_begin < 0 or uu_end < next_begin):
+                pos = uu_end + len('\nend')
+                tokens.append((BINARY, tag_match.group(1), content[start:pos]))
+                if block_spans is not None:
+                    block_spans.append((start, pos))
+            else:
+                # No end line before the next block starts, keep it as text
+                tokens.append((TEXT, tag_text))
+                pos = end
+    return tokens
+
+def load_numpy():
+    """Returns the numpy module, importing it on first use, or None if it is not installed."""
+    global numpy, _numpy_missing
+    if numpy is None and not _numpy_missing:
+        try:
+            import numpy
+        except ImportError:
+            _numpy_missing = True
+    return numpy
+
+
+def _uudecode_line(line):
+    """Decodes one uuencoded line, tolerating the padding errors of broken encoders."""
+    try:
+        return binascii.a2b_uu(line)
+    except binascii.Error:
+        # Same workaround as the old uu module: cut the line to its declared length
+        nbytes = (((line[0] - 32) & 63) * 4 + 5) // 3
+        return binascii.a2b_uu(line[:nbytes])
+
+
+def _uudecode_uniform(data, start, newline):
+    """Decodes the run of identical full-length lines starting at start with NumPy.
+
+    Returns the decoded bytes and the offset of the first line that is not part of the run.
+    """
+    line_end = data.find(newline, start)
+    if line_end <= start:
+        return b"", start
+    lead = data[start]
+    width = line_end - start
+    count = (lead - 32) & 63
+    if count == 0 or count % 3 or width != 1 + count // 3 * 4:
+        return b"", start
+    stride = width + len(newline)
+
+    # Consecutive lines with the same length character and the newline in the same column
+    leads = data[start:len(data) - width:stride]
+    lines = len(leads) - len(leads.lstrip(bytes([lead])))
+    ends = data[line_end:line_end + lines * stride:stride]
+    lines = min(lines, len(ends) - len(ends.lstrip(newline[:1])))
+    if lines == 0:
+        return b"", start
+
+    rows = numpy.frombuffer(data, dtype=numpy.uint8, count=lines * stride, offset=start).reshape(lines, stride)
+    chars = rows[:, 1:width]
+    if ((chars < 32) | (chars > 96)).any():
+        # Not plain uuencoded lines after all, e.g. a short line shifted the columns
+        return b"", start
+    values = ((chars - 32) & 63).reshape(-1, 4)
+    out = numpy.empty((len(values), 3), dtype=numpy.uint8)
+    out[:, 0] = (values[:, 0] << 2) | (values[:, 1] >> 4)
+    out[:, 1] = ((values[:, 1] & 15) << 4) | (values[:, 2] >> 2)
+    out[:, 2] = ((values[:, 2] & 3) << 6) | values[:, 3]
+    return out.tobytes(), start + lines * stride
+
+
+def uudecode(block):
+    """Decodes a uuencoded block ("begin <mode> <name>" ... "end") into bytes.
+
+    Accepts str (latin-1), bytes or any buffer such as a memoryview slice of the guide file.
+    """
+    if isinstance(block, str):
+        block = block.encode('latin-1')
+    data = bytes(block)
+    begin = data.find(b"begin")
+    if begin < 0:
+        raise ValueError("No valid begin line found in uuencoded data")
+    start = data.find(b"\n", begin) + 1
+    if start == 0:
+        return b""
+
+    decoded = b""
+    if load_numpy() is not None:
+        # The regular full-length lines make up nearly all of the data and are decoded in one go
+        newline = b"\r\n" if data[start - 2:start] == b"\r\n" else b"\n"
+        decoded, start = _uudecode_uniform(data, start, newline)
+
+    # "e" is not a uuencoding character, so no data line can start with "end"
+    end = data.find(b"\nend", start - 1)
+    lines = data[start:end if end >= 0 else len(data)].splitlines()
+    try:
+        # a2b_uu turns an empty line into 32 zero bytes, so those are skipped
+        return decoded + b"".join([binascii.a2b_uu(line) for line in lines if line])
+    except binascii.Error:
+        return decoded + b"".join([_uudecode_line(line) for line in lines if line])
@@ -0,0 +1,93 @@
+import json
+import threading
+import time
+
+# Guideview by Zeittresor
+# Timing instrumentation of the viewer, enabled with "python Guideview.py --profile".
+
+# Phases timed by the viewer, in the order they are listed
+PHASES = ('load', 'tokenize', 'render', 'uudecode', 'image', 'photoimage')
+
+
+class Profiler:
+    """Collects the time spent per phase and per node, from the Tk thread and the worker threads.
+
+    The viewer only keeps a Profiler when profiling is switched on; otherwise its timing points
+    cost one perf_counter() call and a check for None.
+    """
+
+    def __init__(self, log_path=None):
+        self.log_path = log_path  # JSON log written by write_log()
+        self.started = time.time()
+        self.phases = {}  # Phase -> [count, total seconds, max seconds, bytes]
+        self.nodes = {}  # "guide/NODE" -> {phase: total seconds}
+        self.counters = {}  # Name -> value, set by the viewer, e.g. cache hit rates
+        self._lock = threading.Lock()
+
+    def record(self, phase, seconds, node=None, size=0):
+        """Adds one timed step of a phase, optionally for a node and with the number of bytes processed."""
+        with self._lock:
+            stats = self.phases.get(phase)
+            if stats is None:
+                stats = self.phases[phase] = [0, 0.0, 0.0, 0]
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+            stats[3] += size
+            if node is not None:
+                node_stats = self.nodes.setdefault(node, {})
+                node_stats[phase] = node_stats.get(phase, 0.0) + seconds
+
+    def summary(self):
+        """Returns the collected timings as JSON-serialisable data."""
+        with self._lock:
+            phases = {
+                phase: {
+                    'count': count,
+                    'total_ms': total * 1000,
+                    'mean_ms': total * 1000 / count,
+                    'max_ms': longest * 1000,
+                    'bytes': size,
+                }
+                for phase, (count, total, longest, size) in self.phases.items()
+            }
+            nodes = {node: {phase: seconds * 1000 for phase, seconds in stats.items()} for node, stats in self.nodes.items()}
+            return {
+                'started': self.started,
+                'seconds': time.time() - self.started,
+                'phases': phases,
+                'nodes_ms': nodes,
+                'counters': dict(self.counters),
+            }
+
+    def report(self, slowest=10):
+        """Returns the summary as text for the statistics window."""
+        data = self.summary()
+        lines = [f"{'phase':<12} {'count':>7} {'total ms':>10} {'mean ms':>9} {'max ms':>9} {'MB':>8}"]
+        ordered = [phase for phase in PHASES if phase in data['phases']]
+        ordered += sorted(phase for phase in data['phases'] if phase not in PHASES)
+        for phase in ordered:
+            stats = data['phases'][phase]
+            lines.append(f"{phase:<12} {stats['count']:>7} {stats['total_ms']:>10.1f} {stats['mean_ms']:>9.2f} "
+                         f"{stats['max_ms']:>9.2f} {stats['bytes'] / (1024 * 1024):>8.2f}")
+        if data['counters']:
+            lines.append("")
+            lines.extend(f"{name}: {value}" for name, value in sorted(data['counters'].items()))
+        if data['nodes_ms']:
+            lines.append("")
+            lines.append(f"Slowest nodes ({slowest}):")
+            totals = sorted(data['nodes_ms'].items(), key=lambda item: -sum(item[1].values()))
+            for node, stats in totals[:slowest]:
+                phases = ", ".join(f"{phase} {ms:.1f}" for phase, ms in sorted(stats.items()))
+                lines.append(f"  {sum(stats.values()):>8.1f} ms  {node}  ({phases})")
+        return "\n".join(lines)
+
+    def write_log(self):
+        """Writes the summary as JSON to log_path, if one was given."""
+        if not self.log_path:
+            return
+        try:
+            with open(self.log_path, 'w', encoding='utf-8') as file:
+                json.dump(self.summary(), file, indent=2)
+        except OSError as e:
+            print(f"Error writing profile log: {e}")
@@ -0,0 +1,99 @@
+import heapq
+import math
+import re
+
+from guideparser import tokenize, TEXT, LINK
+
+# Guideview by Zeittresor
+# Full-text search over the nodes of a guide.
+
+WORD_RE = re.compile(r"\w+")
+# Words of a node title count this many times as much as words in its text
+TITLE_WEIGHT = 3
+
+
+def node_plain_text(content):
+    """Returns the readable text of a node body: text runs and link labels, without tags or uu data."""
+    return " ".join(token[1] for token in tokenize(content) if token[0] in (TEXT, LINK))
+
+
+def count_words(title, content):
+    """Returns the weighted word counts of a node and its number of indexed words, for SearchIndex.add_counts().
+
+    Leaves the index alone, so that the viewer can tokenize nodes in its worker pool.
+    """
+    counts = {}
+    words = WORD_RE.findall(node_plain_text(content).lower())
+    for word in words:
+        counts[word] = counts.get(word, 0) + 1
+    title_words = WORD_RE.findall(title.lower())
+    for word in title_words:
+        counts[word] = counts.get(word, 0) + TITLE_WEIGHT
+    return counts, len(words) + len(title_words) * TITLE_WEIGHT
+
+
+class SearchIndex:
+    """Inverted index from words to the nodes containing them, filled one node at a time."""
+
+    def __init__(self):
+        self.postings = {}  # Word -> {node name: weighted count}
+        self.node_lengths = {}  # Node name -> number of indexed words
+        self.node_words = {}  # Node name -> its distinct words, so removing it only touches their postings
+
+    def __len__(self):
+        return len(self.node_lengths)
+
+    def add_node(self, node_name, title, content):
+        """Indexes the title and the plain text of a node."""
+        self.add_counts(node_name, *count_words(title, content))
+
+    def add_counts(self, node_name, counts, length):
+        """Indexes a node by the word counts count_words() has returned for it."""
+        postings = self.postings
+        for word, count in counts.items():
+            nodes = postings.get(word)
+            if nodes is None:
+                nodes = postings[word] = {}
+            nodes[node_name] = count
+        self.node_lengths[node_name] = length
+        self.node_words[node_name] = tuple(counts)
+
+    def remove_node(self, node_name):
+        """Drops a node from the index, e.g. before indexing its changed text again."""
+        if self.node_lengths.pop(node_name, None) is None:
+            return
+        for word in self.node_words.pop(node_name):
+            nodes = self.postings[word]
+            del nodes[node_name]
+            if not nodes:
+                del self.postings[word]
+
+    def search(self, query, limit=50):
+        """Returns up to limit (node name, score) pairs containing all words of the query, best first."""
+        words = set(WORD_RE.findall(query.lower()))
+        if not words:
+            return []
+        postings = []
+        for word in words:
+            nodes = self.postings.get(word)
+            if not nodes:
+                return []
+            postings.append(nodes)
+
+        # Start from the rarest word so the intersection stays small
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for nodes in postings[1:]:
+            candidates.intersection_update(nodes)
+            if not candidates:
+                return []
+
+        # TF-IDF with term frequency normalized by node length
+        total = len(self.node_lengths)
+        weights = [(nodes, math.log(1 + total / len(nodes))) for nodes in postings]
+        scores = []
+        for node_name in candidates:
+            length = max(self.node_lengths[node_name], 1)
+            score = sum(nodes[node_name] / length * idf for nodes, idf in weights)
+            scores.append((score, node_name))
+        return [(node_name, score) for score, node_name in heapq.nlargest(limit, scores)]